@@ -0,0 +1,93 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import requests
+from atlassian import confluence
+
+from rate_limit import RateLimitedAdapter, RateLimiter, confluence_limiter
+
+DEFAULT_MAX_IN_FLIGHT = 64
+
+
+def pooled_session(max_connections: int, limiter: Optional[RateLimiter] = None) -> requests.Session:
+    """
+    A session keeping up to `max_connections` connections alive per host, whose requests
+    are paced and retried by `limiter`.
+
+    requests keeps 10 by default, and a connection returned to a full pool is closed, so
+    more than 10 concurrent callers pay a new TLS handshake for most requests. With
+    pool_block, callers beyond the limit wait for a free connection instead.
+    """
+    session = requests.Session()
+    adapter = RateLimitedAdapter(limiter or confluence_limiter(), pool_connections=1, pool_maxsize=max_connections,
+                                 pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def pooled_client(url: str, username: str, password: str, max_connections: int,
+                  limiter: Optional[RateLimiter] = None) -> confluence.Confluence:
+    return confluence.Confluence(url=url,
+                                 username=username,
+                                 password=password,
+                                 cloud=True,
+                                 session=pooled_session(max_connections, limiter))
+
+
+class AsyncConfluence:
+    """
+    An asyncio interface over the Confluence calls the scripts use.
+
+    Calls run the blocking atlassian client on a thread pool, all sharing one pooled
+    session, so connections are kept alive across calls. At most `max_in_flight` requests
+    run at a time; callers beyond that wait in the event loop without holding a thread.
+
+        async with AsyncConfluence(url, email, token, max_in_flight=200) as client:
+            await asyncio.gather(*(client.remove_page(page_id) for page_id in page_ids))
+    """
+
+    def __init__(self, url: str, username: str, password: str, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 limiter: Optional[RateLimiter] = None):
+        self.client = pooled_client(url, username, password, max_in_flight, limiter)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._max_in_flight = max_in_flight
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def _call(self, fn, *args, **kwargs):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def create_page(self, space: str, title: str, body: str, parent_id: Optional[str] = None,
+                          representation: str = "storage", editor: Optional[str] = "v2") -> dict:
+        return await self._call(self.client.create_page, space=space, title=title, body=body, parent_id=parent_id,
+                                representation=representation, editor=editor)
+
+    async def page_exists(self, space: str, title: str) -> bool:
+        return await self._call(self.client.page_exists, space, title)
+
+    async def get_page_by_title(self, space: str, title: str) -> Optional[dict]:
+        return await self._call(self.client.get_page_by_title, space, title)
+
+    async def get_all_pages_from_space(self, space: str, start: int = 0, limit: int = 50, status: Optional[str] = None,
+                                       expand: Optional[str] = None) -> List[dict]:
+        return await self._call(self.client.get_all_pages_from_space, space, start=start, limit=limit, status=status,
+                                expand=expand)
+
+    async def remove_page(self, page_id: str, status: Optional[str] = None, recursive: bool = False):
+        return await self._call(self.client.remove_page, page_id, status=status, recursive=recursive)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.client.close()
+
+    async def __aenter__(self) -> "AsyncConfluence":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,205 @@
+import hashlib
+import html
+import mimetypes
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+from atlassian import confluence
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    content_hash TEXT PRIMARY KEY,
+    media_type TEXT NOT NULL,
+    content BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL REFERENCES images (content_hash)
+);
+"""
+
+# An image as the writers render it, linking to where Paper hosts it. The url is
+# HTML-escaped.
+IMAGE_URL = re.compile(r'<ac:image><ri:url ri:value="([^"]*)"/></ac:image>')
+FETCH_TIMEOUT_SECONDS = 60
+# Confluence needs this header on attachment uploads, and the upload is multipart, not JSON.
+ATTACHMENT_HEADERS = {"X-Atlassian-Token": "no-check", "Accept": "application/json"}
+# Attachments listed a page at a time.
+ATTACHMENT_PAGE_SIZE = 200
+
+
+@dataclass(frozen=True)
+class Image:
+    content_hash: str
+    media_type: str
+
+    @property
+    def file_name(self) -> str:
+        """Named after its content, so an image is attached once to a page however often it shows."""
+        extension = mimetypes.guess_extension(self.media_type) or ""
+        return f"{self.content_hash[:32]}{extension}"
+
+
+@dataclass
+class ImageStats:
+    urls: int = 0
+    fetched: int = 0
+    # urls fetched by an earlier run.
+    reused: int = 0
+    failed: int = 0
+    # fetched images whose content was already stored under another url.
+    duplicates: int = 0
+
+    def summary(self) -> str:
+        return (f"Images: {self.urls} urls, {self.fetched} fetched ({self.duplicates} duplicates), "
+                f"{self.reused} fetched before, {self.failed} failed.")
+
+
+class ImageStore:
+    """
+    An on-disk store of the images of the docs: every image content once, keyed by its
+    hash, and the url every image was fetched from. Reused across runs, so an image is
+    only fetched by the first run that sees its url.
+
+    Safe to use from several threads.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self.stats = ImageStats()
+
+    def get(self, url: str) -> Optional[Image]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT images.content_hash, media_type FROM urls JOIN images USING (content_hash) WHERE url = ?",
+                (url,),
+            ).fetchone()
+        return Image(*row) if row else None
+
+    def put(self, url: str, content: bytes, media_type: str) -> Image:
+        image = Image(hashlib.sha256(content).hexdigest(), media_type)
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO images (content_hash, media_type, content) VALUES (?, ?, ?)",
+                (image.content_hash, media_type, content),
+            ).rowcount
+            if not inserted:
+                self.stats.duplicates += 1
+                # the first copy decides the name of the attachment.
+                image = Image(image.content_hash, self._conn.execute(
+                    "SELECT media_type FROM images WHERE content_hash = ?", (image.content_hash,)).fetchone()[0])
+            self._conn.execute("INSERT OR REPLACE INTO urls (url, content_hash) VALUES (?, ?)",
+                               (url, image.content_hash))
+            self._conn.commit()
+        return image
+
+    def read(self, image: Image) -> bytes:
+        with self._lock:
+            return self._conn.execute("SELECT content FROM images WHERE content_hash = ?",
+                                      (image.content_hash,)).fetchone()[0]
+
+    def fetch(self, urls: Iterable[str], workers: int = 8, session: Optional[requests.Session] = None):
+        """
+        Downloads the images at `urls` that aren't stored yet, `workers` at a time, each
+        url once. A url that cannot be fetched is reported and left out.
+        """
+        todo = []
+        for url in dict.fromkeys(urls):
+            self.stats.urls += 1
+            if self.get(url) is not None:
+                self.stats.reused += 1
+            else:
+                todo.append(url)
+        if not todo:
+            return
+
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_maxsize=workers))
+            session.mount("http://", HTTPAdapter(pool_maxsize=workers))
+
+        def fetch_one(url: str):
+            try:
+                with METRICS.phase("fetch_image", url):
+                    response = session.get(url, timeout=FETCH_TIMEOUT_SECONDS)
+                    response.raise_for_status()
+            except requests.RequestException as e:
+                print(f"Cannot fetch image {url}: {e}")
+                with self._lock:
+                    self.stats.failed += 1
+                return
+            media_type = response.headers.get("Content-Type", "application/octet-stream").split(";")[0].strip()
+            self.put(url, response.content, media_type)
+            with self._lock:
+                self.stats.fetched += 1
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(fetch_one, todo))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def image_urls(body: str) -> List[str]:
+    return [html.unescape(url) for url in IMAGE_URL.findall(body)]
+
+
+def attach_images(body: str, store: ImageStore) -> Tuple[str, Dict[str, Image]]:
+    """
+    Points the images of `body` at page attachments instead of their urls, and returns
+    the new body with the images to attach, by file name. Images that weren't fetched
+    keep their url.
+    """
+    images = {}
+
+    def replace(match: re.Match) -> str:
+        image = store.get(html.unescape(match.group(1)))
+        if image is None:
+            return match.group(0)
+        images[image.file_name] = image
+        return f'<ac:image><ri:attachment ri:filename="{image.file_name}"/></ac:image>'
+
+    return IMAGE_URL.sub(replace, body), images
+
+
+def attachment_names(client: confluence.Confluence, page_id: str) -> List[str]:
+    names = []
+    start = 0
+    while True:
+        response = client.get(f"rest/api/content/{page_id}/child/attachment",
+                               params={"start": start, "limit": ATTACHMENT_PAGE_SIZE})
+        # Confluence may return fewer than asked for, so only an empty page is the end.
+        if not response['results']:
+            return names
+        names.extend(attachment['title'] for attachment in response['results'])
+        start += len(response['results'])
+
+
+def upload_images(client: confluence.Confluence, page_id: str, images: Dict[str, Image], store: ImageStore,
+                  new_page: bool = True) -> int:
+    """
+    Attaches `images` to a page in a single upload, and returns how many were uploaded.
+    A page that isn't `new_page` may have some already, as their names come from their
+    content: those are listed first and not uploaded again.
+    """
+    names = set() if new_page else set(attachment_names(client, page_id))
+    files = [("file", (name, store.read(image), image.media_type))
+             for name, image in images.items() if name not in names]
+    if files:
+        client.post(f"rest/api/content/{page_id}/child/attachment", data={"minorEdit": "true"},
+                    headers=ATTACHMENT_HEADERS, files=files)
+    return len(files)
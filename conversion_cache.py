@@ -0,0 +1,114 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import pandoc
+
+import fast_parser
+import pandoc_batch
+import writer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bodies (
+    key TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# The modules whose code decides what a doc converts to. Editing any of them changes the
+# converter version, so bodies cached by an older converter are never served.
+CONVERTER_MODULES = [writer, fast_parser, pandoc_batch]
+
+
+def converter_version() -> str:
+    digest = hashlib.sha256()
+    for module in CONVERTER_MODULES:
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    config = pandoc.configure(read=True) or pandoc.configure(auto=True, read=True)
+    digest.update(config['version'].encode('utf-8'))
+    return digest.hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0.0
+        return f"Conversion cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), {self.evictions} evicted."
+
+
+class ConversionCache:
+    """
+    An on-disk cache of converted bodies, keyed by a hash of the doc's content and the
+    converter version. The least recently used bodies are evicted once the cached bodies
+    add up to more than `max_bytes`.
+
+    Safe to use from several threads.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, version: Optional[str] = None):
+        self._max_bytes = max_bytes
+        self._version = version if version is not None else converter_version()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bodies_last_used ON bodies (last_used)")
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+        self.stats = CacheStats()
+
+    def key(self, content: bytes) -> str:
+        digest = hashlib.sha256(self._version.encode('utf-8'))
+        digest.update(content)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT body FROM bodies WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            self._conn.execute("UPDATE bodies SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return row[0]
+
+    def put(self, key: str, body: str):
+        size = len(body.encode('utf-8'))
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM bodies WHERE key = ?", (key,)).fetchone()
+            self._total += size - (row[0] if row else 0)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO bodies (key, body, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, body, size, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self._total <= self._max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM bodies ORDER BY last_used").fetchall():
+            if self._total <= self._max_bytes:
+                break
+            self._conn.execute("DELETE FROM bodies WHERE key = ?", (key,))
+            self._total -= size
+            self.stats.evictions += 1
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
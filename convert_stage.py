@@ -0,0 +1,112 @@
+import math
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from conversion_cache import ConversionCache
+from corpus_store import CorpusStore
+from metrics import METRICS
+from pandoc_batch import BatchConverter, Result
+
+MAX_CHUNK_SIZE = 50
+
+
+def _portable(result: Result) -> Result:
+    # Results cross a process boundary. Keep the original exception whenever it
+    # survives pickling, otherwise fall back to its repr so the cause isn't lost.
+    if not isinstance(result, Exception):
+        return result
+    try:
+        pickle.loads(pickle.dumps(result))
+        return result
+    except Exception:
+        return RuntimeError(repr(result))
+
+
+def _convert(converter: BatchConverter, paths: List[str], store_path: Optional[str]) -> Iterator[Tuple[str, Result]]:
+    if store_path is None:
+        yield from converter.convert_paths(paths)
+        return
+    # every process reads the docs through its own connection to the store.
+    with CorpusStore(store_path) as store:
+        yield from converter.convert_contents(store.contents(paths))
+
+
+def _convert_chunk(paths: List[str], collect_metrics: bool = False,
+                   store_path: Optional[str] = None) -> Tuple[List[Tuple[str, Result]], Optional[dict]]:
+    # Worker processes time their chunk on their own metrics, which the parent merges.
+    if collect_metrics:
+        METRICS.enable()
+    converter = BatchConverter(workers=1, batch_size=len(paths))
+    results = [(path, _portable(result)) for path, result in _convert(converter, paths, store_path)]
+    return results, METRICS.snapshot() if collect_metrics else None
+
+
+def _read(path: str, store: Optional[CorpusStore]) -> bytes:
+    if store is not None:
+        return store.read(path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def convert_pages(paths: List[str], jobs: int = 1, cache: Optional[ConversionCache] = None,
+                  store_path: Optional[str] = None) -> Iterator[Tuple[str, Result]]:
+    """
+    Converts the docs at `paths` to storage format on a pool of `jobs` processes.
+
+    Yields (path, body) in the same order as `paths`. A doc that cannot be converted
+    yields the exception raised while converting it instead of a body.
+
+    With a `cache`, docs whose content was converted before are served from it and only
+    the rest are converted. Failures are not cached.
+
+    With a `store_path`, the docs are read from that CorpusStore instead of files.
+    """
+    if cache is None:
+        yield from _convert_pages(paths, jobs, store_path)
+        return
+
+    keys: Dict[str, str] = {}
+    cached: Dict[str, str] = {}
+    store = CorpusStore(store_path) if store_path else None
+    for path in paths:
+        try:
+            keys[path] = cache.key(_read(path, store))
+        except OSError:
+            # converting it reports the error.
+            continue
+        body = cache.get(keys[path])
+        if body is not None:
+            cached[path] = body
+    if store is not None:
+        store.close()
+
+    converted = _convert_pages([path for path in paths if path not in cached], jobs, store_path)
+    for path in paths:
+        if path in cached:
+            yield path, cached[path]
+            continue
+        converted_path, result = next(converted)
+        assert converted_path == path
+        if path in keys and not isinstance(result, Exception):
+            cache.put(keys[path], result)
+        yield path, result
+
+
+def _convert_pages(paths: List[str], jobs: int, store_path: Optional[str] = None) -> Iterator[Tuple[str, Result]]:
+    if not paths:
+        return
+    if jobs <= 1:
+        yield from _convert(BatchConverter(workers=1), paths, store_path)
+        return
+
+    # Small enough chunks to keep every process busy until the end, big enough to
+    # amortize pandoc startup over a batch.
+    size = max(1, min(MAX_CHUNK_SIZE, math.ceil(len(paths) / (jobs * 4))))
+    chunks = [paths[i:i + size] for i in range(0, len(paths), size)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for results, snapshot in executor.map(_convert_chunk, chunks, repeat(METRICS.enabled), repeat(store_path)):
+            if snapshot:
+                METRICS.merge(snapshot)
+            yield from results
@@ -0,0 +1,167 @@
+"""
+Generates synthetic Paper markdown for benchmarks.
+
+Docs are built from the constructs real Paper exports use: headings and **bold** level 3
+headings, paragraphs with inline code, links and emoji, deep task lists, bullet and
+ordered lists, wide tables whose cells hold <br> separated lines and lists, long code
+blocks and ---------- rules. Docs are written in a folder tree, with some folders
+carrying a doc of their own name like Paper folders exported by
+run_cloud_doc_download_folder.py.
+"""
+import os
+import random
+from dataclasses import dataclass
+from typing import List
+
+WORDS = ("migration", "confluence", "paper", "doc", "sync", "metadata", "service", "latency", "owner",
+         "rollout", "the", "a", "of", "to", "and", "with", "for", "on", "team", "review", "plan", "edge",
+         "store", "index", "cache", "query", "shard", "launch", "design", "oncall")
+EMOJI = ("😼", "🚀", "✅", "0️⃣")
+
+
+@dataclass
+class Profile:
+    docs: int
+    # blocks per doc
+    blocks: int
+    # deepest nesting of task and bullet lists
+    list_depth: int
+    table_rows: int
+    table_columns: int
+    code_lines: int
+    # docs per folder
+    fan_out: int
+
+
+PROFILES = {
+    # many small docs, like most team spaces.
+    'small': Profile(docs=200, blocks=12, list_depth=2, table_rows=4, table_columns=3, code_lines=8, fan_out=10),
+    # a few huge docs: long runbooks and tracking tables.
+    'huge': Profile(docs=3, blocks=150, list_depth=5, table_rows=150, table_columns=8, code_lines=200, fan_out=2),
+    'mixed': Profile(docs=60, blocks=60, list_depth=3, table_rows=40, table_columns=5, code_lines=40, fan_out=6),
+}
+
+
+class DocGenerator:
+
+    def __init__(self, profile: Profile, seed: int = 0):
+        self._profile = profile
+        self._random = random.Random(seed)
+
+    def words(self, low: int = 3, high: int = 12) -> str:
+        return " ".join(self._random.choice(WORDS) for _ in range(self._random.randint(low, high)))
+
+    def inline_text(self) -> str:
+        parts = [self.words()]
+        match self._random.randint(0, 5):
+            case 0:
+                parts.append(f"`{self._random.choice(WORDS)}_{self._random.choice(WORDS)}()`")
+            case 1:
+                parts.append(f"[{self.words(1, 3)}](https://www.dropbox.com/{self._random.choice(WORDS)})")
+            case 2:
+                parts.append(f"**{self.words(1, 3)}**")
+            case 3:
+                parts.append(self._random.choice(EMOJI))
+        parts.append(self.words(0, 6))
+        return " ".join(part for part in parts if part) + "."
+
+    def task_list(self) -> List[str]:
+        lines = []
+        level = 0
+        for _ in range(self._random.randint(3, 4 * self._profile.list_depth)):
+            level = self._random.randint(0, min(level + 1, self._profile.list_depth - 1)) if lines else 0
+            mark = self._random.choice(["[ ]", "[x]"])
+            lines.append("    " * level + f"{mark} {self.words(2, 8)}")
+        return lines
+
+    def bullet_list(self) -> List[str]:
+        lines = []
+        level = 0
+        ordered = self._random.random() < 0.3
+        for i in range(self._random.randint(2, 3 * self._profile.list_depth)):
+            level = self._random.randint(0, min(level + 1, self._profile.list_depth - 1)) if lines else 0
+            marker = f"{i + 1}." if ordered and level == 0 else "-"
+            lines.append("    " * level + f"{marker} {self.inline_text()}")
+        return lines
+
+    def cell(self) -> str:
+        match self._random.randint(0, 4):
+            case 0:
+                return "<br>".join(self.words(1, 4) for _ in range(self._random.randint(2, 4)))
+            case 1:
+                # Paper exports lists inside cells as <br> separated dashes.
+                return "<br>".join(("- " if i % 3 == 0 else " - ") + self.words(1, 3)
+                                   for i in range(self._random.randint(2, 5)))
+            case 2:
+                return f"**{self.words(1, 2)}**"
+            case _:
+                return self.words(1, 5)
+
+    def table(self) -> List[str]:
+        columns = self._profile.table_columns
+        lines = ["| " + " | ".join(f"Column {i + 1}" for i in range(columns)) + " |",
+                 "| " + " | ".join("--------" for _ in range(columns)) + " |"]
+        for _ in range(self._random.randint(1, self._profile.table_rows)):
+            lines.append("| " + " | ".join(self.cell() for _ in range(columns)) + " |")
+        return lines
+
+    def code_block(self) -> List[str]:
+        lines = ["```"]
+        for _ in range(self._random.randint(1, self._profile.code_lines)):
+            indent = "    " * self._random.randint(0, 3)
+            lines.append(f"{indent}{self._random.choice(WORDS)} = {self._random.choice(WORDS)}({self._random.randint(0, 99)}) <> & x")
+        lines.append("```")
+        return lines
+
+    def block(self) -> List[str]:
+        match self._random.randint(0, 9):
+            case 0:
+                return ["# " + self.words(1, 5)]
+            case 1:
+                return ["## " + self.words(1, 5)]
+            case 2:
+                return ["**" + self.words(1, 5) + "**"]
+            case 3:
+                return self.task_list()
+            case 4:
+                return self.bullet_list()
+            case 5:
+                return self.table()
+            case 6:
+                return self.code_block()
+            case 7:
+                return ["----------"]
+            case _:
+                return [self.inline_text() for _ in range(self._random.randint(1, 3))]
+
+    def doc(self) -> str:
+        blocks = ["# " + self.words(2, 6)]
+        for _ in range(self._random.randint(self._profile.blocks // 2, self._profile.blocks)):
+            blocks.append("\n".join(self.block()))
+        return "\n\n".join(blocks) + "\n"
+
+
+def generate_corpus(out_dir: str, profile: Profile, seed: int = 0) -> List[str]:
+    """
+    Writes `profile.docs` docs under `out_dir`, and returns their paths. The same seed
+    always generates the same corpus.
+    """
+    generator = DocGenerator(profile, seed)
+    paths = []
+    for i in range(profile.docs):
+        # a folder per `fan_out` docs, and a folder per `fan_out` folders above them.
+        # Folder names are unique, as page titles in a space must be.
+        folders = []
+        level = 1
+        while i // profile.fan_out ** level:
+            folders.append(f"Folder {level}.{i // profile.fan_out ** level}")
+            level += 1
+        dir_path = os.path.join(out_dir, *reversed(folders))
+        os.makedirs(dir_path, exist_ok=True)
+        # the first doc of a folder is the folder's own doc.
+        name = os.path.basename(dir_path) if folders and i % profile.fan_out == 0 else f"Doc {i}"
+        path = os.path.join(dir_path, name + ".paper")
+        with open(path, "w") as f:
+            f.write(generator.doc())
+        paths.append(path)
+    return paths
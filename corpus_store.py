@@ -0,0 +1,134 @@
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import quote
+
+from metrics import METRICS
+from page_tree import PageTree, from_paths
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    path TEXT PRIMARY KEY,
+    path_lower TEXT NOT NULL UNIQUE,
+    rev TEXT NOT NULL,
+    content_hash TEXT,
+    content BLOB NOT NULL
+)
+"""
+
+# Docs are read through a memory map of the file this big, rather than copied into
+# SQLite's page cache first.
+MMAP_BYTES = 1024 * 1024 * 1024
+
+
+@dataclass
+class StoredDoc:
+    path: str
+    rev: str
+    content_hash: Optional[str]
+
+
+class CorpusStore:
+    """
+    Downloaded Paper docs packed in a single file (a SQLite database): the markdown of
+    every doc, with the Dropbox rev and content hash it was downloaded at, keyed by its
+    Dropbox path.
+
+    Copying, scanning or shipping one file is much faster than tens of thousands of
+    small ones, on network filesystems and in CI artifacts especially. Safe to use from
+    several threads.
+
+    A `read_only` store opens an existing file without ever writing to it.
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True, check_same_thread=False)
+            self._conn.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+            return
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def __enter__(self) -> "CorpusStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put(self, path: str, rev: str, content_hash: Optional[str], content: bytes):
+        with self._lock:
+            # a doc renamed only in case replaces the old one too, as paths are unique
+            # regardless of case.
+            self._conn.execute(
+                "INSERT OR REPLACE INTO docs (path, path_lower, rev, content_hash, content) VALUES (?, ?, ?, ?, ?)",
+                (path, path.lower(), rev, content_hash, content),
+            )
+            self._conn.commit()
+
+    def get(self, path: str) -> Optional[StoredDoc]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, rev, content_hash FROM docs WHERE path_lower = ?", (path.lower(),)
+            ).fetchone()
+        return StoredDoc(*row) if row else None
+
+    def read(self, path: str) -> bytes:
+        """The markdown of the doc at `path`. Raises FileNotFoundError if there is none."""
+        with self._lock:
+            row = self._conn.execute("SELECT content FROM docs WHERE path_lower = ?", (path.lower(),)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"{path} is not in the corpus store")
+        return row[0]
+
+    def contents(self, paths: Iterable[str]) -> Iterator[Tuple[str, Union[str, Exception]]]:
+        """
+        Yields (path, markdown) for each of `paths`, one doc at a time. A doc that cannot
+        be read yields the exception instead of its markdown.
+        """
+        for path in paths:
+            try:
+                with METRICS.phase("read_file", path):
+                    content = self.read(path).decode('utf-8')
+            except (OSError, UnicodeDecodeError) as e:
+                content = e
+            yield path, content
+
+    def forget(self, path: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM docs WHERE path_lower = ?", (path.lower(),))
+            self._conn.commit()
+
+    def paths(self, folder: str = "/") -> List[str]:
+        """The paths of the docs under `folder`, matched case-insensitively like Dropbox."""
+        prefix = folder.rstrip("/").lower() + "/"
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM docs WHERE substr(path_lower, 1, ?) = ? ORDER BY path_lower",
+                (len(prefix), prefix),
+            ).fetchall()
+        return [path for path, in rows]
+
+    def tree(self, folder: str) -> PageTree:
+        """
+        The PageTree of the docs under `folder`, as scan() reads the folder once downloaded.
+        The root is spelt as in Dropbox, so that its index doc is told apart.
+        """
+        folder = folder.rstrip("/") or "/"
+        paths = self.paths(folder)
+        if paths and folder != "/":
+            folder = paths[0][:len(folder)]
+        return from_paths(folder, paths)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,98 @@
+import html
+import os
+import re
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+# A link as the writers render it.
+LINK = re.compile(r'<a href="([^"]*)">(.*?)</a>', re.DOTALL)
+# Paper doc urls are https://paper.dropbox.com/doc/<title slug>--<token>-<doc id>, or
+# without the token in older links.
+PAPER_DOC_PATH = re.compile(r'/doc/([^/]+)')
+DOC_ID_SUFFIX = re.compile(r'-[0-9A-Za-z]{21}$')
+# A cheap test for bodies without any link to a doc, which most bodies are.
+DOC_LINK_HINT = re.compile(r'<a href="https?://(paper\.dropbox\.com/doc/|(www\.)?dropbox\.com/[^"]*\.paper)')
+
+
+def slug(title: str) -> str:
+    """The title as Paper spells it in doc urls, lower-cased."""
+    return re.sub(r'[^0-9a-z]+', '-', title.lower()).strip('-')
+
+
+def link_target(url: str) -> Optional[Tuple[str, str]]:
+    """
+    What a link to a Paper doc says about the doc: ('title', title) for a link to a
+    .paper file in Dropbox, or ('slug', title slug) for a paper.dropbox.com link. None for
+    links to anything else.
+    """
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if host == "paper.dropbox.com":
+        match = PAPER_DOC_PATH.match(parts.path)
+        if match is None:
+            return None
+        name = unquote(match.group(1)).split("--")[0]
+        return 'slug', slug(DOC_ID_SUFFIX.sub("", name))
+    if host in ("dropbox.com", "www.dropbox.com") and parts.path.endswith(".paper"):
+        return 'title', unquote(os.path.basename(parts.path)).removesuffix(".paper")
+    return None
+
+
+class LinkIndex:
+    """
+    Maps the docs of an export to the titles of their pages, so links between docs can
+    point at the pages without a lookup per link. Confluence links pages by title, so
+    the index keeps the title each page ended up with, which can differ from the doc's.
+
+    Docs whose titles make the same slug are left out, as links can't tell them apart.
+    """
+
+    def __init__(self):
+        self._titles: Dict[str, str] = {}
+        # slug -> page title, or None if several docs have the slug.
+        self._slugs: Dict[str, Optional[str]] = {}
+
+    def add(self, doc_title: str, page_title: str):
+        self._titles[doc_title] = page_title
+        key = slug(doc_title)
+        self._slugs[key] = None if key in self._slugs else page_title
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    def resolve(self, url: str) -> Optional[str]:
+        """The title of the page a link to a doc should point at, if the doc is in the index."""
+        target = link_target(url)
+        if target is None:
+            return None
+        kind, value = target
+        if kind == 'title' and value in self._titles:
+            return self._titles[value]
+        return self._slugs.get(slug(value))
+
+    @staticmethod
+    def has_links(body: str) -> bool:
+        return DOC_LINK_HINT.search(body) is not None
+
+    def rewrite(self, body: str) -> Tuple[str, int]:
+        """
+        Turns the links of `body` to docs in the index into links to their pages, and
+        returns the new body with the number of links rewritten. Other links are kept.
+        """
+        count = 0
+
+        def replace(match: re.Match) -> str:
+            nonlocal count
+            title = self.resolve(html.unescape(match.group(1)))
+            if title is None:
+                return match.group(0)
+            count += 1
+            page = f'<ri:page ri:content-title="{html.escape(title)}"/>'
+            link_body = match.group(2)
+            if not link_body:
+                return f'<ac:link>{page}</ac:link>'
+            return f'<ac:link>{page}<ac:link-body>{link_body}</ac:link-body></ac:link>'
+
+        if not self.has_links(body):
+            return body, 0
+        return LINK.sub(replace, body), count
@@ -0,0 +1,369 @@
+"""
+An in-process parser for the subset of markdown that Paper exports, producing the same
+pandoc.types AST that pandoc does, so that most docs can skip the pandoc subprocess.
+
+It only accepts what it knows pandoc parses the same way: headings, bold headings,
+paragraphs, tight bullet / ordered / task lists indented by 4 spaces, fenced code blocks,
+horizontal rules and pipe tables with <br> in cells. Inline, it knows words, bold and
+code spans. Anything else, or anything ambiguous, makes parse_paper() return None, and
+the caller falls back to pandoc for that doc.
+"""
+
+import re
+from typing import List, Optional
+
+from pandoc.types import *
+
+# pandoc wraps pipe tables whose lines are longer than this, giving columns relative widths.
+PANDOC_COLUMNS = 72
+
+ATTR = ('', [], [])
+
+HEADING_REGEX = re.compile(r"^(#{1,6}) +(.*?) *$")
+RULE_REGEX = re.compile(r"^-{3,} *$")
+FENCE_REGEX = re.compile(r"^```([A-Za-z0-9_-]*)$")
+BULLET_ITEM_REGEX = re.compile(r"^( *)- (.*)$")
+ORDERED_ITEM_REGEX = re.compile(r"^( *)([0-9]+)\. (.*)$")
+TABLE_SEPARATOR_REGEX = re.compile(r"^\|( *:?-+:? *\|)+ *$")
+# Lines that pandoc may read as the start of a block (lists with any marker, quotes,
+# definitions, line blocks, setext underlines, ...), so they can't be paragraph text.
+BLOCK_START_REGEX = re.compile(
+    r"^(#|>|-|\+|\*( |$)|=|:|~|%|<|\||`{3}"
+    r"|\(?([0-9]+|[a-zA-Z]|[ivxlcdm]+|[IVXLCDM]+|#|@)[.)]( |$))"
+)
+LIST_START_REGEX = re.compile(r"^ *([-+*]|\(?([0-9]+|[a-zA-Z]|[ivxlcdm]+|[IVXLCDM]+|#|@)[.)])( |$)")
+RULE_LIKE_REGEX = re.compile(r"^ *([-*_] *){3,}$")
+
+# pandoc joins these abbreviations to the next word with a non-breaking space. This is
+# its list, as printed by `pandoc --print-default-data-file abbreviations` (2.17).
+ABBREVIATIONS = {
+    "aet.", "aetat.", "al.", "Apr.", "Aug.", "bk.", "Bros.", "c.", "Capt.", "cf.", "ch.",
+    "chap.", "chs.", "Co.", "col.", "Corp.", "cp.", "d.", "Dec.", "Dr.", "e.g.", "ed.", "eds.",
+    "esp.", "f.", "fasc.", "Feb.", "ff.", "fig.", "fl.", "fol.", "fols.", "Fr.", "Gen.", "Gov.",
+    "Hon.", "i.e.", "ill.", "Inc.", "incl.", "Jan.", "Jr.", "Jul.", "Jun.", "Ltd.", "M.A.",
+    "M.D.", "Mar.", "Mr.", "Mrs.", "Ms.", "n.", "n.b.", "nn.", "No.", "Nov.", "Oct.", "p.",
+    "Ph.D.", "pp.", "Pres.", "Prof.", "pt.", "q.v.", "Rep.", "Rev.", "s.v.", "s.vv.", "saec.",
+    "sec.", "Sen.", "Sep.", "Sept.", "Sgt.", "Sr.", "St.", "univ.", "viz.", "vol.", "vs.",
+}
+# Characters with a meaning in pandoc markdown that this parser doesn't handle.
+SPECIAL_CHARS = set('\\<>[]{}*~^@|&"$')
+
+TASK_PREFIXES = {
+    "[ ] ": [Str('☐'), Space()],
+    "[x] ": [Str('☒'), Space()],
+    "[X] ": [Str('☒'), Space()],
+}
+
+
+class Unsupported(Exception):
+    pass
+
+
+def parse_paper(content: str) -> Optional[Pandoc]:
+    """
+    Parses preprocessed Paper markdown. Returns None if the doc uses anything outside of
+    the supported subset.
+    """
+    if "\t" in content or "\r" in content:
+        return None
+    try:
+        return Pandoc(Meta({}), BlockParser(content.split("\n")).parse())
+    except Unsupported:
+        return None
+
+
+def is_blank(line: str) -> bool:
+    return line.strip() == ""
+
+
+def check_word(word: str):
+    if not word.endswith("."):
+        return
+    core = word.lstrip("([")
+    if "." in core[:-1] or core in ABBREVIATIONS or (core[:1].isupper() and len(core) <= 6):
+        raise Unsupported(f"possible abbreviation: {word}")
+
+
+def parse_inlines(text: str, allow_br: bool = False) -> List[Inline]:
+    inlines = []
+    word = []
+
+    def flush():
+        if word:
+            text = "".join(word)
+            check_word(text)
+            inlines.append(Str(text))
+            word.clear()
+
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == " ":
+            flush()
+            if inlines and inlines[-1] != Space():
+                inlines.append(Space())
+            i += 1
+        elif c == "`":
+            end = text.find("`", i + 1)
+            code = text[i + 1:end]
+            if end == -1 or code.strip() != code or code == "":
+                raise Unsupported(f"code span: {text}")
+            flush()
+            inlines.append(Code(ATTR, code))
+            i = end + 1
+        elif text.startswith("**", i):
+            end = text.find("**", i + 2)
+            inner = text[i + 2:end]
+            if (end == -1 or word or (inlines and inlines[-1] != Space()) or inner.strip() != inner or inner == ""
+                    or text[end + 2:end + 3] not in ("", " ")):
+                raise Unsupported(f"strong: {text}")
+            inlines.append(Strong(parse_inlines(inner)))
+            i = end + 2
+        elif allow_br and text.startswith("<br>", i):
+            flush()
+            inlines.append(RawInline(Format("html"), "<br>"))
+            i += 4
+        elif c in ("'", "_"):
+            # only intraword apostrophes and underscores are literal.
+            if not (word and word[-1].isalnum() and text[i + 1:i + 2].isalnum()):
+                raise Unsupported(f"quote or emphasis: {text}")
+            word.append("’" if c == "'" else c)
+            i += 1
+        elif c in SPECIAL_CHARS or c.isspace() or text.startswith("--", i) or text.startswith("...", i):
+            raise Unsupported(f"special character {c!r}: {text}")
+        else:
+            word.append(c)
+            i += 1
+    flush()
+    if inlines and inlines[-1] == Space():
+        inlines.pop()
+    return inlines
+
+
+def stringify(inlines: List[Inline]) -> str:
+    parts = []
+    for inline in inlines:
+        match inline:
+            case Str(text) | Code(_, text):
+                parts.append(text)
+            case Space() | SoftBreak():
+                parts.append(" ")
+            case Strong(children):
+                parts.append(stringify(children))
+    return "".join(parts)
+
+
+def to_identifier(inlines: List[Inline]) -> str:
+    text = "".join(c for c in stringify(inlines).lower() if c.isalnum() or c.isspace() or c in "_-.")
+    text = "-".join(text.split())
+    for i, c in enumerate(text):
+        if c.isalpha():
+            return text[i:]
+    return ""
+
+
+class BlockParser:
+
+    def __init__(self, lines: List[str]):
+        self._lines = lines
+        self._i = 0
+        self._identifiers = set()
+        self._heading_texts = set()
+        self._has_checked_tasks = False
+
+    def _peek(self) -> Optional[str]:
+        return self._lines[self._i] if self._i < len(self._lines) else None
+
+    def parse(self) -> List[Block]:
+        blocks = []
+        # pandoc wants a blank line before most blocks. A paragraph may follow a heading.
+        after_blank = True
+        after_heading = False
+        while (line := self._peek()) is not None:
+            if is_blank(line):
+                self._i += 1
+                after_blank, after_heading = True, False
+                continue
+            if not after_blank and not (after_heading and not BLOCK_START_REGEX.match(line)):
+                raise Unsupported(f"block without a blank line before: {line}")
+
+            if HEADING_REGEX.match(line):
+                blocks.append(self.parse_heading())
+                after_blank, after_heading = False, True
+                continue
+
+            if RULE_REGEX.match(line):
+                self._i += 1
+                if self._peek() is not None and not is_blank(self._peek()):
+                    raise Unsupported(f"rule or metadata: {line}")
+                blocks.append(HorizontalRule())
+            elif line.startswith("```"):
+                blocks.append(self.parse_code_block())
+            elif line.startswith("|"):
+                blocks.append(self.parse_table())
+            elif BULLET_ITEM_REGEX.match(line) or ORDERED_ITEM_REGEX.match(line):
+                blocks.append(self.parse_list(0))
+                # items separated by blank lines make a loose list, indented lines continue an item.
+                # A list of the other kind starts a new list.
+                rest = (self._lines[i] for i in range(self._i, len(self._lines)))
+                following = next((line for line in rest if not is_blank(line)), None)
+                other_kind = ORDERED_ITEM_REGEX if isinstance(blocks[-1], BulletList) else BULLET_ITEM_REGEX
+                if (following is not None and (following.startswith(" ") or LIST_START_REGEX.match(following))
+                        and not (other_kind.match(following) and not following.startswith(" "))):
+                    raise Unsupported(f"loose list: {following}")
+            else:
+                blocks.append(self.parse_para())
+            after_blank, after_heading = False, False
+
+        # with a heading called "x", pandoc reads "[x]" as a link to it, not as a task.
+        if self._has_checked_tasks and "x" in self._heading_texts:
+            raise Unsupported("heading named x")
+        return blocks
+
+    def parse_heading(self) -> Block:
+        line = self._lines[self._i]
+        self._i += 1
+        hashes, text = HEADING_REGEX.match(line).groups()
+        if text == "" or text.endswith("#"):
+            raise Unsupported(f"heading: {line}")
+        inlines = parse_inlines(text)
+        self._heading_texts.add(stringify(inlines).lower())
+
+        identifier = to_identifier(inlines) or "section"
+        if identifier in self._identifiers:
+            count = 1
+            while f"{identifier}-{count}" in self._identifiers:
+                count += 1
+            identifier = f"{identifier}-{count}"
+        self._identifiers.add(identifier)
+        return Header(len(hashes), (identifier, [], []), inlines)
+
+    def parse_code_block(self) -> Block:
+        match = FENCE_REGEX.match(self._lines[self._i].rstrip(" "))
+        if not match:
+            raise Unsupported(f"code fence: {self._lines[self._i]}")
+        self._i += 1
+        lines = []
+        while (line := self._peek()) is not None:
+            self._i += 1
+            if line.rstrip(" ") == "```":
+                language = match.group(1)
+                return CodeBlock(('', [language] if language else [], []), "\n".join(lines))
+            if line.lstrip(" ").startswith("```") or line.lstrip(" ").startswith("~~~"):
+                raise Unsupported(f"nested fence: {line}")
+            lines.append(line)
+        raise Unsupported("unterminated code block")
+
+    def parse_para(self) -> Block:
+        lines = []
+        while (line := self._peek()) is not None and not is_blank(line):
+            if line.startswith("    ") and not lines:
+                raise Unsupported(f"indented code: {line}")
+            stripped = line.strip(" ")
+            if BLOCK_START_REGEX.match(stripped) or RULE_LIKE_REGEX.match(stripped) or line.endswith("  "):
+                raise Unsupported(f"not a paragraph line: {line}")
+            lines.append(stripped)
+            self._i += 1
+
+        inlines = []
+        for line in lines:
+            if inlines:
+                inlines.append(SoftBreak())
+            inlines.extend(parse_inlines(line))
+        return Para(inlines)
+
+    def parse_list(self, level: int) -> Block:
+        ordered = None
+        start = 1
+        items = []
+        while (line := self._peek()) is not None and not is_blank(line):
+            bullet = BULLET_ITEM_REGEX.match(line)
+            number = ORDERED_ITEM_REGEX.match(line)
+            if (not bullet and not number) or RULE_LIKE_REGEX.match(line):
+                raise Unsupported(f"not a list item: {line}")
+            indent = len((bullet or number).group(1))
+            if indent % 4 != 0 or indent // 4 > level + 1 or (indent // 4 > level and not items):
+                raise Unsupported(f"list indentation: {line}")
+            if indent // 4 < level:
+                break
+            if indent // 4 > level:
+                items[-1].append(self.parse_list(level + 1))
+                continue
+
+            if ordered is None:
+                ordered = number is not None
+                if ordered:
+                    start = int(number.group(2))
+            elif ordered != (number is not None):
+                raise Unsupported(f"mixed list: {line}")
+
+            text = number.group(3) if number else bullet.group(2)
+            if text.endswith("  ") or text.strip(" ") == "":
+                raise Unsupported(f"list item: {line}")
+            text = text.strip(" ")
+            prefix = []
+            if not ordered and text[:4] in TASK_PREFIXES:
+                prefix = TASK_PREFIXES[text[:4]]
+                self._has_checked_tasks |= text[1] != " "
+                text = text[4:].lstrip(" ")
+            if BLOCK_START_REGEX.match(text):
+                raise Unsupported(f"block in list item: {line}")
+            items.append([Plain(prefix + parse_inlines(text))])
+            self._i += 1
+
+        if ordered:
+            return OrderedList((start, Decimal(), Period()), items)
+        return BulletList(items)
+
+    def parse_table(self) -> Block:
+        lines = []
+        while (line := self._peek()) is not None and not is_blank(line):
+            if not line.startswith("|") or not line.rstrip(" ").endswith("|") or "\\" in line or "`" in line:
+                raise Unsupported(f"table row: {line}")
+            lines.append(line)
+            self._i += 1
+        if len(lines) < 3 or not TABLE_SEPARATOR_REGEX.match(lines[1]):
+            raise Unsupported(f"table: {lines[0]}")
+
+        def split_cells(line: str) -> List[str]:
+            return [cell.strip(" ") for cell in line.rstrip(" ")[1:-1].split("|")]
+
+        separators = split_cells(lines[1])
+        aligns = []
+        for separator in separators:
+            match separator.startswith(":"), separator.endswith(":"):
+                case True, True:
+                    aligns.append(AlignCenter())
+                case True, False:
+                    aligns.append(AlignLeft())
+                case False, True:
+                    aligns.append(AlignRight())
+                case _:
+                    aligns.append(AlignDefault())
+        if max(len(line) for line in lines) > PANDOC_COLUMNS:
+            total = sum(len(separator) for separator in separators)
+            widths = [ColWidth_(len(separator) / total) for separator in separators]
+        else:
+            widths = [ColWidthDefault() for _ in separators]
+
+        def row(line: str) -> Row:
+            cells = split_cells(line)
+            if len(cells) != len(separators):
+                raise Unsupported(f"table row width: {line}")
+            return Row(ATTR, [
+                Cell(ATTR, AlignDefault(), RowSpan(1), ColSpan(1),
+                     [Plain(parse_inlines(cell, allow_br=True))] if cell else [])
+                for cell in cells
+            ])
+
+        head = row(lines[0])
+        if not any(cell[4] for cell in head[1]):
+            raise Unsupported("table without header")
+        return Table(
+            ATTR,
+            Caption(None, []),
+            list(zip(aligns, widths)),
+            TableHead(ATTR, [head]),
+            [TableBody(ATTR, RowHeadColumns(0), [], [row(line) for line in lines[2:]])],
+            TableFoot(ATTR, []),
+        )
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+# path -> (modification time in ns, size) of every file under a folder.
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+def snapshot(in_dir: str) -> Snapshot:
+    """
+    Stats every file under `in_dir`, listing every folder once. Links to folders are not
+    followed, as scan() doesn't follow them either.
+    """
+    files = {}
+    stack = [in_dir]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            # removed while listing, the next snapshot sees it gone.
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            stack.append(entry.path)
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def changed_paths(old: Snapshot, new: Snapshot) -> Set[str]:
+    """The files added, edited or removed between two snapshots."""
+    return {path for path in old.keys() | new.keys() if old.get(path) != new.get(path)}
+
+
+class FolderWatcher:
+    """
+    Tells when files change under a folder, by comparing snapshots of it every
+    `poll_seconds`. It needs no filesystem events, so it works the same on every OS and
+    on network drives.
+
+    Changes are debounced: once a change is seen, the watcher waits until the folder has
+    been quiet for `debounce_seconds`, so saving a doc several times in a row, or
+    copying a whole folder in, is reported once.
+
+    Changes are reported again until commit() is called once they are handled, so a
+    batch that failed is retried.
+    """
+
+    def __init__(self, in_dir: str, poll_seconds: float = 1.0, debounce_seconds: float = 2.0,
+                 stop: Optional[threading.Event] = None):
+        self.in_dir = in_dir
+        self._poll_seconds = poll_seconds
+        self._debounce_seconds = debounce_seconds
+        self._stop = stop or threading.Event()
+        self._snapshot = snapshot(in_dir)
+        # the snapshot of the changes last returned by wait().
+        self._pending = self._snapshot
+
+    def stop(self):
+        self._stop.set()
+
+    def commit(self):
+        """Marks the changes last returned by wait() as handled."""
+        self._snapshot = self._pending
+
+    def wait(self) -> Optional[Set[str]]:
+        """
+        Blocks until files changed since the last commit() and the folder is quiet again,
+        and returns the changed paths. Returns None once stopped.
+        """
+        current = self._snapshot
+        quiet_since = None
+        while not self._stop.wait(self._poll_seconds):
+            latest = snapshot(self.in_dir)
+            if latest != current:
+                current = latest
+                quiet_since = time.monotonic()
+                continue
+            if quiet_since is not None and time.monotonic() - quiet_since >= self._debounce_seconds:
+                changed = changed_paths(self._snapshot, current)
+                if changed:
+                    self._pending = current
+                    return changed
+                # edited, then put back as it was.
+                quiet_since = None
+        return None
@@ -0,0 +1,418 @@
+"""
+A second backend for writer.Parser that renders pandoc's JSON output directly.
+
+Building pandoc.types instances for large docs dominates conversion time and memory, so
+this backend walks the plain dicts and lists json.loads() returns, dispatching on each
+node's "t" tag through a table. Its output is identical to writer.Parser.
+"""
+import html
+import io
+import json
+import subprocess
+from typing import List
+
+from more_itertools import peekable
+
+from writer import COMPLETE_TOKEN, INCOMPLETE_TOKEN, PANDOC_FORMAT, code_block_template, preprocess_page
+
+BR = ["html", "<br>"]
+
+
+def read_json(content: str) -> dict:
+    """
+    Runs pandoc on preprocessed markdown and returns its JSON AST.
+    """
+    result = subprocess.run(["pandoc", "-f", PANDOC_FORMAT, "-t", "json"],
+                            input=content.encode('utf-8'), capture_output=True, check=True)
+    return json.loads(result.stdout)
+
+
+def escape_text(text: str) -> str:
+    return html.escape(text)
+
+
+def is_task_action(block) -> bool:
+    if block['t'] != 'Plain':
+        return False
+    inlines = block['c']
+    return (len(inlines) >= 2 and inlines[0]['t'] == 'Str' and inlines[0]['c'] in (COMPLETE_TOKEN, INCOMPLETE_TOKEN)
+            and inlines[1]['t'] == 'Space')
+
+
+def is_task_item(blocks) -> bool:
+    return all(is_task_action(block) or is_task_list(block) for block in blocks)
+
+
+def is_task_list(block) -> bool:
+    return block['t'] == 'BulletList' and all(is_task_item(blocks) for blocks in block['c'])
+
+
+def unpack_target(target):
+    match target:
+        case [url, title]:
+            return escape_text(url), escape_text(title)
+        case _:
+            raise AssertionError(f"Not Target: {target}")
+
+
+class JsonParser:
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._write = self._buffer.write
+        # tag -> (open tag, close tag) for inlines that only wrap other inlines.
+        self._wrappers = {
+            'Emph': ("<em>", "</em>"),
+            'Underline': ("<u>", "</u>"),
+            'Strong': ("<strong>", "</strong>"),
+            'Strikeout': ('<span style="text-decoration: line-through;">', "</span>"),
+            'Superscript': ("<sup>", "</sup>"),
+            'Subscript': ("<sub>", "</sub>"),
+        }
+        self._inlines = {
+            'Str': self.do_str,
+            'Space': self.do_space,
+            'SoftBreak': self.do_space,
+            'LineBreak': self.do_line_break,
+            'Quoted': self.do_quoted,
+            'Cite': self.do_cite,
+            'Code': self.do_code,
+            'RawInline': self.do_raw_inline,
+            'Link': self.do_link,
+            'Image': self.do_image,
+        }
+        self._blocks = {
+            'Plain': self.do_plain,
+            'Para': self.do_para,
+            'LineBlock': self.do_line_block,
+            'CodeBlock': self.do_code_block,
+            'RawBlock': self.do_raw_block,
+            'BlockQuote': self.do_block_quote,
+            'OrderedList': self.do_ordered_list,
+            'BulletList': self.do_bullet_list,
+            'Header': self.do_header,
+            'HorizontalRule': self.do_horizontal_rule,
+            'Table': self.do_table,
+        }
+
+    def getvalue(self) -> str:
+        return self._buffer.getvalue()
+
+    def do_pandoc(self, doc):
+        if not isinstance(doc, dict) or 'blocks' not in doc:
+            raise AssertionError(f"Not Pandoc: {doc}")
+        # TODO: meta
+        for block in doc['blocks']:
+            self.do_block(block)
+
+    def do_inlines(self, inlines):
+        for inline in inlines:
+            self.do_inline(inline)
+
+    def do_inline(self, el):
+        tag = el['t']
+        wrapper = self._wrappers.get(tag)
+        if wrapper is not None:
+            self._write(wrapper[0])
+            self.do_inlines(el['c'])
+            self._write(wrapper[1])
+            return
+        handler = self._inlines.get(tag)
+        if handler is not None:
+            handler(el)
+        elif tag == 'Note':
+            raise AssertionError(f"Note: {el}. This suggests the text {el} cannot be recognized by the tool. Please put it in a codeblock in the original Paper doc.")
+        elif tag == 'Span':
+            raise AssertionError(f"Span: {el}. This suggests the text {el} cannot be recognized by the tool. Please put it in a codeblock in the original Paper doc.")
+        elif tag == 'SmallCaps':
+            raise AssertionError(f"SmallCaps: {el}")
+        elif tag == 'Math':
+            raise Exception(f"Math: {el}")
+        else:
+            raise AssertionError(f"Not Inline: {el}")
+
+    def do_str(self, el):
+        self._write(escape_text(el['c']))
+
+    def do_space(self, el):
+        self._write(" ")
+
+    def do_line_break(self, el):
+        self._write("<br />")
+
+    def do_quoted(self, el):
+        quote_type, inlines = el['c']
+        match quote_type['t']:
+            case 'DoubleQuote':
+                self._write("&ldquo;")
+                self.do_inlines(inlines)
+                self._write("&rdquo;")
+            case 'SingleQuote':
+                self._write("&lsquo;")
+                self.do_inlines(inlines)
+                self._write("&rsquo;")
+            case _:
+                raise Exception(f"Quoted: {el}")
+
+    def do_cite(self, el):
+        self.do_inlines(el['c'][1])
+
+    def do_code(self, el):
+        self._write("<code>")
+        self._write(escape_text(el['c'][1]))
+        self._write("</code>")
+
+    def do_raw_inline(self, el):
+        format, text = el['c']
+        if format != "html":
+            raise AssertionError(f"RawInline {el}")
+        self._write(escape_text(text))
+
+    def do_link(self, el):
+        # TODO: alt-text
+        attr, inlines, target = el['c']
+        url, title = unpack_target(target)
+        if title != "":
+            raise AssertionError(el)
+        self._write(f'<a href="{url}">')
+        self.do_inlines(inlines)
+        self._write("</a>")
+
+    def do_image(self, el):
+        # TODO: alt-text
+        self._write("<ac:image>")
+        url, _ = unpack_target(el['c'][2])
+        self._write(f'<ri:url ri:value="{url}"/>')
+        self._write("</ac:image>")
+
+    def do_block(self, el):
+        handler = self._blocks.get(el['t'])
+        if handler is not None:
+            handler(el)
+        elif el['t'] == 'DefinitionList':
+            raise AssertionError(f"DefinitionList: {el}")
+        elif el['t'] == 'Div':
+            raise AssertionError(f"Div: {el}")
+        elif el['t'] == 'Null':
+            raise AssertionError(f"Null: {el}")
+        else:
+            raise AssertionError(f"unexpected element {el}")
+
+    def do_plain(self, el):
+        self.do_inlines(el['c'])
+
+    def do_para(self, el):
+        inlines = el['c']
+        # Paper use **text** for level 3 header.
+        if len(inlines) == 1 and inlines[0]['t'] == 'Strong':
+            self._write("<h3>")
+            self.do_inlines(inlines[0]['c'])
+            self._write("</h3>\n")
+        else:
+            self._write("<p>")
+            self.do_inlines(inlines)
+            self._write("</p>")
+
+    def do_line_block(self, el):
+        self._write("<p>")
+        for inlines in el['c']:
+            self.do_inlines(inlines)
+        self._write("</p>\n")
+
+    def do_code_block(self, el):
+        self._write(code_block_template.format(text=el['c'][1]))
+
+    def do_raw_block(self, el):
+        print(f"RawBlock found: {el}")
+        format, text = el['c']
+        if format == "html":
+            self._write("<code>")
+            self._write(escape_text(text))
+            self._write("</code>")
+        else:
+            raise AssertionError(f"RawBlock found: {el}")
+
+    def do_block_quote(self, el):
+        self._write("<blockquote>\n")
+        for block in el['c']:
+            self.do_block(block)
+        self._write("</blockquote>\n")
+
+    def do_ordered_list(self, el):
+        self._write("<ol>\n")
+        for blocks in el['c'][1]:
+            self._write("<li>")
+            for block in blocks:
+                self.do_block(block)
+            self._write("</li>\n")
+        self._write("</ol>\n")
+
+    def do_bullet_list(self, el):
+        if is_task_list(el):
+            self.do_task_list(el)
+            return
+        self._write("<ul>\n")
+        for blocks in el['c']:
+            self._write("<li>")
+            for block in blocks:
+                self.do_block(block)
+            self._write("</li>\n")
+        self._write("</ul>\n")
+
+    def do_header(self, el):
+        level, attr, inlines = el['c']
+        self._write(f"<h{level}>")
+        self.do_inlines(inlines)
+        self._write(f"</h{level}>\n")
+
+    def do_horizontal_rule(self, el):
+        self._write("<hr />\n")
+
+    def do_task_action(self, block):
+        if not is_task_action(block):
+            raise AssertionError(f"{block} is not a task item")
+        token, _, *rest = block['c']
+        status = "complete" if token['c'] == COMPLETE_TOKEN else "incomplete"
+        self._write("<ac:task>\n")
+        self._write(f"<ac:task-status>{status}</ac:task-status>\n")
+        self._write("<ac:task-body>")
+        self.do_inlines(rest)
+        self._write("</ac:task-body>\n")
+        self._write("</ac:task>\n")
+
+    def do_task_item(self, blocks):
+        for block in blocks:
+            if is_task_action(block):
+                self.do_task_action(block)
+            elif is_task_list(block):
+                self.do_task_list(block)
+            else:
+                raise AssertionError("Not task item: {blocks}")
+
+    def do_task_list(self, block):
+        self._write("<ac:task-list>")
+        for blocks in block['c']:
+            self.do_task_item(blocks)
+        self._write("</ac:task-list>\n")
+
+    def do_table(self, el):
+        attr, caption, col_specs, table_head, table_bodies, table_foot = el['c']
+        self._write("<table>\n")
+        self.do_table_head(table_head)
+        for table_body in table_bodies:
+            self.do_table_body(table_body)
+        self._write("</table>\n")
+
+    def do_table_head(self, table_head):
+        attr, rows = table_head
+        if len(rows) > 1:
+            raise AssertionError(f"more than one rows in TableHead: {rows}")
+        if len(rows) == 0:
+            return
+        self.do_row(rows[0], is_header=True)
+
+    def do_table_body(self, table_body):
+        attr, row_head_columns, headers, rows = table_body
+        for row in rows:
+            self.do_row(row, is_header=False)
+
+    def do_row(self, row, is_header: bool):
+        attr, cells = row
+        self._write("<tr>")
+        for cell in cells:
+            self._write("<th>" if is_header else "<td>")
+            self.do_cell(cell)
+            self._write("</th>" if is_header else "</td>")
+        self._write("</tr>")
+
+    def do_cell(self, cell):
+        attr, alignment, row_span, col_span, blocks = cell
+        for block in blocks:
+            self.do_table_block(block)
+
+    def do_table_block(self, el):
+        if el['t'] != 'Plain':
+            self.do_block(el)
+            return
+        groups = split_br(el['c'])
+        if is_table_task_list(groups):
+            bullet_list = convert_bullet_list(peekable(groups), 0)
+            self.do_block(bullet_list)
+        else:
+            for group in groups:
+                self.do_para({'t': 'Para', 'c': group})
+
+
+def split_br(inlines) -> List[list]:
+    groups = []
+    group = []
+    for el in inlines:
+        if el['t'] == 'RawInline' and el['c'] == BR:
+            groups.append(group)
+            group = []
+        else:
+            group.append(el)
+    if group:
+        groups.append(group)
+
+    return groups
+
+
+def is_dash(el) -> bool:
+    return el['t'] == 'Str' and el['c'] == "-"
+
+
+def is_space(el) -> bool:
+    return el['t'] == 'Space'
+
+
+def is_top_item(inlines) -> bool:
+    return len(inlines) >= 2 and is_dash(inlines[0]) and is_space(inlines[1])
+
+
+def is_nested_item(inlines) -> bool:
+    return len(inlines) >= 3 and is_space(inlines[0]) and is_dash(inlines[1]) and is_space(inlines[2])
+
+
+def is_table_task_list(groups) -> bool:
+    return groups and all(is_top_item(group) or is_nested_item(group) for group in groups)
+
+
+def convert_bullet_list(groups, level):
+    list_blocks = []
+    while True:
+        group = groups.peek(None)
+        if group is None:
+            return {'t': 'BulletList', 'c': list_blocks}
+
+        if level == 0:
+            if is_top_item(group):
+                list_blocks.append([{'t': 'Plain', 'c': group[2:]}])
+                next(groups)
+            elif is_nested_item(group):
+                bullet_list = convert_bullet_list(groups, 1)
+                list_blocks[-1].append(bullet_list)
+            else:
+                raise AssertionError(f"{group}")
+
+        elif level == 1:
+            if is_top_item(group):
+                return {'t': 'BulletList', 'c': list_blocks}
+            elif is_nested_item(group):
+                next(groups)
+                list_blocks.append([{'t': 'Plain', 'c': group[3:]}])
+            else:
+                raise AssertionError(f"{group}")
+
+
+def render_json(doc: dict) -> str:
+    parser = JsonParser()
+    parser.do_pandoc(doc)
+    return parser.getvalue()
+
+
+def convert_page_json(path: str) -> str:
+    with open(path) as f:
+        content = f.read()
+
+    return render_json(read_json(preprocess_page(content)))
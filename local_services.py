@@ -0,0 +1,706 @@
+"""
+Local stand-ins for the Confluence and Dropbox endpoints the scripts call, to load test
+exports and downloads on a laptop without touching production.
+
+LocalConfluence keeps pages and their attachments in memory and follows Confluence where
+the scripts depend on it: titles are unique in a space, an update must bump the page
+version, and deleting a page trashes it and moves its children up to its parent.
+LocalDropbox serves a local folder as a Dropbox folder of Paper docs. Both can add latency, throttle requests over a
+rate with 429 and Retry-After, and fail a share of requests with 500.
+
+Run `python3 local_services.py --docs <folder>`, and point the scripts at the printed
+URLs with --conf_url and --dbx_url.
+"""
+import base64
+import email.parser
+import email.policy
+import hashlib
+import itertools
+import json
+import os
+import random
+import shutil
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import argparse
+import requests
+from requests.adapters import HTTPAdapter
+
+DUPLICATE_TITLE_MESSAGE = "A page with this title already exists: A page already exists with the same TITLE in this space"
+# Confluence caps the page size of listings.
+MAX_LIMIT = 200
+DEFAULT_LIMIT = 25
+DROPBOX_HOSTS = ("https://api.dropboxapi.com", "https://content.dropboxapi.com")
+DROPBOX_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+@dataclass
+class Faults:
+    # seconds added to every response, plus a random share of `jitter`.
+    latency: float = 0.0
+    jitter: float = 0.0
+    # requests a second served before throttling the rest with 429. Unlimited if None.
+    max_rate: Optional[float] = None
+    # the Retry-After sent with a 429, in seconds.
+    retry_after: int = 1
+    # share of requests failed with a 500.
+    error_rate: float = 0.0
+    seed: int = 0
+
+
+class FaultInjector:
+    """Delays requests and picks the ones to throttle or fail, as `faults` says."""
+
+    def __init__(self, faults: Faults):
+        self.faults = faults
+        self.stats = Counter()
+        self._random = random.Random(faults.seed)
+        # when the requests of the last second were served.
+        self._served = deque()
+        self._lock = threading.Lock()
+
+    def inject(self) -> Optional[int]:
+        """Waits out the latency, and returns the status to fail the request with, if any."""
+        faults = self.faults
+        status = None
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = faults.latency + self._random.uniform(0, faults.jitter)
+            if faults.max_rate is not None:
+                now = time.monotonic()
+                while self._served and self._served[0] <= now - 1:
+                    self._served.popleft()
+                if len(self._served) >= faults.max_rate:
+                    status = 429
+                    self.stats['throttled'] += 1
+                else:
+                    self._served.append(now)
+            if status is None and self._random.random() < faults.error_rate:
+                status = 500
+                self.stats['failed'] += 1
+        if delay:
+            time.sleep(delay)
+        return status
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, like the real services.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, obj, headers: Optional[Dict[str, str]] = None):
+        self.send(status, json.dumps(obj).encode('utf-8'), {"Content-Type": "application/json", **(headers or {})})
+
+    def json_body(self):
+        return json.loads(self.body or b"{}")
+
+    def _dispatch(self, method: str):
+        # read the body even when failing the request, so the connection stays usable.
+        self.body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        service = self.server.service
+        service.requests[method] += 1
+        status = service.faults.inject()
+        if status is not None:
+            service.reject(self, status)
+            return
+        service.handle(self, method, urlsplit(self.path))
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # load tests open many connections at once.
+    request_queue_size = 256
+
+
+class _LocalService:
+
+    def __init__(self, faults: Optional[Faults] = None, host: str = "127.0.0.1", port: int = 0):
+        self.faults = FaultInjector(faults or Faults())
+        self.requests = Counter()
+        self._server = _Server((host, port), _Handler)
+        self._server.service = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def summary(self) -> str:
+        served = ", ".join(f"{method} {count}" for method, count in sorted(self.requests.items()))
+        faults = self.faults.stats
+        return (f"{type(self).__name__}: {faults['requests']} requests ({served}), "
+                f"{faults['throttled']} throttled, {faults['failed']} failed")
+
+    def reject(self, request: _Handler, status: int):
+        raise NotImplementedError
+
+    def handle(self, request: _Handler, method: str, url):
+        raise NotImplementedError
+
+
+@dataclass
+class Page:
+    id: str
+    title: str
+    space: str
+    body: str
+    parent_id: Optional[str]
+    version: int = 1
+    status: str = 'current'
+    # content properties: key -> {'value': ..., 'version': ...}
+    properties: Dict[str, dict] = field(default_factory=dict)
+    # file name -> content
+    attachments: Dict[str, bytes] = field(default_factory=dict)
+
+
+class LocalConfluence(_LocalService):
+    """The content endpoints of the Confluence REST API, over pages kept in memory."""
+
+    def __init__(self, faults: Optional[Faults] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(faults, host, port)
+        self.pages: Dict[str, Page] = {}
+        # (space, title) -> id of the current page with that title.
+        self._titles: Dict[Tuple[str, str], str] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_page(self, space: str, title: str, body: str = "", parent_id: Optional[str] = None,
+                 status: str = 'current') -> Page:
+        """Adds a page directly, for tests to start from a space that isn't empty."""
+        with self._lock:
+            page = Page(str(next(self._ids)), title, space, body, parent_id, status=status)
+            self.pages[page.id] = page
+            if status == 'current':
+                self._titles[(space, title)] = page.id
+            return page
+
+    def current_pages(self, space: str) -> List[Page]:
+        with self._lock:
+            return [page for page in self.pages.values() if page.space == space and page.status == 'current']
+
+    def reject(self, request: _Handler, status: int):
+        if status == 429:
+            request.send_json(429, {"statusCode": 429, "message": "Rate limit exceeded"},
+                              {"Retry-After": str(self.faults.faults.retry_after)})
+        else:
+            request.send_json(status, {"statusCode": status, "message": "Internal server error"})
+
+    @staticmethod
+    def error(request: _Handler, status: int, message: str):
+        request.send_json(status, {"statusCode": status, "message": message})
+
+    def handle(self, request: _Handler, method: str, url):
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+        if parts[:3] != ["rest", "api", "content"]:
+            self.error(request, 404, f"No route for {url.path}")
+            return
+        with self._lock:
+            match method, parts[3:]:
+                case "GET", []:
+                    self.list_pages(request, params)
+                case "POST", []:
+                    self.create_page(request)
+                case "GET", [page_id]:
+                    self.get_page(request, page_id, params)
+                case "GET", [page_id, "history"]:
+                    self.get_history(request, page_id)
+                case "PUT", [page_id]:
+                    self.update_page(request, page_id)
+                case "DELETE", [page_id]:
+                    self.delete_page(request, page_id, params)
+                case "GET", [page_id, "property", key]:
+                    self.get_property(request, page_id, key)
+                case "PUT", [page_id, "property", key]:
+                    self.put_property(request, page_id, key)
+                case "GET", [page_id, "child", "attachment"]:
+                    self.list_attachments(request, page_id, params)
+                case "POST", [page_id, "child", "attachment"]:
+                    self.add_attachments(request, page_id)
+                case _:
+                    self.error(request, 404, f"No route for {method} {url.path}")
+
+    def page_json(self, page: Page, expand: str = "") -> dict:
+        result = {
+            'id': page.id,
+            'type': 'page',
+            'status': page.status,
+            'title': page.title,
+            'space': {'key': page.space},
+            'version': {'number': page.version},
+        }
+        if "body.storage" in expand:
+            result['body'] = {'storage': {'value': page.body, 'representation': 'storage'}}
+        if "ancestors" in expand:
+            ancestors = []
+            parent = self.pages.get(page.parent_id) if page.parent_id else None
+            while parent is not None:
+                ancestors.append({'id': parent.id, 'type': 'page', 'title': parent.title})
+                parent = self.pages.get(parent.parent_id) if parent.parent_id else None
+            result['ancestors'] = ancestors[::-1]
+        properties = {}
+        for expansion in expand.split(","):
+            key = expansion.removeprefix("metadata.properties.")
+            if key != expansion and key in page.properties:
+                properties[key] = self.property_json(page, key)
+        if properties:
+            result['metadata'] = {'properties': properties}
+        return result
+
+    @staticmethod
+    def property_json(page: Page, key: str) -> dict:
+        content_property = page.properties[key]
+        return {'key': key, 'value': content_property['value'], 'version': {'number': content_property['version']}}
+
+    def find_page(self, page_id: str, status: str = 'current') -> Optional[Page]:
+        page = self.pages.get(page_id)
+        if page is None or (status != 'any' and page.status != status):
+            return None
+        return page
+
+    def list_pages(self, request: _Handler, params: dict):
+        space = params.get('spaceKey')
+        status = params.get('status', 'current')
+        start = int(params.get('start', 0))
+        limit = min(int(params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+        if 'title' in params:
+            page_id = self._titles.get((space, params['title']))
+            pages = [self.pages[page_id]] if page_id and status in ('current', 'any') else []
+        else:
+            pages = [page for page in self.pages.values()
+                     if (space is None or page.space == space) and status in (page.status, 'any')]
+        results = [self.page_json(page, params.get('expand', "")) for page in pages[start:start + limit]]
+        request.send_json(200, {'results': results, 'start': start, 'limit': limit, 'size': len(results)})
+
+    def parent_id(self, data: dict) -> Tuple[bool, Optional[str]]:
+        """Returns whether the ancestor in `data` is a current page, and its id."""
+        ancestors = data.get('ancestors') or []
+        if not ancestors:
+            return True, None
+        parent_id = str(ancestors[-1]['id'])
+        return self.find_page(parent_id) is not None, parent_id
+
+    def create_page(self, request: _Handler):
+        data = request.json_body()
+        title = data.get('title')
+        space = (data.get('space') or {}).get('key')
+        if not title or not space:
+            self.error(request, 400, "A page needs a title and a space")
+            return
+        if (space, title) in self._titles:
+            self.error(request, 400, DUPLICATE_TITLE_MESSAGE)
+            return
+        found, parent_id = self.parent_id(data)
+        if not found:
+            self.error(request, 400, f"Could not find the ancestor {parent_id}")
+            return
+        body = ((data.get('body') or {}).get('storage') or {}).get('value', "")
+        page = Page(str(next(self._ids)), title, space, body, parent_id)
+        # properties can be set along with the page.
+        for key, content_property in ((data.get('metadata') or {}).get('properties') or {}).items():
+            page.properties[key] = {'value': content_property.get('value'), 'version': 1}
+        self.pages[page.id] = page
+        self._titles[(space, title)] = page.id
+        request.send_json(200, self.page_json(page))
+
+    def get_page(self, request: _Handler, page_id: str, params: dict):
+        page = self.find_page(page_id, params.get('status', 'current'))
+        if page is None:
+            self.error(request, 404, f"No content found with id: {page_id}")
+            return
+        request.send_json(200, self.page_json(page, params.get('expand', "")))
+
+    def get_history(self, request: _Handler, page_id: str):
+        page = self.find_page(page_id)
+        if page is None:
+            self.error(request, 404, f"No content found with id: {page_id}")
+            return
+        request.send_json(200, {'latest': True, 'lastUpdated': {'number': page.version}})
+
+    def update_page(self, request: _Handler, page_id: str):
+        page = self.find_page(page_id)
+        if page is None:
+            self.error(request, 404, f"No content found with id: {page_id}")
+            return
+        data = request.json_body()
+        version = (data.get('version') or {}).get('number')
+        if version != page.version + 1:
+            self.error(request, 409, f"Version must be incremented on update. Current version is: {page.version}")
+            return
+        title = data.get('title') or page.title
+        if self._titles.get((page.space, title), page.id) != page.id:
+            self.error(request, 400, DUPLICATE_TITLE_MESSAGE)
+            return
+        found, parent_id = self.parent_id(data)
+        if not found:
+            self.error(request, 400, f"Could not find the ancestor {parent_id}")
+            return
+
+        del self._titles[(page.space, page.title)]
+        self._titles[(page.space, title)] = page.id
+        page.title = title
+        page.version = version
+        if 'body' in data:
+            page.body = data['body']['storage']['value']
+        if data.get('ancestors'):
+            page.parent_id = parent_id
+        request.send_json(200, self.page_json(page))
+
+    def get_property(self, request: _Handler, page_id: str, key: str):
+        page = self.find_page(page_id)
+        if page is None or key not in page.properties:
+            self.error(request, 404, f"Cannot find content property {key} of {page_id}")
+            return
+        request.send_json(200, self.property_json(page, key))
+
+    def put_property(self, request: _Handler, page_id: str, key: str):
+        # like Confluence, version 1 creates the property.
+        page = self.find_page(page_id)
+        if page is None:
+            self.error(request, 404, f"No content found with id: {page_id}")
+            return
+        version = (request.json_body().get('version') or {}).get('number')
+        current = page.properties.get(key, {'version': 0})['version']
+        if version != current + 1:
+            self.error(request, 409, f"Version must be incremented on update. Current version is: {current}")
+            return
+        page.properties[key] = {'value': request.json_body().get('value'), 'version': version}
+        request.send_json(200, self.property_json(page, key))
+
+    @staticmethod
+    def attachment_json(page: Page, name: str) -> dict:
+        return {'id': f"att{page.id}-{name}", 'type': 'attachment', 'title': name,
+                'extensions': {'fileSize': len(page.attachments[name])}}
+
+    def list_attachments(self, request: _Handler, page_id: str, params: dict):
+        page = self.find_page(page_id)
+        if page is None:
+            self.error(request, 404, f"No content found with id: {page_id}")
+            return
+        names = [name for name in page.attachments if params.get('filename', name) == name]
+        start = int(params.get('start', 0))
+        limit = min(int(params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+        results = [self.attachment_json(page, name) for name in names[start:start + limit]]
+        request.send_json(200, {'results': results, 'start': start, 'limit': limit, 'size': len(results)})
+
+    def add_attachments(self, request: _Handler, page_id: str):
+        page = self.find_page(page_id)
+        if page is None:
+            self.error(request, 404, f"No content found with id: {page_id}")
+            return
+        if request.headers.get("X-Atlassian-Token") != "no-check":
+            self.error(request, 403, "XSRF check failed")
+            return
+        form = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {request.headers.get('Content-Type')}\r\n\r\n".encode('utf-8') + request.body)
+        files = {part.get_filename(): part.get_payload(decode=True)
+                 for part in form.iter_parts() if part.get_param('name', header='content-disposition') == 'file'}
+        if not files:
+            self.error(request, 400, "No file to attach")
+            return
+        # like Confluence, a name already attached fails the whole upload.
+        for name in files:
+            if name in page.attachments:
+                self.error(request, 400, f"Cannot add a new attachment with same file name as an existing "
+                                         f"attachment: {name}")
+                return
+        page.attachments.update(files)
+        results = [self.attachment_json(page, name) for name in files]
+        request.send_json(200, {'results': results, 'size': len(results)})
+
+    def delete_page(self, request: _Handler, page_id: str, params: dict):
+        if params.get('status') == 'trashed':
+            # purging from the trash.
+            if self.find_page(page_id, 'trashed') is None:
+                self.error(request, 404, f"No content found with id: {page_id}")
+                return
+            del self.pages[page_id]
+            request.send(204)
+            return
+
+        page = self.find_page(page_id)
+        if page is None:
+            self.error(request, 404, f"No content found with id: {page_id}")
+            return
+        page.status = 'trashed'
+        del self._titles[(page.space, page.title)]
+        for child in self.pages.values():
+            if child.parent_id == page.id:
+                child.parent_id = page.parent_id
+        request.send(204)
+
+
+class LocalDropbox(_LocalService):
+    """
+    The Dropbox routes the download scripts call, serving the files under `root` as the
+    Dropbox folder tree. Exporting a file returns its content as is.
+
+    Files and folders removed with delete() are listed as deleted to cursors from before,
+    and reset_cursors() expires every cursor handed out so far.
+    """
+
+    def __init__(self, root: str, faults: Optional[Faults] = None, host: str = "127.0.0.1", port: int = 0,
+                 page_size: int = 500, namespace_id: str = "1"):
+        super().__init__(faults, host, port)
+        self.root = os.path.abspath(root)
+        self.page_size = page_size
+        self.namespace_id = namespace_id
+        self._lock = threading.Lock()
+        # (when, Dropbox path) of every deleted file and folder.
+        self._deleted: List[Tuple[float, str]] = []
+        self._reset_at = 0.0
+
+    def delete(self, path: str):
+        local_path = self.local_path(path)
+        if os.path.isdir(local_path):
+            shutil.rmtree(local_path)
+        else:
+            os.remove(local_path)
+        with self._lock:
+            self._deleted.append((time.time(), path))
+
+    def reset_cursors(self):
+        with self._lock:
+            self._reset_at = time.time()
+
+    def reject(self, request: _Handler, status: int):
+        if status == 429:
+            retry_after = self.faults.faults.retry_after
+            request.send_json(429, {
+                'error_summary': "too_many_requests/",
+                'error': {'reason': {'.tag': "too_many_requests"}, 'retry_after': retry_after},
+            }, {"Retry-After": str(retry_after)})
+        else:
+            request.send(status, b"Internal server error", {"Content-Type": "text/plain"})
+
+    @staticmethod
+    def not_found(request: _Handler, path: str):
+        request.send_json(409, {
+            'error_summary': f"path/not_found/{path}",
+            'error': {'.tag': "path", 'path': {'.tag': "not_found"}},
+        })
+
+    def handle(self, request: _Handler, method: str, url):
+        match method, url.path:
+            case "POST", "/2/users/get_current_account":
+                request.send_json(200, self.account())
+            case "POST", "/2/files/list_folder":
+                arg = request.json_body()
+                cursor = {'path': arg['path'], 'since': 0, 'offset': 0, 'listed_at': time.time()}
+                self.list_folder(request, cursor)
+            case "POST", "/2/files/list_folder/continue":
+                cursor = json.loads(base64.urlsafe_b64decode(request.json_body()['cursor']))
+                if cursor['listed_at'] <= self._reset_at:
+                    request.send_json(409, {'error_summary': "reset/", 'error': {'.tag': "reset"}})
+                    return
+                self.list_folder(request, cursor)
+            case "POST", "/2/files/export":
+                self.export(request, json.loads(request.headers["Dropbox-API-Arg"]))
+            case _:
+                request.send(404, f"No route for {method} {url.path}".encode('utf-8'), {"Content-Type": "text/plain"})
+
+    def account(self) -> dict:
+        return {
+            'account_id': "dbid:" + "A" * 35,
+            'name': {'given_name': "Local", 'surname': "Dropbox", 'familiar_name': "Local",
+                     'display_name': "Local Dropbox", 'abbreviated_name': "LD"},
+            'email': "local@example.com",
+            'email_verified': True,
+            'disabled': False,
+            'locale': "en",
+            'referral_link': "https://db.tt/local",
+            'is_paired': False,
+            'account_type': {'.tag': "basic"},
+            'root_info': {'.tag': "user", 'root_namespace_id': self.namespace_id,
+                          'home_namespace_id': self.namespace_id},
+        }
+
+    def local_path(self, path: str) -> Optional[str]:
+        local_path = os.path.normpath(os.path.join(self.root, path.lstrip("/")))
+        if local_path != self.root and not local_path.startswith(self.root + os.sep):
+            return None
+        return local_path
+
+    def metadata(self, local_path: str) -> dict:
+        path = "/" + os.path.relpath(local_path, self.root).replace(os.sep, "/")
+        stat = os.stat(local_path)
+        metadata = {
+            'name': os.path.basename(local_path),
+            'id': "id:" + hashlib.sha1(path.lower().encode('utf-8')).hexdigest()[:22],
+            'path_lower': path.lower(),
+            'path_display': path,
+        }
+        if os.path.isdir(local_path):
+            return {'.tag': "folder", **metadata}
+        modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc).strftime(DROPBOX_TIME_FORMAT)
+        return {
+            '.tag': "file",
+            **metadata,
+            'client_modified': modified,
+            'server_modified': modified,
+            'rev': format(stat.st_mtime_ns, "x"),
+            'size': stat.st_size,
+            # Paper docs can only be exported.
+            'is_downloadable': False,
+        }
+
+    def entries(self, local_path: str, since: float) -> List[dict]:
+        """The metadata of `local_path` and everything under it modified after `since`, parents first."""
+        entries = []
+        for dir_path, dir_names, file_names in os.walk(local_path):
+            dir_names.sort()
+            for path in [dir_path] + [os.path.join(dir_path, name) for name in sorted(file_names)]:
+                if path != self.root and os.stat(path).st_mtime > since:
+                    entries.append(self.metadata(path))
+        return entries
+
+    def deleted_entries(self, path: str, since: float) -> List[dict]:
+        """The metadata of what was deleted under `path` after `since`, or nothing for a listing from scratch."""
+        if not since:
+            return []
+        prefix = path.lower().rstrip("/") + "/"
+        with self._lock:
+            deleted = [deleted_path for when, deleted_path in self._deleted if when > since]
+        return [{'.tag': "deleted", 'name': os.path.basename(deleted_path), 'path_lower': deleted_path.lower(),
+                 'path_display': deleted_path}
+                for deleted_path in deleted if deleted_path.lower().startswith(prefix)]
+
+    def list_folder(self, request: _Handler, cursor: dict):
+        local_path = self.local_path(cursor['path'])
+        if local_path is None or not os.path.isdir(local_path):
+            self.not_found(request, cursor['path'])
+            return
+        entries = self.deleted_entries(cursor['path'], cursor['since']) + self.entries(local_path, cursor['since'])
+        offset = cursor['offset']
+        has_more = offset + self.page_size < len(entries)
+        if has_more:
+            next_cursor = {**cursor, 'offset': offset + self.page_size}
+        else:
+            # listing again from the end returns what changed since this listing.
+            next_cursor = {'path': cursor['path'], 'since': cursor['listed_at'], 'offset': 0,
+                           'listed_at': time.time()}
+        request.send_json(200, {
+            'entries': entries[offset:offset + self.page_size],
+            'cursor': base64.urlsafe_b64encode(json.dumps(next_cursor).encode('utf-8')).decode('ascii'),
+            'has_more': has_more,
+        })
+
+    def export(self, request: _Handler, arg: dict):
+        local_path = self.local_path(arg['path'])
+        if local_path is None or not os.path.isfile(local_path):
+            self.not_found(request, arg['path'])
+            return
+        with open(local_path, "rb") as f:
+            content = f.read()
+        result = {
+            'export_metadata': {
+                'name': os.path.splitext(os.path.basename(local_path))[0] + ".md",
+                'size': len(content),
+                'export_hash': hashlib.sha256(content).hexdigest(),
+            },
+            'file_metadata': self.metadata(local_path),
+        }
+        request.send(200, content, {"Content-Type": "application/octet-stream",
+                                    "Dropbox-API-Result": json.dumps(result)})
+
+
+class RedirectAdapter(HTTPAdapter):
+    """Sends requests to `url` instead of the host they were made for."""
+
+    def __init__(self, url: str, **kwargs):
+        self._url = url.rstrip("/")
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = self._url + parts.path + (f"?{parts.query}" if parts.query else "")
+        return super().send(request, **kwargs)
+
+
+def redirect_session(url: str) -> requests.Session:
+    """A session for dropbox.Dropbox that talks to a LocalDropbox at `url`."""
+    session = requests.Session()
+    adapter = RedirectAdapter(url, pool_maxsize=64)
+    for host in DROPBOX_HOSTS:
+        session.mount(host, adapter)
+    return session
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve local stand-ins for Confluence and Dropbox.')
+    parser.add_argument('--docs', help='Folder served as the Dropbox root. Dropbox is only served if given.')
+    parser.add_argument('--host', default="127.0.0.1", help='Address to listen on.')
+    parser.add_argument('--conf_port', type=int, default=8090, help='Port of the Confluence stand-in.')
+    parser.add_argument('--dbx_port', type=int, default=8091, help='Port of the Dropbox stand-in.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many more seconds, at random.')
+    parser.add_argument('--max_rate', type=float, help='Requests a second served by each service before '
+                                                       'answering 429.')
+    parser.add_argument('--retry_after', type=int, default=1, help='Retry-After of 429 responses, in seconds.')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Share of requests failed with 500, 0.01 for 1%%.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the latency jitter and failures.')
+    args = parser.parse_args()
+
+    faults = Faults(latency=args.latency, jitter=args.jitter, max_rate=args.max_rate, retry_after=args.retry_after,
+                    error_rate=args.error_rate, seed=args.seed)
+    services = [LocalConfluence(faults, args.host, args.conf_port)]
+    print(f"Confluence: --conf_url {services[0].url}")
+    if args.docs:
+        services.append(LocalDropbox(args.docs, faults, args.host, args.dbx_port))
+        print(f"Dropbox serving {args.docs}: --dbx_url {services[1].url}")
+    for service in services:
+        service.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    for service in services:
+        service.stop()
+        print(service.summary())
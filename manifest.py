@@ -0,0 +1,77 @@
+import hashlib
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    space TEXT NOT NULL,
+    path TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (space, path)
+)
+"""
+
+# The content property holding the hash of the body a page was last uploaded with.
+BODY_HASH_PROPERTY = "paper_export_body_hash"
+
+
+def hash_body(body: str) -> str:
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class ManifestEntry:
+    page_id: str
+    title: str
+    content_hash: str
+    version: int
+
+
+class Manifest:
+    """
+    An on-disk record of what was uploaded: for every local path (folder or doc), the id
+    of its Confluence page, the hash of the uploaded body and the page version.
+
+    Every record is committed right away, so a crashed run can be resumed from where it
+    stopped. Safe to use from several threads.
+    """
+
+    def __init__(self, path: str, space: str):
+        self._space = space
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def get(self, path: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_id, title, content_hash, version FROM pages WHERE space = ? AND path = ?",
+                (self._space, path),
+            ).fetchone()
+        return ManifestEntry(*row) if row else None
+
+    def record(self, path: str, page_id: str, title: str, content_hash: str, version: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (space, path, page_id, title, content_hash, version) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self._space, path, page_id, title, content_hash, version),
+            )
+            self._conn.commit()
+
+    def forget(self, path: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE space = ? AND path = ?", (self._space, path))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,137 @@
+import contextlib
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Hashable, Optional
+
+# Returned by Metrics.phase() when metrics are off, so timing a phase costs one attribute
+# check and an empty with block.
+NULL_TIMER = contextlib.nullcontext()
+
+
+class _Timer:
+    __slots__ = ('_metrics', '_name', '_doc', '_start')
+
+    def __init__(self, metrics: "Metrics", name: str, doc: Optional[Hashable]):
+        self._metrics = metrics
+        self._name = name
+        self._doc = doc
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self._metrics.add_time(self._name, time.perf_counter() - self._start, self._doc)
+
+
+class Metrics:
+    """
+    Time spent per phase, overall and per doc, and counters of API calls, retries and
+    bytes sent.
+
+    Metrics are off until enable() is called; until then phase() and count() do nothing.
+    Safe to use from several threads. Processes keep their own metrics, which the parent
+    collects with snapshot() and merge().
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # phase -> [count, seconds]
+            self._phases = defaultdict(lambda: [0, 0.0])
+            # doc -> phase -> seconds
+            self._docs = defaultdict(lambda: defaultdict(float))
+            self._counters = Counter()
+            self._started = time.monotonic()
+
+    def enable(self):
+        self.enabled = True
+        self.reset()
+
+    def phase(self, name: str, doc: Optional[Hashable] = None):
+        """Times the enclosed block as `name`, and also as part of `doc` if given."""
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, name, doc)
+
+    def add_time(self, name: str, seconds: float, doc: Optional[Hashable] = None):
+        with self._lock:
+            phase = self._phases[name]
+            phase[0] += 1
+            phase[1] += seconds
+            if doc is not None:
+                self._docs[str(doc)][name] += seconds
+
+    def count(self, name: str, n: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] += n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'phases': {name: {'count': count, 'seconds': seconds} for name, (count, seconds) in self._phases.items()},
+                'counters': dict(self._counters),
+                'docs': {doc: dict(phases) for doc, phases in self._docs.items()},
+            }
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for name, phase in snapshot['phases'].items():
+                self._phases[name][0] += phase['count']
+                self._phases[name][1] += phase['seconds']
+            self._counters.update(snapshot['counters'])
+            for doc, phases in snapshot['docs'].items():
+                for name, seconds in phases.items():
+                    self._docs[doc][name] += seconds
+
+    def report(self, **extra) -> dict:
+        report = {'elapsed_seconds': round(time.monotonic() - self._started, 3)}
+        report.update(self.snapshot())
+        report.update(extra)
+        return report
+
+    def write_report(self, path: str, **extra):
+        with open(path, "w") as f:
+            json.dump(self.report(**extra), f, indent=2)
+
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        lines = ["Time per phase (summed over threads and processes):"]
+        for name, phase in sorted(snapshot['phases'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"  {name}: {phase['seconds']:.2f}s in {phase['count']} calls")
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"  {name}: {value}")
+        return "\n".join(lines)
+
+
+class Progress:
+    """Prints how many of `total` items are done and the rate, at most every `interval` seconds."""
+
+    def __init__(self, total: int, label: str, interval: float = 1.0):
+        self._total = total
+        self._label = label
+        self._interval = interval
+        self._done = 0
+        self._started = time.monotonic()
+        self._printed = self._started
+        self._lock = threading.Lock()
+
+    def advance(self, n: int = 1):
+        with self._lock:
+            self._done += n
+            now = time.monotonic()
+            if now - self._printed < self._interval and self._done < self._total:
+                return
+            self._printed = now
+            rate = self._done / max(now - self._started, 1e-9)
+            print(f"Progress: {self._done}/{self._total} {self._label}, {rate:.1f} {self._label}/s")
+
+
+METRICS = Metrics()
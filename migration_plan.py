@@ -0,0 +1,137 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List
+
+from rate_limit import CONFLUENCE_MAX_RATE
+
+# A rough time for creating or updating a page on Confluence Cloud, round trip included.
+DEFAULT_CALL_SECONDS = 0.5
+# Titles are listed this many at a time, once for current and once for archived pages.
+LIST_PAGE_SIZE = 200
+
+CREATE = "create"
+UPDATE = "update"
+SKIP = "skip"
+
+# An update is a PUT of the page, then a GET and a PUT of its body hash property.
+UPDATE_CALLS = ('update_page', 'get_body_hash', 'store_body_hash')
+
+
+@dataclass
+class PlannedPage:
+    key: Hashable
+    parent_key: Hashable
+    title: str
+    # CREATE, UPDATE, or SKIP when the manifest says the page is up to date.
+    action: str
+    body_bytes: int
+    # links to other docs of the export, which a second pass points at their pages.
+    links: int = 0
+
+
+@dataclass
+class MigrationPlan:
+    """What run_export_to_conf.run() would do with a folder, worked out without Confluence."""
+    root_key: Hashable
+    # in the order run() would schedule them, parents first.
+    pages: List[PlannedPage] = field(default_factory=list)
+    # title -> the paths that would all get it.
+    duplicates: Dict[str, List[str]] = field(default_factory=dict)
+    # path -> why the doc cannot be converted.
+    failures: Dict[str, str] = field(default_factory=dict)
+    # index docs that cannot be converted, which stop the run before any upload.
+    blocking: List[str] = field(default_factory=list)
+    # files that don't become pages.
+    skipped: List[str] = field(default_factory=list)
+    convert_seconds: float = 0.0
+
+    def actions(self) -> Counter:
+        return Counter(page.action for page in self.pages)
+
+    def body_bytes(self) -> int:
+        return sum(page.body_bytes for page in self.pages if page.action != SKIP)
+
+    def api_calls(self, existing_pages: int = 0) -> Counter:
+        """The Confluence calls of the upload, if the space has `existing_pages` pages."""
+        actions = self.actions()
+        calls = Counter()
+        if actions[CREATE]:
+            # the title index is only fetched when a page needs creating. Each listing
+            # ends with an empty page.
+            calls['list_pages'] = 2 + existing_pages // LIST_PAGE_SIZE
+        calls['create_page'] = actions[CREATE]
+        # the version of an updated page comes from the manifest, that of its body hash
+        # property doesn't.
+        for name in UPDATE_CALLS:
+            calls[name] = actions[UPDATE]
+        calls['link_page'] = sum(1 for page in self.pages if page.action != SKIP and page.links)
+        return +calls
+
+    def estimate_upload_seconds(self, workers: int, call_seconds: float = DEFAULT_CALL_SECONDS,
+                                max_rate: float = CONFLUENCE_MAX_RATE, existing_pages: int = 0) -> float:
+        """
+        Simulates the upload scheduler: `workers` threads, each page created once its
+        parent exists, every call taking `call_seconds`, and no more than `max_rate`
+        calls a second overall. Then the pages linking to other docs are updated, all
+        `workers` at a time.
+        """
+        calls = self.api_calls(existing_pages)
+        start = calls['list_pages'] * call_seconds
+        children = defaultdict(list)
+        for page in self.pages:
+            children[page.parent_key].append(page)
+
+        # (time a page can start, order, page), and when each worker is free next.
+        ready = [(start, i, page) for i, page in enumerate(children.pop(self.root_key, []))]
+        heapq.heapify(ready)
+        order = len(ready)
+        free_at = [start] * workers
+        end = start
+        while ready:
+            ready_at, _, page = heapq.heappop(ready)
+            if page.action == SKIP:
+                done_at = ready_at
+            else:
+                worker_free_at = heapq.heappop(free_at)
+                page_calls = len(UPDATE_CALLS) if page.action == UPDATE else 1
+                done_at = max(ready_at, worker_free_at) + page_calls * call_seconds
+                heapq.heappush(free_at, done_at)
+            end = max(end, done_at)
+            for child in children.pop(page.key, []):
+                heapq.heappush(ready, (done_at, order, child))
+                order += 1
+
+        page_calls = calls['create_page'] + sum(calls[name] for name in UPDATE_CALLS)
+        end = max(end, start + page_calls / max_rate)
+        return end + max(math.ceil(calls['link_page'] / workers) * call_seconds, calls['link_page'] / max_rate)
+
+    def summary(self, workers: int, call_seconds: float = DEFAULT_CALL_SECONDS) -> str:
+        actions = self.actions()
+        calls = self.api_calls()
+        lines = [
+            f"Pages: {len(self.pages)} ({actions[CREATE]} to create, {actions[UPDATE]} to update, "
+            f"{actions[SKIP]} unchanged), {self.body_bytes() / 1024 / 1024:.1f} MB of page bodies",
+            f"Converted in {self.convert_seconds:.1f}s, {len(self.failures)} docs cannot be converted",
+            f"Confluence calls: {sum(calls.values())} "
+            f"({', '.join(f'{name} {count}' for name, count in calls.items()) or 'none'})",
+            f"Estimated upload time with {workers} workers at {call_seconds}s a call: "
+            f"{self.estimate_upload_seconds(workers, call_seconds):.1f}s",
+            "Titles are not checked against the pages already in the space, which run() skips "
+            "or copies with --new_on_duplicate.",
+        ]
+        if self.duplicates:
+            lines.append(f"Duplicate titles, which stop the run:")
+            for title, paths in self.duplicates.items():
+                lines.append(f"  {title}: {', '.join(paths)}")
+        if self.blocking:
+            lines.append(f"Folder docs that cannot be converted, which stop the run:")
+            lines.extend(f"  {path}" for path in self.blocking)
+        if self.failures:
+            lines.append(f"Docs that cannot be converted:")
+            lines.extend(f"  {path}: {error}" for path, error in self.failures.items())
+        if self.skipped:
+            lines.append(f"Skipped files:")
+            lines.extend(f"  {path}" for path in self.skipped)
+        return "\n".join(lines)
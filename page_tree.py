@@ -0,0 +1,174 @@
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+DOC_EXTENSIONS = (".paper", ".md")
+
+
+def doc_title(file_name: str) -> Optional[str]:
+    """The title of the page made from a doc, or None if the file is not a doc."""
+    for extension in DOC_EXTENSIONS:
+        if file_name.endswith(extension):
+            return file_name.removesuffix(extension)
+    return None
+
+
+@dataclass(slots=True)
+class PageNode:
+    title: str
+    # the folder or the doc the page is made from.
+    path: str
+    is_dir: bool = False
+    # a folder's .paper doc of the same name, whose content becomes the folder page.
+    index_path: Optional[str] = None
+    # folders first, then docs, in directory order.
+    children: List["PageNode"] = field(default_factory=list)
+    # files in a folder that don't become pages: docs named after the folder, including
+    # its index doc, and files that are not docs.
+    ignored: List[str] = field(default_factory=list)
+
+    @property
+    def has_index(self) -> bool:
+        return self.index_path is not None
+
+
+@dataclass(slots=True)
+class PageTree:
+    """
+    The pages an export folder turns into, read with a single scan of the folder.
+
+    Every folder and every doc in it is a node, except docs named after their folder.
+    """
+    root: PageNode
+
+    def folders(self) -> Iterator[PageNode]:
+        """Yields the folders, each before the folders under it."""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed([child for child in node.children if child.is_dir]))
+
+    def doc_paths(self) -> List[str]:
+        """The docs to convert, index docs included, in the order of folders()."""
+        paths = []
+        for folder in self.folders():
+            for child in folder.children:
+                if child.is_dir:
+                    if child.has_index:
+                        paths.append(child.index_path)
+                else:
+                    paths.append(child.path)
+        return paths
+
+    def affected(self, paths: Iterable[str]) -> Set[str]:
+        """
+        The paths of the pages showing the docs at `paths`, a folder page for its index
+        doc, and of every folder above them.
+        """
+        paths = set(paths)
+        parents = {}
+        pages = set()
+        for folder in self.folders():
+            for child in folder.children:
+                parents[child.path] = folder.path
+                if child.path in paths or (child.is_dir and child.index_path in paths):
+                    pages.add(child.path)
+        for path in list(pages):
+            while path in parents and parents[path] not in pages:
+                path = parents[path]
+                pages.add(path)
+        return pages
+
+    def titles(self) -> Dict[str, List[str]]:
+        """Maps every page title to the paths of the pages that would get it."""
+        titles = defaultdict(list)
+        for folder in self.folders():
+            for child in folder.children:
+                titles[child.title].append(child.path)
+        return titles
+
+    def duplicates(self) -> Dict[str, List[str]]:
+        return {title: paths for title, paths in self.titles().items() if len(paths) > 1}
+
+    def check_titles(self) -> int:
+        """Raises if two pages would get the same title, and returns the number of pages."""
+        titles = self.titles()
+        for title, paths in titles.items():
+            if len(paths) > 1:
+                raise AssertionError(f"{title} duplicates: {paths[1]} and {paths[0]}")
+        return len(titles)
+
+
+def scan(in_dir: str) -> PageTree:
+    """
+    Reads the folder tree under `in_dir` into a PageTree, listing every folder once.
+
+    Links to folders become folders with no children, as os.walk() doesn't follow them
+    either.
+    """
+    root = PageNode(os.path.basename(in_dir), in_dir, is_dir=True)
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        docs = []
+        with os.scandir(folder.path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    node = PageNode(entry.name, entry.path, is_dir=True)
+                    folder.children.append(node)
+                    if not entry.is_symlink():
+                        stack.append(node)
+                    continue
+
+                title = doc_title(entry.name)
+                if title is None or title == folder.title:
+                    folder.ignored.append(entry.path)
+                    if entry.name == folder.title + ".paper":
+                        folder.index_path = entry.path
+                    continue
+                docs.append(PageNode(title, entry.path))
+        folder.children.extend(docs)
+    return PageTree(root)
+
+
+def from_paths(in_dir: str, paths: Iterable[str]) -> PageTree:
+    """
+    Builds the PageTree of the docs at `paths`, all under `in_dir`, as scan() would read
+    it from a folder holding just those docs. Folders are made from the paths, so a
+    folder without docs has no node.
+    """
+    root = PageNode(os.path.basename(in_dir), in_dir, is_dir=True)
+    folders = {in_dir: root}
+    docs = defaultdict(list)
+
+    def get_folder(folder_path: str) -> PageNode:
+        path = folder_path
+        missing = []
+        while path not in folders:
+            if os.path.dirname(path) == path:
+                raise ValueError(f"{folder_path} is not under {in_dir}")
+            missing.append(path)
+            path = os.path.dirname(path)
+        folder = folders[path]
+        for path in reversed(missing):
+            node = PageNode(os.path.basename(path), path, is_dir=True)
+            folder.children.append(node)
+            folders[path] = folder = node
+        return folder
+
+    for path in paths:
+        folder = get_folder(os.path.dirname(path))
+        file_name = os.path.basename(path)
+        title = doc_title(file_name)
+        if title is None or title == folder.title:
+            folder.ignored.append(path)
+            if file_name == folder.title + ".paper":
+                folder.index_path = path
+            continue
+        docs[folder.path].append(PageNode(title, path))
+
+    for path, folder_docs in docs.items():
+        folders[path].children.extend(folder_docs)
+    return PageTree(root)
@@ -0,0 +1,247 @@
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from threading import Lock
+from typing import Hashable, Iterable, Iterator, List, Set, Tuple, Union
+
+import pandoc
+from pandoc.types import Format, Pandoc, RawBlock
+
+from fast_parser import parse_paper
+from metrics import METRICS
+from writer import PANDOC_FORMAT, preprocess_page, render_doc
+
+# pandoc 2.17 has no server mode, so every pandoc.read() pays for a process start.
+# Instead of one process per document, we join a batch of documents with a marker
+# that pandoc parses as a top level raw html block, convert the batch in a single
+# call, and split the resulting block list back into documents on the markers.
+DOC_SEPARATOR = "<!-- paper2conf:doc-break -->"
+SEPARATOR_BLOCK = RawBlock(Format("html"), DOC_SEPARATOR)
+
+# Reference links and footnotes are resolved across the whole pandoc input, so a
+# definition in one doc could leak into its neighbours. Such docs are converted alone.
+REFERENCE_DEFINITION_REGEX = re.compile(r"^ {0,3}\[[^\]]+\]:", flags=re.MULTILINE)
+# Headings are implicit reference targets across the whole input too: "[Foo]" or a "[x]"
+# task in one doc would link to a "# Foo" or "# x" heading in another. A doc is not
+# batched with docs having a heading its bracketed text could refer to. Setext
+# underlines also match rules, which only makes it stricter.
+ATX_HEADING_REGEX = re.compile(r"^ {0,3}#{1,6}(?:[ \t]+(.*?))?[ \t#]*$")
+SETEXT_UNDERLINE_REGEX = re.compile(r"^ {0,3}(=+|-+)[ \t]*$")
+EXPLICIT_ID_REGEX = re.compile(r"\{#([^}\s]+)")
+BRACKET_REGEX = re.compile(r"\[([^\]\n]*)\](?!\()")
+
+Result = Union[str, Exception]
+
+
+@dataclass
+class BatchStats:
+    docs: int = 0
+    # docs parsed by fast_parser, without pandoc.
+    fast_docs: int = 0
+    pandoc_calls: int = 0
+    fallback_docs: int = 0
+    startup_seconds: float = 0.0
+
+    @property
+    def saved_calls(self) -> int:
+        return self.docs - self.pandoc_calls
+
+    @property
+    def saved_seconds(self) -> float:
+        return self.saved_calls * self.startup_seconds
+
+    def summary(self) -> str:
+        return (f"Converted {self.docs} docs with {self.pandoc_calls} pandoc calls "
+                f"({self.fast_docs} without pandoc, {self.fallback_docs} converted alone). Saved ~{self.saved_seconds:.1f}s "
+                f"of pandoc startup ({self.startup_seconds * 1000:.0f}ms per doc).")
+
+
+def render(doc) -> Result:
+    try:
+        return render_doc(doc)
+    except Exception as e:
+        return e
+
+
+def can_batch(content: Union[str, Exception]) -> bool:
+    if isinstance(content, Exception):
+        return False
+    return DOC_SEPARATOR not in content and not REFERENCE_DEFINITION_REGEX.search(content)
+
+
+def reference_key(text: str) -> str:
+    """
+    A loose key for matching bracketed text with headings: letters and digits only, so
+    text matching a heading's text or identifier always has the heading's key.
+    """
+    text = text.lower()
+    return "".join(c for c in text if c.isalnum()) or text.strip()
+
+
+def heading_keys(content: str) -> Set[str]:
+    keys = set()
+    lines = content.split("\n")
+    for i, line in enumerate(lines):
+        match = ATX_HEADING_REGEX.match(line)
+        if match:
+            text = match.group(1) or ""
+        elif SETEXT_UNDERLINE_REGEX.match(line) and i and lines[i - 1].strip():
+            text = lines[i - 1]
+        else:
+            continue
+        keys.add(reference_key(text))
+        keys.update(reference_key(identifier) for identifier in EXPLICIT_ID_REGEX.findall(text))
+    return keys
+
+
+def bracket_keys(content: str) -> Set[str]:
+    return {reference_key(text) for text in BRACKET_REGEX.findall(content) if text.strip()}
+
+
+def batchable(contents: List[str]) -> List[int]:
+    """
+    The indices of the docs that can share a pandoc read without changing how any of
+    them converts.
+    """
+    batch = [i for i, content in enumerate(contents) if can_batch(content)]
+    headings = {i: heading_keys(contents[i]) for i in batch}
+    # the docs having a heading of each key.
+    owners = defaultdict(set)
+    for i, keys in headings.items():
+        for key in keys:
+            owners[key].add(i)
+    # a doc can still refer to its own headings.
+    return [i for i in batch if all(owners[key] <= {i} for key in bracket_keys(contents[i]))]
+
+
+def split_blocks(doc) -> List[list]:
+    match doc:
+        case Pandoc(meta, blocks):
+            docs = [[]]
+            for block in blocks:
+                if block == SEPARATOR_BLOCK:
+                    docs.append([])
+                else:
+                    docs[-1].append(block)
+            return [Pandoc(meta, blocks) for blocks in docs]
+        case _:
+            raise AssertionError(f"Not Pandoc: {doc}")
+
+
+class BatchConverter:
+    """
+    Converts a stream of documents to storage format with a small pool of workers,
+    each feeding batches of documents to a single pandoc invocation.
+
+    The output is exactly what convert_page() returns for each document: batches whose
+    split doesn't line up with the input fall back to converting every doc on its own.
+    """
+
+    def __init__(self, workers: int = 2, batch_size: int = 50):
+        self._workers = workers
+        self._batch_size = batch_size
+        self._lock = Lock()
+        self.stats = BatchStats()
+
+    def _read(self, content: str):
+        with self._lock:
+            self.stats.pandoc_calls += 1
+        with METRICS.phase("pandoc.read"):
+            return pandoc.read(source=content, format=PANDOC_FORMAT)
+
+    def _render(self, key: Hashable, doc) -> Result:
+        with METRICS.phase("render", key):
+            return render(doc)
+
+    def _convert_one(self, key: Hashable, content: str) -> Result:
+        with self._lock:
+            self.stats.fallback_docs += 1
+        try:
+            doc = self._read(content)
+        except Exception as e:
+            return e
+        return self._render(key, doc)
+
+    def _convert_batch(self, keys: List[Hashable], contents: List[str]) -> List[Result]:
+        if len(contents) == 1:
+            return [self._convert_one(keys[0], contents[0])]
+
+        try:
+            docs = split_blocks(self._read(f"\n\n{DOC_SEPARATOR}\n\n".join(contents)))
+        except Exception:
+            docs = []
+        if len(docs) != len(contents):
+            # A doc swallowed a separator (e.g. an unterminated code fence) or pandoc
+            # rejected the batch. Convert one by one to get per-doc results and errors.
+            return [self._convert_one(key, content) for key, content in zip(keys, contents)]
+
+        return [self._render(key, doc) for key, doc in zip(keys, docs)]
+
+    def _convert_chunk(self, chunk: List[Tuple[Hashable, str]]) -> List[Tuple[Hashable, Result]]:
+        results = [None] * len(chunk)
+        for i, (key, content) in enumerate(chunk):
+            if not isinstance(content, str):
+                continue
+            with METRICS.phase("fast_parse", key):
+                doc = parse_paper(content)
+            if doc is not None:
+                results[i] = self._render(key, doc)
+                with self._lock:
+                    self.stats.fast_docs += 1
+        pending = [i for i in range(len(chunk)) if results[i] is None]
+        batch = [pending[j] for j in batchable([chunk[i][1] for i in pending])]
+        for i, result in zip(batch, self._convert_batch([chunk[i][0] for i in batch], [chunk[i][1] for i in batch])):
+            results[i] = result
+        for i, (key, content) in enumerate(chunk):
+            if isinstance(content, Exception):
+                results[i] = content
+            elif results[i] is None:
+                results[i] = self._convert_one(key, content)
+        return [(key, result) for (key, _), result in zip(chunk, results)]
+
+    def _measure_startup(self):
+        start = time.perf_counter()
+        pandoc.read(source="", format=PANDOC_FORMAT)
+        self.stats.startup_seconds = time.perf_counter() - start
+
+    def convert_contents(self, items: Iterable[Tuple[Hashable, str]]) -> Iterator[Tuple[Hashable, Result]]:
+        """
+        Converts (key, markdown) pairs, yielding (key, body) in input order. A doc that
+        fails to convert yields its exception instead of a body, and an exception passed
+        in place of markdown is yielded as is.
+        """
+        if not self.stats.startup_seconds:
+            self._measure_startup()
+
+        def preprocess(key: Hashable, content: Union[str, Exception]) -> Union[str, Exception]:
+            if isinstance(content, Exception):
+                return content
+            with METRICS.phase("preprocess", key):
+                return preprocess_page(content)
+
+        items = ((key, preprocess(key, content)) for key, content in items)
+        chunks = iter(lambda: list(islice(items, self._batch_size)), [])
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            # Keep only a couple of batches per worker in flight so memory stays bounded.
+            pending = []
+            for chunk in chunks:
+                pending.append(executor.submit(self._convert_chunk, chunk))
+                with self._lock:
+                    self.stats.docs += len(chunk)
+                if len(pending) >= 2 * self._workers:
+                    yield from pending.pop(0).result()
+            for future in pending:
+                yield from future.result()
+
+    def convert_paths(self, paths: Iterable[str]) -> Iterator[Tuple[str, Result]]:
+        def read(path: str) -> Union[str, Exception]:
+            try:
+                with METRICS.phase("read_file", path), open(path) as f:
+                    return f.read()
+            except OSError as e:
+                return e
+
+        return self.convert_contents((path, read(path)) for path in paths)
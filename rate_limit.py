@@ -0,0 +1,214 @@
+import email.utils
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from dropbox.exceptions import InternalServerError, RateLimitError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+
+from metrics import METRICS
+
+MAX_RETRIES = 5
+# Statuses worth retrying. Throttling ones also slow down the limiter.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Throttling seen within this many seconds of slowing down is usually the rest of the
+# same burst, and doesn't slow down again.
+SLOW_DOWN_COOLDOWN = 1.0
+# Calls a second made to Confluence at most.
+CONFLUENCE_MAX_RATE = 50.0
+
+
+@dataclass
+class RetryDecision:
+    # the server asked us to slow down, as opposed to a transient failure.
+    throttled: bool
+    # seconds the server asked us to wait, if it said.
+    retry_after: Optional[float] = None
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header, given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """Hands out up to `rate` tokens a second, with bursts of up to `burst` tokens."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class RateLimiter:
+    """
+    Paces calls to a service shared by many threads, and retries the ones that fail
+    transiently.
+
+    Calls take a token from a bucket refilled at the current rate. When the service
+    throttles a call, the rate is halved and every caller waits out the delay, either
+    the one the service asked for or a jittered exponential backoff. Each successful call
+    raises the rate a little, back up to `max_rate`, so the rate settles just under what
+    the service accepts instead of collapsing into a storm of retries.
+    """
+
+    def __init__(self, name: str, max_rate: float, min_rate: float = 1.0, max_retries: int = MAX_RETRIES,
+                 base_delay: float = 1.0, max_delay: float = 60.0,
+                 classify: Optional[Callable[[Exception], Optional[RetryDecision]]] = None):
+        self.name = name
+        self._max_rate = max_rate
+        self._min_rate = min_rate
+        self.max_retries = max_retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._classify = classify
+        self._bucket = TokenBucket(max_rate, burst=max(1.0, max_rate / 10))
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+        self._slowed_at = -SLOW_DOWN_COOLDOWN
+
+    @property
+    def rate(self) -> float:
+        return self._bucket.rate
+
+    def acquire(self):
+        METRICS.count(f"{self.name}.calls")
+        with self._lock:
+            delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._bucket.acquire()
+
+    def succeeded(self):
+        # at the current rate, this adds up to 5% of `max_rate` a second.
+        with self._lock:
+            rate = self._bucket.rate
+            self._bucket.rate = min(self._max_rate, rate + self._max_rate / 20 / rate)
+
+    def backoff(self, attempt: int, decision: RetryDecision, reason: str):
+        """Waits before retry number `attempt` + 1."""
+        delay = min(self._max_delay, self._base_delay * 2 ** attempt)
+        if decision.retry_after is not None:
+            # a little jitter, so that callers told the same time don't all retry at once.
+            delay = decision.retry_after + random.uniform(0, self._base_delay)
+        else:
+            delay = random.uniform(delay / 2, delay)
+
+        METRICS.count(f"{self.name}.retries")
+        if decision.throttled:
+            METRICS.count(f"{self.name}.throttled")
+            with self._lock:
+                now = time.monotonic()
+                if now - self._slowed_at > SLOW_DOWN_COOLDOWN:
+                    self._bucket.rate = max(self._min_rate, self._bucket.rate / 2)
+                    self._slowed_at = now
+                self._resume_at = max(self._resume_at, now + delay)
+            print(f"{self.name}: backing off {delay:.1f}s after {reason}, now at {self.rate:.1f} calls/s")
+        else:
+            print(f"{self.name}: retrying in {delay:.1f}s after {reason}")
+        time.sleep(delay)
+
+    def call(self, fn, *args, **kwargs):
+        """Calls `fn`, retrying the errors `classify` returns a decision for."""
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                decision = self._classify(e) if self._classify else None
+                if decision is None or attempt >= self.max_retries:
+                    raise
+                self.backoff(attempt, decision, repr(e))
+                attempt += 1
+                continue
+            self.succeeded()
+            return result
+
+
+def classify_dropbox_error(e: Exception) -> Optional[RetryDecision]:
+    if isinstance(e, RateLimitError):
+        return RetryDecision(throttled=True, retry_after=e.backoff)
+    if isinstance(e, (InternalServerError, ConnectionError, Timeout)):
+        return RetryDecision(throttled=False)
+    return None
+
+
+def dropbox_limiter(max_rate: float = 20.0) -> RateLimiter:
+    return RateLimiter("Dropbox", max_rate, classify=classify_dropbox_error)
+
+
+def confluence_limiter(max_rate: float = CONFLUENCE_MAX_RATE) -> RateLimiter:
+    return RateLimiter("Confluence", max_rate)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    Sends every request of a session through a RateLimiter, retrying throttled and
+    failed requests.
+
+    Requests that may not be safe to repeat, like creating a page, are only retried
+    when the service throttled them, as it didn't act on them then.
+    """
+
+    def __init__(self, limiter: RateLimiter, **kwargs):
+        self._limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        idempotent = request.method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            self._limiter.acquire()
+            if request.body:
+                METRICS.count(f"{self._limiter.name}.bytes_sent", len(request.body))
+            try:
+                response = super().send(request, **kwargs)
+            except (ConnectionError, Timeout) as e:
+                if not idempotent or attempt >= self._limiter.max_retries:
+                    raise
+                self._limiter.backoff(attempt, RetryDecision(throttled=False), repr(e))
+                attempt += 1
+                continue
+
+            status = response.status_code
+            throttled = status in THROTTLE_STATUSES
+            if status in RETRY_STATUSES and (idempotent or throttled) and attempt < self._limiter.max_retries:
+                decision = RetryDecision(throttled, parse_retry_after(response.headers.get("Retry-After")))
+                response.close()
+                self._limiter.backoff(attempt, decision, f"{status} from {request.method} {request.url}")
+                attempt += 1
+                continue
+
+            self._limiter.succeeded()
+            return response
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import List
+
+import argparse
+
+import pandoc
+
+from json_writer import read_json, render_json
+from writer import PANDOC_FORMAT, preprocess_page, render_doc
+
+BACKENDS = ['types', 'json']
+
+
+def find_docs(path: str) -> List[str]:
+    if os.path.isfile(path):
+        return [path]
+    paths = []
+    for dir_path, _, files in os.walk(path):
+        for file in files:
+            if file.endswith(".paper") or file.endswith(".md"):
+                paths.append(os.path.join(dir_path, file))
+    return sorted(paths)
+
+
+def run_backend(backend: str, paths: List[str]) -> dict:
+    """
+    Converts every doc with one backend and reports the time, the peak RSS of this
+    process and a digest of the output. Each backend runs in its own process so that the
+    peak RSS of one doesn't hide the other's.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend}")
+    digest = hashlib.sha256()
+    failed = 0
+    start = time.perf_counter()
+    for path in paths:
+        with open(path) as f:
+            content = preprocess_page(f.read())
+        # pandoc and both renderers can fail on a doc, which counts it as failed, as
+        # convert_stage.py does.
+        try:
+            match backend:
+                case 'types':
+                    body = render_doc(pandoc.read(source=content, format=PANDOC_FORMAT))
+                case 'json':
+                    body = render_json(read_json(content))
+        except Exception as e:
+            body = f"error: {type(e).__name__}"
+            failed += 1
+        digest.update(body.encode('utf-8'))
+    seconds = time.perf_counter() - start
+    return {
+        'backend': backend,
+        'docs': len(paths),
+        'failed': failed,
+        'seconds': round(seconds, 3),
+        # ru_maxrss is in kilobytes on Linux.
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'digest': digest.hexdigest(),
+    }
+
+
+def bench(path: str) -> List[dict]:
+    results = []
+    for backend in BACKENDS:
+        output = subprocess.run([sys.executable, __file__, '--path', path, '--backend', backend],
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare time and peak memory of the two renderer backends.')
+    parser.add_argument('--path', required=True, help='A doc, or a folder of .paper/.md docs.')
+    parser.add_argument('--backend', choices=BACKENDS, help='Run only this backend in this process.')
+    parser.add_argument('--out', help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_backend(args.backend, find_docs(args.path))))
+        sys.exit(0)
+
+    results = bench(args.path)
+    for result in results:
+        print(f"{result['backend']:>6}: {result['docs']} docs in {result['seconds']}s, "
+              f"peak RSS {result['peak_rss_mb']}MB")
+    if len({result['digest'] for result in results}) != 1:
+        print("Outputs differ between backends!")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,198 @@
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import argparse
+
+import pandoc
+
+import run_export_to_conf
+from corpus import PROFILES, generate_corpus
+from local_services import Faults, LocalConfluence
+from writer import PANDOC_FORMAT, convert_page, preprocess_page, render_doc
+
+DEFAULT_THRESHOLD = 0.1
+
+
+class InMemoryConfluence:
+    """
+    Just enough of confluence.Confluence for run() to export into, so the export
+    benchmark measures our code rather than the network.
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.pages: Dict[str, dict] = {}
+
+    def get_all_pages_from_space(self, space, start=0, limit=50, status=None, expand=None):
+        if status != 'current':
+            return []
+        with self._lock:
+            return list(self.pages.values())[start:start + limit]
+
+    def get_page_by_title(self, space, title):
+        with self._lock:
+            return self.pages.get(title)
+
+    def post(self, path, data):
+        # creating a page.
+        with self._lock:
+            page = {'id': str(next(self._ids)), 'title': data['title'], 'status': 'current'}
+            self.pages[data['title']] = page
+        return page
+
+
+def measure(fn: Callable[[], None], repeat: int) -> float:
+    """Returns the best time of `repeat` runs of `fn`, silencing its output."""
+    best = float("inf")
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_convert_page(paths: List[str], repeat: int) -> float:
+    def convert_all():
+        for path in paths:
+            convert_page(path)
+
+    return measure(convert_all, repeat)
+
+
+def bench_parser(paths: List[str], repeat: int) -> float:
+    # pandoc runs once up front; only rendering is timed.
+    docs = []
+    for path in paths:
+        with open(path) as f:
+            docs.append(pandoc.read(source=preprocess_page(f.read()), format=PANDOC_FORMAT))
+
+    def render_all():
+        for doc in docs:
+            render_doc(doc)
+
+    return measure(render_all, repeat)
+
+
+def bench_export(corpus_dir: str, repeat: int, jobs: int, latency: Optional[float] = None) -> float:
+    def export(conf_url: str):
+        run_export_to_conf.run(corpus_dir, "token", "email", conf_url, "BENCH", False, jobs=jobs)
+
+    def export_in_memory():
+        client = InMemoryConfluence()
+        original = run_export_to_conf.pooled_client
+        run_export_to_conf.pooled_client = lambda *args, **kwargs: client
+        try:
+            export("https://example.atlassian.net")
+        finally:
+            run_export_to_conf.pooled_client = original
+
+    def export_over_http():
+        # a new space every run, so that every run creates all pages.
+        with LocalConfluence(Faults(latency=latency)) as confluence:
+            export(confluence.url)
+
+    return measure(export_in_memory if latency is None else export_over_http, repeat)
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    config = pandoc.configure(read=True) or pandoc.configure(auto=True, read=True)
+    return {
+        'commit': commit,
+        'date': datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'pandoc': config['version'],
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run_benchmarks(profiles: List[str], seed: int, repeat: int, jobs: int, export: bool,
+                   latency: Optional[float] = None) -> dict:
+    results = []
+    for name in profiles:
+        with tempfile.TemporaryDirectory() as out_dir:
+            corpus_dir = os.path.join(out_dir, name)
+            paths = generate_corpus(corpus_dir, PROFILES[name], seed)
+            size = sum(os.path.getsize(path) for path in paths)
+            benchmarks = {
+                'convert_page': lambda: bench_convert_page(paths, repeat),
+                'parser': lambda: bench_parser(paths, repeat),
+            }
+            if export:
+                benchmarks['export' if latency is None else 'export_http'] = \
+                    lambda: bench_export(corpus_dir, repeat, jobs, latency)
+            for benchmark, fn in benchmarks.items():
+                seconds = fn()
+                result = {
+                    'name': f"{benchmark}/{name}",
+                    'docs': len(paths),
+                    'bytes': size,
+                    'seconds': round(seconds, 4),
+                    'docs_per_second': round(len(paths) / seconds, 2),
+                }
+                print(f"{result['name']}: {result['seconds']}s, {result['docs_per_second']} docs/s")
+                results.append(result)
+    return {'environment': environment(), 'results': results}
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """Returns the benchmarks that got slower than `baseline` by more than `threshold`."""
+    before = {result['name']: result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        previous = before.get(result['name'])
+        if previous is None:
+            continue
+        change = result['seconds'] / previous['seconds'] - 1
+        print(f"{result['name']}: {previous['seconds']}s -> {result['seconds']}s ({change:+.0%})")
+        if change > threshold:
+            regressions.append(result['name'])
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark conversion and export on a generated Paper corpus.')
+    parser.add_argument('--profile', action='append', choices=sorted(PROFILES),
+                        help='Corpus to benchmark on. Repeat to run several; all by default.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the corpus generator.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark; the best one counts.')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Conversion processes in the export benchmark.')
+    parser.add_argument('--no_export', action='store_true', help='Skip the full export benchmark.')
+    parser.add_argument('--latency', type=float,
+                        help='Export into a local_services.py Confluence answering after this many seconds, '
+                             'instead of in memory.')
+    parser.add_argument('--out', help='Write the results as JSON to this file.')
+    parser.add_argument('--baseline', help='Results of a previous run to compare with.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Slowdown over the baseline reported as a regression, 0.1 for 10%%.')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.profile or sorted(PROFILES), args.seed, args.repeat, args.jobs, not args.no_export,
+                            args.latency)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
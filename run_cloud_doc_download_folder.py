@@ -1,59 +1,217 @@
 import os.path
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 import dropbox
-from dropbox.files import FileMetadata
+from dropbox.exceptions import ApiError
+from dropbox.files import DeletedMetadata, FileMetadata, ListFolderContinueError
 from dropbox.users import FullAccount
 import argparse
 
-def get_namespace_id(dbx_token: str) -> str:
-    client = dropbox.Dropbox(dbx_token)
+from corpus_store import CorpusStore
+from rate_limit import dropbox_limiter
+from sync_state import SyncState
+
+
+def dropbox_client(dbx_token: str, dbx_url: Optional[str] = None, **kwargs) -> dropbox.Dropbox:
+    """A Dropbox client, talking to the local_services.py stand-in at `dbx_url` if given."""
+    session = None
+    if dbx_url:
+        # the stand-ins are only imported when used, they are not part of the scripts.
+        from local_services import redirect_session
+        session = redirect_session(dbx_url)
+    return dropbox.Dropbox(dbx_token, session=session, **kwargs)
+
+
+def get_namespace_id(dbx_token: str, dbx_url: Optional[str] = None) -> str:
+    client = dropbox_client(dbx_token, dbx_url)
     account = client.users_get_current_account()
     assert isinstance(account, FullAccount)
     return account.root_info.root_namespace_id
 
 
-def walk(folder_path: str, out_dir: str, dbx_token: str, dry_run=True):
-    os.makedirs(out_dir, exist_ok=True)
+def walk(folder_path: str, out_dir: Optional[str], dbx_token: str, dry_run=True, jobs: int = 8,
+         sync_state_path: Optional[str] = None, dbx_url: Optional[str] = None, store_path: Optional[str] = None):
+    """
+    Downloads the Paper docs under `folder_path` into `out_dir`, or with `store_path`,
+    into the corpus store at that path, along with their rev and content hash.
+
+    Without `sync_state_path`, docs that were downloaded before are skipped. With it, the
+    listing cursor and the rev of every doc are saved there, and later runs only list
+    what changed since, download new and edited docs, and report deleted ones. When
+    Dropbox resets the cursor, the whole folder is listed again and docs are skipped by
+    their rev.
+    """
+    if store_path:
+        # a dry run only reads the store, to tell which docs it has already.
+        if not dry_run:
+            store = CorpusStore(store_path)
+        elif os.path.exists(store_path):
+            store = CorpusStore(store_path, read_only=True)
+        else:
+            store = None
+    else:
+        store = None
+        os.makedirs(out_dir, exist_ok=True)
+    sync_state = SyncState.load(sync_state_path, folder_path) if sync_state_path else None
 
-    namespace_id = get_namespace_id(dbx_token)
+    namespace_id = get_namespace_id(dbx_token, dbx_url)
 
     headers = {
         "Dropbox-API-Path-Root": f'{{".tag": "namespace_id", "namespace_id": "{namespace_id}"}}'
     }
-    client = dropbox.Dropbox(dbx_token, headers=headers)
-    result = client.files_list_folder(folder_path, recursive=True)
-
-    while True:
-        for entry in result.entries:
-            if not isinstance(entry, FileMetadata):
-                continue
-            if not entry.name.endswith(".paper"):
-                continue
-
-            file_path = entry.path_display
-            out_file_path = out_dir + file_path
-
-            if os.path.exists(out_file_path):
-                print(f"{file_path}: skipped; already exists")
-                continue
-
-            os.makedirs(os.path.dirname(out_file_path), exist_ok=True)
-            if dry_run:
-                print(f"{file_path}: will download")
+    # Errors are retried by the shared limiter, not by the client, so all threads back off together.
+    client = dropbox_client(dbx_token, dbx_url, headers=headers, max_retries_on_error=0, max_retries_on_rate_limit=0)
+    backoff = dropbox_limiter()
+
+    status = {
+        'downloaded': 0,
+        'skipped': 0,
+        'failed': [],
+        'deleted': [],
+    }
+    status_lock = threading.Lock()
+
+    def export(out_file_path: Optional[str], entry: FileMetadata):
+        file_path = entry.path_display
+        try:
+            if store is not None:
+                _, response = backoff.call(client.files_export, file_path, export_format="markdown")
+                store.put(file_path, entry.rev, entry.content_hash, response.content)
             else:
-                client.files_export_to_file(out_file_path, file_path, export_format="markdown")
-                print(f"{file_path}: downloaded")
+                backoff.call(client.files_export_to_file, out_file_path, file_path, export_format="markdown")
+        except Exception as e:
+            print(f"{file_path}: failed; {e!r}")
+            with status_lock:
+                status['failed'].append(file_path)
+            return
+        print(f"{file_path}: downloaded")
+        with status_lock:
+            status['downloaded'] += 1
+            if sync_state:
+                sync_state.record(entry)
+
+    # Listing runs on this thread and feeds exports to the pool. The semaphore bounds the
+    # number of queued exports, so listing a huge folder doesn't run far ahead.
+    slots = threading.BoundedSemaphore(jobs * 4)
+
+    def release(_):
+        slots.release()
+
+    def delete(path_lower: str):
+        deleted = sync_state.entries[path_lower]['path_display']
+        print(f"{deleted}: deleted in Dropbox")
+        status['deleted'].append(deleted)
+        if not dry_run:
+            with status_lock:
+                sync_state.forget(path_lower)
+            if store is not None:
+                store.forget(deleted)
+
+    def list_changes():
+        if sync_state and sync_state.cursor:
+            try:
+                return backoff.call(client.files_list_folder_continue, sync_state.cursor)
+            except ApiError as e:
+                if not (isinstance(e.error, ListFolderContinueError) and e.error.is_reset()):
+                    raise
+                print(f"Dropbox reset the saved cursor, listing {folder_path} from scratch")
+                sync_state.cursor = None
+        return backoff.call(client.files_list_folder, folder_path, recursive=True)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        result = list_changes()
+        # a listing from scratch has no deleted entries, so the docs it doesn't list are
+        # the deleted ones.
+        listed = set() if sync_state and not sync_state.cursor else None
+
+        while True:
+            for entry in result.entries:
+                if isinstance(entry, DeletedMetadata) and sync_state:
+                    # a deleted folder takes all the docs under it.
+                    for path_lower in list(sync_state.entries):
+                        if path_lower == entry.path_lower or path_lower.startswith(entry.path_lower + "/"):
+                            delete(path_lower)
+                    continue
+                if not isinstance(entry, FileMetadata):
+                    continue
+                if not entry.name.endswith(".paper"):
+                    continue
+                if listed is not None:
+                    listed.add(entry.path_lower)
+
+                file_path = entry.path_display
+                if store_path:
+                    out_file_path = None
+                    exists = store is not None and store.get(file_path) is not None
+                else:
+                    out_file_path = out_dir + file_path
+                    exists = os.path.exists(out_file_path)
+
+                if sync_state:
+                    if sync_state.is_unchanged(entry) and exists:
+                        print(f"{file_path}: skipped; unchanged")
+                        status['skipped'] += 1
+                        continue
+                elif exists:
+                    print(f"{file_path}: skipped; already exists")
+                    status['skipped'] += 1
+                    continue
+
+                if out_file_path:
+                    os.makedirs(os.path.dirname(out_file_path), exist_ok=True)
+                if dry_run:
+                    print(f"{file_path}: will download")
+                else:
+                    slots.acquire()
+                    executor.submit(export, out_file_path, entry).add_done_callback(release)
+
+            if not result.has_more:
+                break
+
+            result = backoff.call(client.files_list_folder_continue, result.cursor)
+
+        if listed is not None:
+            for path_lower in list(sync_state.entries):
+                if path_lower not in listed:
+                    delete(path_lower)
+
+    if sync_state and not dry_run:
+        # Keep the old cursor when a download failed, so that the next run lists the
+        # failed doc again. Docs downloaded this time are skipped by their rev.
+        if not status['failed']:
+            sync_state.cursor = result.cursor
+        sync_state.save()
+    if store is not None:
+        store.close()
 
-        if not result.has_more:
-            break
+    if not dry_run:
+        print("".join(["-"] * 20))
+        print(f"Summary: downloaded {status['downloaded']}, skipped {status['skipped']}, failed {len(status['failed'])}")
+        for file_path in status['failed']:
+            print(f"{file_path}")
+        if sync_state:
+            print(f"Deleted in Dropbox: {len(status['deleted'])}")
+            for file_path in status['deleted']:
+                print(f"{file_path}")
 
-        result = client.files_list_folder_continue(result.cursor)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Download Paper docs from a folder.')
     parser.add_argument('--path', required=True, help='relative path from Dropbox root.')
-    parser.add_argument('--out', required=True, help='Output path')
+    parser.add_argument('--out', help='Output path')
     parser.add_argument('--dbx_token', required=True, help='Dropbox Access Token. You can get it from https://dropbox.github.io/dropbox-api-v2-explorer/#files_list_folder.')
     parser.add_argument('--commit', action='store_true', help='Actually download the file.')
+    parser.add_argument('--jobs', type=int, default=8, help='Number of docs downloaded concurrently.')
+    parser.add_argument('--sync_state', help='Path to a file keeping the sync state. Runs with the same file only '
+                                             'download docs added or edited since the last run.')
+    parser.add_argument('--store', help='Path to a single file to download the docs into, instead of a folder '
+                                        'of files. run_export_to_conf.py --store reads docs from it.')
+    parser.add_argument('--dbx_url', help='URL of a local_services.py Dropbox stand-in to download from instead of Dropbox.')
     args = parser.parse_args()
-    walk(args.path, os.path.expanduser(args.out), args.dbx_token, dry_run=not args.commit)
\ No newline at end of file
+    if bool(args.out) == bool(args.store):
+        parser.error("pass one of --out and --store")
+    walk(args.path, os.path.expanduser(args.out) if args.out else None, args.dbx_token, dry_run=not args.commit,
+         jobs=args.jobs, sync_state_path=os.path.expanduser(args.sync_state) if args.sync_state else None,
+         dbx_url=args.dbx_url, store_path=os.path.expanduser(args.store) if args.store else None)
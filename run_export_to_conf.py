@@ -1,169 +1,551 @@
+import functools
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from atlassian import confluence
-from writer import convert_page
+from async_confluence import pooled_client
+from attachments import Image, ImageStore, attach_images, image_urls, upload_images
+from conversion_cache import ConversionCache
+from corpus_store import CorpusStore
+from doc_links import LinkIndex
+from folder_watch import FolderWatcher
+from convert_stage import convert_pages
+from manifest import BODY_HASH_PROPERTY, Manifest, ManifestEntry, hash_body
+from metrics import METRICS, Progress
+from migration_plan import CREATE, DEFAULT_CALL_SECONDS, SKIP, UPDATE, MigrationPlan, PlannedPage
+from page_tree import PageNode, PageTree, doc_title, scan
+from title_index import TitleIndex
+from uploader import PageTask, create_pages
 import argparse
 from shutil import which
 import sys
 import subprocess
-from typing import Optional
+from typing import Collection, Dict, List, Optional, Union
 from urllib.error import HTTPError
 
 
-def run(in_dir: str, conf_api_token: str, conf_email: str, conf_url: str, conf_space_key: str, new_on_duplicate: bool):
+def update_page(client: confluence.Confluence, entry: ManifestEntry, body: str, parent_page_id: Optional[str]) -> int:
+    """
+    Puts `body` as the next version of the page in `entry`, and returns the new version.
+    """
+    data = {
+        "id": entry.page_id,
+        "type": "page",
+        "title": entry.title,
+        "version": {"number": entry.version + 1},
+        "body": {"storage": {"value": body, "representation": "storage"}},
+    }
+    if parent_page_id:
+        data["ancestors"] = [{"type": "page", "id": parent_page_id}]
+    try:
+        response = client.put(f"rest/api/content/{entry.page_id}", data=data)
+    except confluence.HTTPError as e:
+        if e.response.status_code != 409:
+            raise
+        # the page was edited since our last upload, so our version number is stale.
+        response = client.update_page(entry.page_id, entry.title, body, parent_id=parent_page_id, always_update=True)
+    return response['version']['number']
+
+
+def create_page(client: confluence.Confluence, space: str, title: str, body: str, parent_page_id: Optional[str],
+                store_hash: bool = True) -> str:
+    """
+    Creates a page in the v2 editor, and returns its id. With `store_hash`, the hash of
+    `body` is stored on the page along with it, for later runs to tell whether the page
+    needs updating.
+    """
+    properties = {"editor": {"value": "v2"}}
+    if store_hash:
+        properties[BODY_HASH_PROPERTY] = {"value": hash_body(body)}
+    data = {
+        "type": "page",
+        "title": title,
+        "space": {"key": space},
+        "body": {"storage": {"value": body, "representation": "storage"}},
+        "metadata": {"properties": properties},
+    }
+    if parent_page_id:
+        data["ancestors"] = [{"type": "page", "id": parent_page_id}]
+    return client.post("rest/api/content/", data=data)['id']
+
+
+def store_body_hash(client: confluence.Confluence, page_id: str, content_hash: str,
+                    property_version: Optional[int] = None):
+    """
+    Stores `content_hash` as the body hash of a page that was just updated. The current
+    version of the property is looked up unless given; version 0 means the page has none.
+    """
+    url = f"rest/api/content/{page_id}/property/{BODY_HASH_PROPERTY}"
+    if property_version is None:
+        try:
+            property_version = client.get(url)['version']['number']
+        except confluence.HTTPError as e:
+            if e.response.status_code != 404:
+                raise
+            property_version = 0
+    # version 1 creates the property.
+    client.put(url, data={"key": BODY_HASH_PROPERTY, "value": content_hash, "version": {"number": property_version + 1}})
+
+
+def read_tree(in_dir: str, store_path: Optional[str] = None) -> PageTree:
+    """The pages of the folder `in_dir`, or of the folder of that path in the corpus store."""
+    if store_path is None:
+        return scan(in_dir)
+    if not os.path.exists(store_path):
+        raise FileNotFoundError(f"No corpus store at {store_path}")
+    with CorpusStore(store_path) as store:
+        return store.tree(in_dir)
+
+
+def convert_docs(doc_paths: List[str], jobs: int, cache_path: Optional[str] = None,
+                 cache_max_bytes: Optional[int] = None, store_path: Optional[str] = None) -> Dict[str, Union[str, Exception]]:
+    """
+    Converts `doc_paths` on `jobs` processes, and maps each path to its body, or to the
+    exception that stopped its conversion. Bodies converted by a previous run of the same
+    converter are read from the cache, and docs from the corpus store if given.
+    """
+    cache = None
+    if cache_path:
+        cache = ConversionCache(cache_path, cache_max_bytes) if cache_max_bytes else ConversionCache(cache_path)
+    bodies = {}
+    progress = Progress(len(doc_paths), "docs") if METRICS.enabled else None
+    with METRICS.phase("stage.convert"):
+        for path, body in convert_pages(doc_paths, jobs, cache, store_path):
+            bodies[path] = body
+            if progress:
+                progress.advance()
+    if cache:
+        print(cache.stats.summary())
+        cache.close()
+        METRICS.count("cache.hits", cache.stats.hits)
+        METRICS.count("cache.misses", cache.stats.misses)
+    return bodies
+
+
+def run(in_dir: str, conf_api_token: str, conf_email: str, conf_url: str, conf_space_key: str, new_on_duplicate: bool,
+        jobs: int = 1, upload_workers: int = 8, manifest_path: Optional[str] = None, cache_path: Optional[str] = None,
+        cache_max_bytes: Optional[int] = None, metrics_path: Optional[str] = None, update_existing: bool = False,
+        store_path: Optional[str] = None, attachments_path: Optional[str] = None,
+        paths: Optional[Collection[str]] = None, bodies: Optional[Dict[str, Union[str, Exception]]] = None,
+        client: Optional[confluence.Confluence] = None, title_index: Optional[TitleIndex] = None):
+    """
+    Uploads the docs under `in_dir` to a space, as a tree of pages like the folders. With
+    `store_path`, `in_dir` is a Dropbox folder whose docs are read from that corpus store.
+    With `attachments_path`, images are fetched into the image store at that path and
+    attached to their pages, instead of linking to where Paper hosts them.
+
+    Pages whose title is already taken in the space are skipped, or with
+    `new_on_duplicate` created as a "Conflicted Copy". With `update_existing` they are
+    updated instead, but only if the body changed since it was last uploaded, going by
+    the body hash stored on every uploaded page.
+
+    Links between docs are rewritten to links between their pages in a second pass, once
+    all pages exist.
+
+    To export again after some docs changed, watch() passes the changed `paths`, and keeps
+    the `bodies` of the docs it converted, the `client` and the `title_index` between
+    runs. Only the pages of `paths` and the folders above them are exported then.
+    """
+    if metrics_path:
+        METRICS.enable()
+
+    # The folder is listed once; titles, conversion and upload all read that listing.
+    tree = read_tree(in_dir, store_path)
     # check all page names are unique
-    pages = {}
-    for dir, dir_names, path_names in os.walk(in_dir):
-        for subdir in dir_names:
-            full_path = os.path.join(dir, subdir)
-
-            if subdir in pages:
-                raise AssertionError(f"{subdir} duplicates: {full_path} and {pages[subdir]}")
-
-            pages[subdir] = full_path
-
-        for file in path_names:
-            if not file.endswith(".paper") and not file.endswith(".md"):
-                continue
-            if file.endswith(".paper"):
-                name = file.removesuffix(".paper")
-            else:
-                name = file.removesuffix(".md")
-
-            if name == os.path.basename(dir):
-                continue
-
-            full_path = os.path.join(dir, file)
-
-            if name in pages:
-                raise AssertionError(f"{name} duplicates: {full_path} and {pages[name]}")
-
-            pages[name] = full_path
-    if not pages:
+    if not tree.check_titles():
         raise Exception("Found no docs to migrate")
-
-    client = confluence.Confluence(url=conf_url,
-                                   username=conf_email,
-                                   password=conf_api_token,
-                                   cloud=True)
+    # the pages to export, by path: all of them, or those of `paths` and the folders above.
+    exported = tree.affected(paths) if paths is not None else None
+
+    def is_exported(node: PageNode) -> bool:
+        return exported is None or node.path in exported
+
+    # docs to convert, in the same order the upload below visits them.
+    doc_paths = [node.index_path if node.is_dir else node.path
+                 for folder in tree.folders() for node in folder.children
+                 if is_exported(node) and (node.has_index or not node.is_dir)]
+
+    # convert all docs up front on a process pool, so the upload below only talks to confluence.
+    if bodies is None:
+        bodies = {}
+    bodies.update(convert_docs([path for path in doc_paths if path not in bodies], jobs, cache_path, cache_max_bytes,
+                               store_path))
+    for folder in tree.folders():
+        if folder is not tree.root and is_exported(folder) and folder.has_index \
+                and isinstance(bodies[folder.index_path], Exception):
+            raise Exception(f"Cannot convert {folder.index_path}, the content of its parent page") \
+                from bodies[folder.index_path]
+
+    # The images of all docs are fetched up front, each url once, and every page gets the
+    # images it shows as attachments, by the key of its task.
+    image_store = ImageStore(attachments_path) if attachments_path else None
+    page_images: Dict[str, Dict[str, Image]] = {}
+    if image_store:
+        with METRICS.phase("stage.images"):
+            image_store.fetch((url for path in doc_paths if isinstance(bodies[path], str)
+                               for url in image_urls(bodies[path])), workers=upload_workers)
+        print(image_store.stats.summary())
+        for folder in tree.folders():
+            for node in folder.children:
+                doc_path = node.index_path if node.is_dir else node.path
+                if doc_path is not None and is_exported(node) and isinstance(bodies[doc_path], str):
+                    bodies[doc_path], page_images[node.path] = attach_images(bodies[doc_path], image_store)
+
+    # Upload threads share one pool of keep-alive connections.
+    if client is None:
+        client = pooled_client(conf_url, conf_email, conf_api_token, max_connections=upload_workers)
 
     # export the files to confluence, and organize them in the same structure as the folder.
 
-    # A map from path (both directories and files) to page id.
-    # We will walk the folder in DFS manner. When a file is processed, the page corresponds to
-    # its parent folder is guaranteed created. We can use its page id in calling create_page().
-    #
-    # The root directory page id is set to None. This plays nicely with create_page() because
-    # when parent_id is None, the page will be created without any parent pages.
-    page_ids = {
-        os.path.basename(in_dir.removesuffix("/")): None
-    }
-
-    def find_unique_title(title: str) -> str:
-        candidate = title
-        count = 0
-        while count < 100:
-            if not client.page_exists(conf_space_key, candidate):
-                return candidate
-            elif client.get_page_by_title(conf_space_key, candidate)['status'] == 'archived':
-                return candidate
-            else:
-                candidate = f"{title} (Conflicted Copy {count})"
-                count += 1
-
-        raise Exception("Exhausted search")
+    # Titles in the space are fetched once, and looked up locally from then on. The fetch
+    # is deferred until a page needs creating, so a rerun over an unchanged tree makes no
+    # network calls at all.
+    title_index_lock = threading.Lock()
+
+    def get_title_index() -> TitleIndex:
+        nonlocal title_index
+        with title_index_lock:
+            if title_index is None:
+                with METRICS.phase("title_index.fetch"):
+                    title_index = TitleIndex.fetch(client, conf_space_key)
+                print(f"Found {len(title_index)} pages in space {conf_space_key}")
+            return title_index
+
+    # Records the page of every uploaded path, so that a rerun skips unchanged docs and
+    # updates changed ones in place.
+    manifest = Manifest(manifest_path, conf_space_key) if manifest_path else None
+
+    def find_existing_page_id(title: str) -> str:
+        title_index = get_title_index()
+        page = title_index.get(title)
+        if page is None or page['id'] is None:
+            # created by someone else after the index was fetched.
+            with METRICS.phase("title_lookup"):
+                page_id = client.get_page_by_title(conf_space_key, title)['id']
+            title_index.add(title, page_id)
+            return page_id
+        return page['id']
 
     status = {
         'skipped_dir': [],
         'skipped_file': [],
+        'failed_images': [],
+        'failed_links': [],
     }
-
-    for dir, dir_names, path_names in os.walk(in_dir):
-        parent_dir_name = os.path.basename(dir)
-        parent_page_id = page_ids[parent_dir_name]
-
+    # the reason of skipping a file, if it's an exception.
+    errors = {}
+    # pages are created from several threads, guard status and errors with a lock.
+    status_lock = threading.Lock()
+
+    def attach(path: str, page_id: str, new_page: bool) -> bool:
+        """
+        Uploads the images of the page of `path`. A failed upload leaves the page without
+        them, and returns False.
+        """
+        if not page_images.get(path):
+            return True
+        try:
+            with METRICS.phase("upload_images", path):
+                upload_images(client, page_id, page_images[path], image_store, new_page)
+        except confluence.HTTPError as e:
+            print(f"Failed to attach the images of {path} due to error: {e}.")
+            with status_lock:
+                status['failed_images'].append(path)
+            return False
+        return True
+
+    def attach_created(path: str, page_id: str, body: str) -> bool:
+        """
+        Uploads the images of a page created without its body hash, then stores the hash.
+        A page missing its images keeps no hash, so the next run updates it.
+        """
+        if not page_images.get(path):
+            return True
+        if not attach(path, page_id, new_page=True):
+            return False
+        try:
+            store_body_hash(client, page_id, hash_body(body), 0)
+        except confluence.HTTPError as e:
+            print(f"Failed to store the body hash of {path} due to error: {e}.")
+            return False
+        return True
+
+    # The title of every page the run found or wrote, by task key, and the pages written
+    # by this run, whose links to other docs the second pass rewrites.
+    page_titles: Dict[str, str] = {}
+    written: Dict[str, ManifestEntry] = {}
+
+    def sync_page(path: str, body: str, parent_page_id: Optional[str]) -> Optional[str]:
+        """
+        Brings the page of an already uploaded path up to date. Returns its page id, or
+        None if the path has no page yet and needs creating.
+        """
+        entry = manifest.get(path) if manifest else None
+        if entry is None:
+            return None
+
+        page_titles[path] = entry.title
+        content_hash = hash_body(body)
+        if entry.content_hash == content_hash:
+            print(f"Skipping {entry.title} since it is unchanged")
+            return entry.page_id
+
+        try:
+            with METRICS.phase("update_page", path):
+                version = update_page(client, entry, body, parent_page_id)
+        except confluence.HTTPError as e:
+            if e.response.status_code != 404:
+                raise
+            print(f"Recreating {entry.title} since its page was deleted")
+            manifest.forget(path)
+            return None
+        attached = attach(path, entry.page_id, new_page=False)
+        if attached:
+            store_body_hash(client, entry.page_id, content_hash)
+        record(path, entry.page_id, entry.title, body, version, attached=attached)
+        print(f"updated {entry.title}")
+        return entry.page_id
+
+    def record(path: str, page_id: str, title: str, body: str, version: int = 1, changed: bool = True,
+               attached: bool = True):
+        # a page missing its images is recorded without a hash, so the next run updates it
+        # and uploads them again.
+        content_hash = hash_body(body) if attached else ""
+        page_titles[path] = title
+        if changed:
+            written[path] = ManifestEntry(page_id, title, content_hash, version)
+        if manifest:
+            manifest.record(path, page_id, title, content_hash, version)
+
+    def update_existing_page(path: str, title: str, body: str, parent_page_id: Optional[str]) -> str:
+        """
+        Brings a page that already has the title of `path` up to date, and returns its id.
+        It is only updated when the body hash stored on it differs from the hash of `body`.
+        """
+        page = get_title_index().get(title)
+        if page['id'] is None or 'version' not in page:
+            # created by someone else after the index was fetched, so left alone.
+            return find_existing_page_id(title)
+
+        content_hash = hash_body(body)
+        if page.get('body_hash') == content_hash:
+            print(f"Skipping {title} since it is unchanged")
+            record(path, page['id'], title, body, page['version'], changed=False)
+            return page['id']
+
+        with METRICS.phase("update_page", path):
+            version = update_page(client, ManifestEntry(page['id'], title, content_hash, page['version']), body,
+                                  parent_page_id)
+        attached = attach(path, page['id'], new_page=False)
+        if attached:
+            store_body_hash(client, page['id'], content_hash, page.get('body_hash_version', 0))
+        record(path, page['id'], title, body, version, attached=attached)
+        print(f"updated {title}")
+        return page['id']
+
+    def create_dir_page(dir_path: str, subdir: str, index_file_path: Optional[str], parent_page_id: Optional[str]) -> str:
         # if there is file directly under the folder that shares the same name,
         # uses its content.
-        for subdir in dir_names:
-            index_file_path = os.path.join(dir, subdir, subdir) + ".paper"
-
-            body = ""
-            if os.path.exists(index_file_path):
-                body = convert_page(index_file_path)
-
-            if new_on_duplicate:
-                title = find_unique_title(subdir)
-            else:
-                title = subdir
-            page_id = None
-            while page_id is None:
+        body = bodies.get(index_file_path, "")
+
+        try:
+            page_id = sync_page(dir_path, body, parent_page_id)
+        except confluence.HTTPError as e:
+            print(f"Failed to update parent page: {subdir} due to error: {e}.")
+            page_id = manifest.get(dir_path).page_id
+        if page_id is not None:
+            return page_id
+
+        title_index = get_title_index()
+        if new_on_duplicate:
+            title = title_index.reserve_unique_title(subdir)
+        else:
+            title = subdir
+            if title_index.is_taken(title) and update_existing:
                 try:
-                    page_id = client.create_page(
-                        space=conf_space_key,
-                        title=title,
-                        body=body,
-                        parent_id=parent_page_id,
-                        representation="storage",
-                        editor="v2",
-                    )
+                    return update_existing_page(dir_path, title, body, parent_page_id)
                 except confluence.HTTPError as e:
-                    if "already exists" in e.response.content.decode('utf-8') and not new_on_duplicate:
-                        page_id = client.get_page_by_title(conf_space_key, title)['id']
-                        print(f"Finding an existing parent page for: {title}")
-                    else:
-                        print(f"Skpping parent page: {title} due to error: {e}.")
-                        status['skipped_dir'].append(title)
-                        continue
-
-            page_ids[subdir] = page_id
-
-        for path_name in path_names:
-            full_path = os.path.join(dir, path_name)
-
-            if not path_name.endswith(".paper") and not path_name.endswith(".md"):
-                print(f"Skipping {path_name} becuase it doesn't have the right extension. .paper or .md")
-                if path_name != ".DS_Store":
+                    print(f"Failed to update parent page: {title} due to error: {e}.")
+                    return find_existing_page_id(title)
+            if title_index.is_taken(title):
+                print(f"Finding an existing parent page for: {title}")
+                return find_existing_page_id(title)
+        # Throttling and server errors were already retried with backoff by the client's
+        # rate limiter, so an error here is final. Raising skips the folder's subtree.
+        try:
+            with METRICS.phase("create_page", dir_path):
+                page_id = create_page(client, conf_space_key, title, body, parent_page_id,
+                                      store_hash=not page_images.get(dir_path))
+        except confluence.HTTPError as e:
+            if "already exists" in e.response.content.decode('utf-8') and not new_on_duplicate:
+                page_id = find_existing_page_id(title)
+                print(f"Finding an existing parent page for: {title}")
+            else:
+                print(f"Skpping parent page: {title} due to error: {e}.")
+                with status_lock:
+                    status['skipped_dir'].append(title)
+                raise
+        else:
+            record(dir_path, page_id, title, body, attached=attach_created(dir_path, page_id, body))
+
+        title_index.add(title, page_id)
+        return page_id
+
+    def create_file_page(full_path: str, title: str, body: str, parent_page_id: Optional[str]) -> Optional[str]:
+        try:
+            page_id = sync_page(full_path, body, parent_page_id)
+        except confluence.HTTPError as e:
+            print(f"Skipping {title} because we hit a confluence exception {e}")
+            with status_lock:
+                status['skipped_file'].append(full_path)
+            return None
+        if page_id is not None:
+            return page_id
+
+        title_index = get_title_index()
+        if new_on_duplicate:
+            new_title = title_index.reserve_unique_title(title)
+        elif title_index.is_taken(title) and update_existing:
+            try:
+                return update_existing_page(full_path, title, body, parent_page_id)
+            except confluence.HTTPError as e:
+                print(f"Skipping {title} because we hit a confluence exception {e}")
+                with status_lock:
                     status['skipped_file'].append(full_path)
-                continue
-
-            if path_name.endswith(".paper"):
-                title = path_name.removesuffix(".paper")
+                return None
+        elif title_index.is_taken(title):
+            print(f"Skipping {title} since it already exists")
+            with status_lock:
+                status['skipped_file'].append(full_path)
+            return None
+        else:
+            new_title = title
+
+        try:
+            with METRICS.phase("create_page", full_path):
+                page_id = create_page(client, conf_space_key, new_title, body, parent_page_id,
+                                      store_hash=not page_images.get(full_path))
+            title_index.add(new_title, page_id)
+            record(full_path, page_id, new_title, body, attached=attach_created(full_path, page_id, body))
+            return page_id
+        except confluence.HTTPError as e:
+            if "already exists" in e.response.content.decode('utf-8') and not new_on_duplicate:
+                print(f"Skipping {title} since it already exists")
             else:
-                title = path_name.removesuffix(".md")
+                print(f"Skipping {title} because we hit a confluence exception {e}")
+            with status_lock:
+                status['skipped_file'].append(full_path)
+            return None
 
-            if title == os.path.basename(dir):
+    # Every folder and file becomes a task keyed by its path, whose parent is the task of
+    # its folder. The scheduler creates a page only after its parent page exists, so it
+    # can pass the parent page id to create_page(), and creates siblings concurrently.
+    #
+    # The root directory page id is None. This plays nicely with create_page() because
+    # when parent_id is None, the page will be created without any parent pages.
+    tasks = []
+    for folder in tree.folders():
+        if not is_exported(folder):
+            continue
+        for path in folder.ignored:
+            file_name = os.path.basename(path)
+            title = doc_title(file_name)
+            if title is None:
+                print(f"Skipping {file_name} becuase it doesn't have the right extension. .paper or .md")
+                if file_name != ".DS_Store":
+                    status['skipped_file'].append(path)
+            else:
                 print(f"skipping paper doc {title} because its parent page has the same name")
-                status['skipped_file'].append(full_path)
-                continue
+                status['skipped_file'].append(path)
 
-            print(f"adding {title}")
-            try:
-                body = convert_page(full_path)
-            except Exception as e:
-                print(f"Skipping {title} because it cannot be converted")
-                status['skipped_file'].append(full_path)
+        for node in folder.children:
+            if not is_exported(node):
+                continue
+            if node.is_dir:
+                tasks.append(PageTask(
+                    key=node.path,
+                    parent_key=folder.path,
+                    create=functools.partial(create_dir_page, node.path, node.title, node.index_path),
+                ))
                 continue
 
-            if new_on_duplicate:
-                new_title = find_unique_title(title)
-            else:
-                new_title = title
+            body = bodies[node.path]
+            if isinstance(body, Exception):
+                print(f"Skipping {node.title} because it cannot be converted: {body!r}")
+                status['skipped_file'].append(node.path)
+                errors[node.path] = body
+                continue
 
-            try:
-                client.create_page(
-                    space=conf_space_key,
-                    title=new_title,
-                    body=body,
-                    parent_id=parent_page_id,
-                    representation="storage",
-                    editor="v2",
-                )
-            except confluence.HTTPError as e:
-                if "already exists" in e.response.content.decode('utf-8') and not new_on_duplicate:
-                    print(f"Skipping {title} since it already exists")
-                else:
-                    print(f"Skipping {title} because we hit a confluence exception {e}")
-                status['skipped_file'].append(full_path)
+            print(f"adding {node.title}")
+            tasks.append(PageTask(
+                key=node.path,
+                parent_key=folder.path,
+                create=functools.partial(create_file_page, node.path, node.title, body),
+            ))
+
+    if METRICS.enabled:
+        progress = Progress(len(tasks), "pages")
+        for task in tasks:
+            task.create = functools.partial(create_and_advance, task.create, progress)
+    with METRICS.phase("stage.upload"):
+        page_ids, skipped = create_pages(tasks, root_key=tree.root.path, workers=upload_workers)
+    # report every doc of the subtree of a folder page that failed.
+    nodes = {child.path: child for folder in tree.folders() for child in folder.children}
+    for path, error in skipped.items():
+        node = nodes[path]
+        if node.is_dir:
+            # its own doc is reported with the folder's other ignored files.
+            if node.title not in status['skipped_dir']:
+                status['skipped_dir'].append(node.title)
+            continue
+        status['skipped_file'].append(path)
+        if error is not None:
+            errors[path] = error
+
+    # Second pass: now that every page exists, the pages written above that link to other
+    # docs are updated once to link to their pages. Pages left unchanged were linked by
+    # the run that wrote them.
+    link_index = LinkIndex()
+    links = []
+    for folder in tree.folders():
+        for node in folder.children:
+            if page_ids.get(node.path) is not None:
+                link_index.add(node.title, page_titles.get(node.path, node.title))
+            elif node.path not in page_ids and manifest and manifest.get(node.path):
+                # not exported this time, but uploaded before.
+                link_index.add(node.title, manifest.get(node.path).title)
+    for folder in tree.folders():
+        for node in folder.children:
+            if node.path not in written:
+                continue
+            body, count = link_index.rewrite(bodies.get(node.index_path if node.is_dir else node.path, ""))
+            if count:
+                links.append((node.path, body, count))
+
+    def link_page(path: str, body: str, count: int):
+        entry = written[path]
+        try:
+            with METRICS.phase("link_page", path):
+                version = update_page(client, entry, body, None)
+        except confluence.HTTPError as e:
+            print(f"Failed to link {entry.title} to other pages due to error: {e}.")
+            with status_lock:
+                status['failed_links'].append(path)
+            return
+        # the stored hash stays the one of the body before linking, which later runs
+        # compare the converted doc with.
+        if manifest:
+            manifest.record(path, entry.page_id, entry.title, entry.content_hash, version)
+        print(f"linked {count} docs from {entry.title}")
+
+    with METRICS.phase("stage.links"), ThreadPoolExecutor(max_workers=upload_workers) as executor:
+        list(executor.map(lambda link: link_page(*link), links))
+    if manifest:
+        manifest.close()
+    if image_store:
+        image_store.close()
 
     print("".join(["-"]*20))
     print(f"Summary:")
@@ -172,7 +554,143 @@ def run(in_dir: str, conf_api_token: str, conf_email: str, conf_url: str, conf_s
         print(f"{path_name}")
     print(f"Skipped Files:")
     for path_name in status['skipped_file']:
-        print(f"{path_name}")
+        if path_name in errors:
+            print(f"{path_name}: {errors[path_name]!r}")
+        else:
+            print(f"{path_name}")
+    if status['failed_images']:
+        print(f"Pages missing images:")
+        for path_name in status['failed_images']:
+            print(f"{path_name}")
+    if status['failed_links']:
+        print(f"Pages still linking to Paper:")
+        for path_name in status['failed_links']:
+            print(f"{path_name}")
+
+    if metrics_path:
+        print(METRICS.summary())
+        METRICS.write_report(
+            metrics_path,
+            doc_count=len(doc_paths),
+            skipped_dirs=status['skipped_dir'],
+            skipped_files={path: repr(errors[path]) if path in errors else None for path in status['skipped_file']},
+        )
+        print(f"Wrote metrics to {metrics_path}")
+
+
+def watch(in_dir: str, conf_api_token: str, conf_email: str, conf_url: str, conf_space_key: str,
+          new_on_duplicate: bool, manifest_path: str, jobs: int = 1, upload_workers: int = 8,
+          cache_path: Optional[str] = None, cache_max_bytes: Optional[int] = None, update_existing: bool = False,
+          attachments_path: Optional[str] = None, poll_seconds: float = 1.0, debounce_seconds: float = 2.0,
+          stop: Optional[threading.Event] = None):
+    """
+    Exports `in_dir`, then keeps exporting the docs edited under it until `stop` is set.
+
+    After the first export, every batch of changes only converts the changed docs, in
+    this process, and updates their pages and the folder pages above them. Converted
+    docs, the connection to Confluence and the titles of the space are kept between
+    exports, so a page is updated within seconds of the edit.
+    """
+    client = pooled_client(conf_url, conf_email, conf_api_token, max_connections=upload_workers)
+    title_index = TitleIndex.fetch(client, conf_space_key)
+    print(f"Found {len(title_index)} pages in space {conf_space_key}")
+    bodies: Dict[str, Union[str, Exception]] = {}
+    # the first snapshot is taken before the first export reads the docs, so no edit is missed.
+    watcher = FolderWatcher(in_dir, poll_seconds, debounce_seconds, stop)
+    export = functools.partial(run, in_dir, conf_api_token, conf_email, conf_url, conf_space_key, new_on_duplicate,
+                               upload_workers=upload_workers, manifest_path=manifest_path,
+                               update_existing=update_existing, attachments_path=attachments_path, bodies=bodies,
+                               client=client, title_index=title_index)
+    export(jobs=jobs, cache_path=cache_path, cache_max_bytes=cache_max_bytes)
+
+    while True:
+        print(f"Watching {in_dir} for changes")
+        changed = watcher.wait()
+        if changed is None:
+            return
+        docs = set()
+        for path in sorted(changed):
+            bodies.pop(path, None)
+            if doc_title(os.path.basename(path)) is None:
+                continue
+            if os.path.exists(path):
+                docs.add(path)
+            else:
+                print(f"{path} was deleted, its page is left in Confluence")
+        if not docs:
+            watcher.commit()
+            continue
+
+        start = time.monotonic()
+        try:
+            # a few docs convert faster in this process than on a new pool.
+            export(jobs=1, paths=docs)
+        except Exception as e:
+            # the changes are reported again, and exported with the next ones.
+            print(f"Failed to export {len(docs)} changed docs, retrying: {e!r}")
+            continue
+        watcher.commit()
+        print(f"Exported {len(docs)} changed docs in {time.monotonic() - start:.1f}s")
+
+
+def create_and_advance(create, progress: Progress, parent_page_id: Optional[str]) -> Optional[str]:
+    try:
+        return create(parent_page_id)
+    finally:
+        progress.advance()
+
+
+def plan(in_dir: str, jobs: int = 1, manifest_path: Optional[str] = None, conf_space_key: Optional[str] = None,
+         cache_path: Optional[str] = None, cache_max_bytes: Optional[int] = None,
+         store_path: Optional[str] = None) -> MigrationPlan:
+    """
+    Works out what run() would do with `in_dir` without calling Confluence: converts every
+    doc, and lists the pages to create, or to update or leave alone going by the manifest,
+    along with duplicate titles and the docs that cannot be converted.
+    """
+    tree = read_tree(in_dir, store_path)
+    start = time.monotonic()
+    bodies = convert_docs(tree.doc_paths(), jobs, cache_path, cache_max_bytes, store_path)
+    migration_plan = MigrationPlan(root_key=tree.root.path, duplicates=tree.duplicates(),
+                                   convert_seconds=time.monotonic() - start)
+    # only read, so a missing manifest isn't created.
+    manifest = Manifest(manifest_path, conf_space_key) if manifest_path and os.path.exists(manifest_path) else None
+
+    def action(path: str, body: str) -> str:
+        entry = manifest.get(path) if manifest else None
+        if entry is None:
+            return CREATE
+        return SKIP if entry.content_hash == hash_body(body) else UPDATE
+
+    # pages get the titles of their docs, or the ones they were uploaded with.
+    link_index = LinkIndex()
+    for folder in tree.folders():
+        for node in folder.children:
+            entry = manifest.get(node.path) if manifest else None
+            link_index.add(node.title, entry.title if entry else node.title)
+
+    for folder in tree.folders():
+        for path in folder.ignored:
+            # a folder's index doc becomes the folder page, except the root folder's.
+            if os.path.basename(path) != ".DS_Store" and (path != folder.index_path or folder is tree.root):
+                migration_plan.skipped.append(path)
+        for node in folder.children:
+            if node.is_dir:
+                body = bodies.get(node.index_path, "")
+                if isinstance(body, Exception):
+                    migration_plan.blocking.append(node.index_path)
+                    migration_plan.failures[node.index_path] = repr(body)
+                    body = ""
+            else:
+                body = bodies[node.path]
+                if isinstance(body, Exception):
+                    migration_plan.failures[node.path] = repr(body)
+                    continue
+            migration_plan.pages.append(PlannedPage(node.path, folder.path, node.title, action(node.path, body),
+                                                    len(body.encode('utf-8')), link_index.rewrite(body)[1]))
+    if manifest:
+        manifest.close()
+    return migration_plan
 
 
 def precondition_check() -> Optional[str]:
@@ -191,16 +709,70 @@ def precondition_check() -> Optional[str]:
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Upload a folder of paper markdowns to a confluence space.')
-    parser.add_argument('--path', required=True, help='the local path to a folder that contains paper markdowns.')
-    parser.add_argument('--conf_api_token', required=True, help='Confluence API token. Get it from https://id.atlassian.com/manage-profile/security/api-tokens.')
-    parser.add_argument('--conf_email', required=True, help='Your email address in Confluence.')
-    parser.add_argument('--conf_space_key', required=True, help='Confluence space key.')
+    parser.add_argument('--path', required=True, help='the local path to a folder that contains paper markdowns, or '
+                                                      'with --store, the Dropbox path of a folder in the store.')
+    parser.add_argument('--conf_api_token', help='Confluence API token. Get it from https://id.atlassian.com/manage-profile/security/api-tokens.')
+    parser.add_argument('--conf_email', help='Your email address in Confluence.')
+    parser.add_argument('--conf_space_key', help='Confluence space key.')
     parser.add_argument('--conf_url', help='Confluence URL', default="https://dropbox-kms.atlassian.net")
     parser.add_argument('--new_on_duplicate', help='Whether to create a new page on duplicates', action='store_true')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Number of processes used to convert docs.')
+    parser.add_argument('--upload_workers', type=int, default=8, help='Number of pages created concurrently.')
+    parser.add_argument('--manifest', help='Path to a file recording uploaded pages. Reruns with the same manifest '
+                                           'skip unchanged docs and update changed ones in place.')
+    parser.add_argument('--cache', help='Path to a file caching converted docs. Reruns with the same cache only '
+                                        'convert docs that changed.')
+    parser.add_argument('--cache_size', type=int, default=512, help='Size limit of the cache in MB.')
+    parser.add_argument('--metrics', help='Time every phase, print progress, and write a JSON report of timings '
+                                          'and counters to this file.')
+    parser.add_argument('--update_existing', action='store_true',
+                        help='Update pages whose title already exists in the space, when their content changed.')
+    parser.add_argument('--plan', action='store_true', help='Convert the docs and report the pages, Confluence calls '
+                                                            'and upload time of the export, without uploading.')
+    parser.add_argument('--store', help='Path to a corpus store written by run_cloud_doc_download_folder.py --store '
+                                        'to read the docs from, instead of a local folder.')
+    parser.add_argument('--attachments', help='Path to a file storing the images of the docs. Images are fetched '
+                                              'once into it, then attached to their pages instead of linking to '
+                                              'Paper. Reruns with the same file only fetch new images.')
+    parser.add_argument('--watch', action='store_true', help='After exporting, keep watching the folder and export '
+                                                             'docs as they are edited, until interrupted.')
+    parser.add_argument('--poll_seconds', type=float, default=1.0, help='How often --watch checks the folder.')
+    parser.add_argument('--debounce_seconds', type=float, default=2.0,
+                        help='How long the folder must be quiet after an edit before --watch exports it.')
+    parser.add_argument('--call_seconds', type=float, default=DEFAULT_CALL_SECONDS,
+                        help='Seconds a Confluence call takes, to estimate the upload time with --plan.')
     args = parser.parse_args()
-
+    if not args.plan and not (args.conf_api_token and args.conf_email and args.conf_space_key):
+        parser.error("--conf_api_token, --conf_email and --conf_space_key are required to upload")
+    if args.update_existing and args.new_on_duplicate:
+        parser.error("--update_existing and --new_on_duplicate cannot be used together")
+    if args.plan and args.manifest and not args.conf_space_key:
+        parser.error("--conf_space_key is required to plan with a manifest")
+    if args.watch and (args.plan or args.store or not args.manifest):
+        parser.error("--watch needs --manifest, and works on a local folder without --plan")
+
+    # a Dropbox path when reading from a store.
+    in_dir = args.path if args.store else os.path.expanduser(args.path)
+    store_path = os.path.expanduser(args.store) if args.store else None
     precondition_result = precondition_check()
     if precondition_result:
         print(precondition_result)
+    elif args.plan:
+        migration_plan = plan(in_dir, args.jobs, args.manifest, args.conf_space_key, args.cache,
+                              args.cache_size * 1024 * 1024, store_path)
+        print("".join(["-"]*20))
+        print(migration_plan.summary(args.upload_workers, args.call_seconds))
+    elif args.watch:
+        try:
+            watch(in_dir, args.conf_api_token, args.conf_email, args.conf_url, args.conf_space_key,
+                  args.new_on_duplicate, args.manifest, args.jobs, args.upload_workers, args.cache,
+                  args.cache_size * 1024 * 1024, args.update_existing,
+                  os.path.expanduser(args.attachments) if args.attachments else None, args.poll_seconds,
+                  args.debounce_seconds)
+        except KeyboardInterrupt:
+            print("Stopped watching")
     else:
-        run(os.path.expanduser(args.path), args.conf_api_token, args.conf_email, args.conf_url, args.conf_space_key, args.new_on_duplicate)
+        run(in_dir, args.conf_api_token, args.conf_email, args.conf_url, args.conf_space_key, args.new_on_duplicate,
+            args.jobs, args.upload_workers, args.manifest, args.cache, args.cache_size * 1024 * 1024,
+            args.metrics, args.update_existing, store_path,
+            os.path.expanduser(args.attachments) if args.attachments else None)
@@ -0,0 +1,280 @@
+import posixpath
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Set, Union
+
+from atlassian import confluence
+from dropbox.files import FileMetadata
+import argparse
+
+from async_confluence import pooled_client
+from pandoc_batch import BatchConverter
+from rate_limit import dropbox_limiter
+from run_cloud_doc_download_folder import dropbox_client, get_namespace_id
+from run_export_to_conf import precondition_check
+from title_index import TitleIndex
+
+# Marks the end of a queue.
+DONE = object()
+
+
+def iter_queue(q: queue.Queue) -> Iterator:
+    while True:
+        item = q.get()
+        if item is DONE:
+            return
+        yield item
+
+
+def migrate(folder_path: str, dbx_token: str, conf_api_token: str, conf_email: str, conf_url: str, conf_space_key: str,
+            new_on_duplicate: bool, download_workers: int = 8, convert_workers: int = 2, upload_workers: int = 8,
+            batch_size: int = 8, queue_size: int = 32, dbx_url: Optional[str] = None):
+    """
+    Migrates the Paper docs under a Dropbox folder to a Confluence space without writing
+    them to disk.
+
+    Listing, downloading, converting and uploading run at the same time, connected by
+    queues of at most `queue_size` docs, so a slow stage holds back the ones before it
+    instead of piling docs up in memory. Folders become pages the first time a doc under
+    them is uploaded, and a doc named after its folder becomes that folder page's body,
+    like run_export_to_conf.py does for a downloaded tree.
+    """
+    folder_path = folder_path.rstrip("/")
+    root_title = posixpath.basename(folder_path)
+    start = time.monotonic()
+
+    namespace_id = get_namespace_id(dbx_token, dbx_url)
+    headers = {
+        "Dropbox-API-Path-Root": f'{{".tag": "namespace_id", "namespace_id": "{namespace_id}"}}'
+    }
+    dbx = dropbox_client(dbx_token, dbx_url, headers=headers, max_retries_on_error=0, max_retries_on_rate_limit=0)
+    backoff = dropbox_limiter()
+
+    # Upload threads share one pool of keep-alive connections.
+    client = pooled_client(conf_url, conf_email, conf_api_token, max_connections=upload_workers)
+    title_index = TitleIndex.fetch(client, conf_space_key)
+    print(f"Found {len(title_index)} pages in space {conf_space_key}")
+
+    status = {
+        'uploaded': 0,
+        'skipped_dir': [],
+        'skipped_file': [],
+        'first_page_seconds': None,
+    }
+    # the reason of skipping a file, if it's an exception.
+    errors = {}
+    status_lock = threading.Lock()
+
+    def skip_file(path: str, error: Optional[Exception] = None):
+        with status_lock:
+            status['skipped_file'].append(path)
+            if error is not None:
+                errors[path] = error
+
+    def uploaded():
+        with status_lock:
+            status['uploaded'] += 1
+            if status['first_page_seconds'] is None:
+                status['first_page_seconds'] = time.monotonic() - start
+
+    # Folder pages, keyed by the folder path relative to `folder_path`. The root folder
+    # has no page, so its docs are created without a parent.
+    dir_pages: Dict[str, str] = {}
+    dir_titles: Dict[str, str] = {}
+    # folders whose page was already in the space, which are left alone like
+    # run_export_to_conf.py leaves existing pages.
+    existing_dirs: Set[str] = set()
+    dir_locks: Dict[str, threading.Lock] = {}
+    dir_locks_lock = threading.Lock()
+
+    def create_page(title: str, body: str, parent_page_id: Optional[str]) -> str:
+        return client.create_page(
+            space=conf_space_key,
+            title=title,
+            body=body,
+            parent_id=parent_page_id,
+            representation="storage",
+            editor="v2",
+        )['id']
+
+    def dir_page_id(dir_path: str, body: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the page id of a folder, creating its page and its parents' first if
+        needed. `body` is the content of the folder's own doc, if it has one.
+        """
+        if dir_path == "":
+            return None
+        with dir_locks_lock:
+            lock = dir_locks.setdefault(dir_path, threading.Lock())
+        # Locks are taken from a folder up to its parents, never the other way around.
+        with lock:
+            parent_page_id = dir_page_id(posixpath.dirname(dir_path))
+            page_id = dir_pages.get(dir_path)
+            if page_id is not None:
+                if body is not None and dir_path not in existing_dirs:
+                    client.update_page(page_id, dir_titles[dir_path], body, parent_id=parent_page_id, always_update=True)
+                return page_id
+
+            title = posixpath.basename(dir_path)
+            if new_on_duplicate:
+                title = title_index.reserve_unique_title(title)
+            elif title_index.is_taken(title):
+                print(f"Finding an existing parent page for: {title}")
+                page = title_index.get(title)
+                page_id = page['id'] if page['id'] is not None else client.get_page_by_title(conf_space_key, title)['id']
+                existing_dirs.add(dir_path)
+            if page_id is None:
+                try:
+                    page_id = create_page(title, body or "", parent_page_id)
+                except confluence.HTTPError as e:
+                    print(f"Skpping parent page: {title} due to error: {e}.")
+                    with status_lock:
+                        status['skipped_dir'].append(dir_path)
+                    raise
+                uploaded()
+            title_index.add(title, page_id)
+            dir_pages[dir_path] = page_id
+            dir_titles[dir_path] = title
+            return page_id
+
+    def upload(path: str, body: str):
+        dir_path = posixpath.dirname(path)
+        title = posixpath.basename(path).removesuffix(".paper")
+        try:
+            if dir_path and title == posixpath.basename(dir_path):
+                dir_page_id(dir_path, body)
+                if dir_path in existing_dirs:
+                    print(f"Skipping {title} since its folder page already exists")
+                    skip_file(path)
+                else:
+                    print(f"added {title} as the content of its folder page")
+                return
+            if not dir_path and title == root_title:
+                print(f"skipping paper doc {title} because its parent page has the same name")
+                skip_file(path)
+                return
+
+            parent_page_id = dir_page_id(dir_path)
+            if new_on_duplicate:
+                title = title_index.reserve_unique_title(title)
+            elif title_index.is_taken(title):
+                print(f"Skipping {title} since it already exists")
+                skip_file(path)
+                return
+            title_index.add(title, create_page(title, body, parent_page_id))
+        except confluence.HTTPError as e:
+            print(f"Skipping {title} because we hit a confluence exception {e}")
+            skip_file(path, e)
+            return
+        except Exception as e:
+            # anything else would be lost in the executor, with the doc reported nowhere.
+            print(f"Skipping {title} because of an error: {e!r}")
+            skip_file(path, e)
+            return
+        print(f"added {title}")
+        uploaded()
+
+    # Stage 1, on this thread: list the folder and queue the docs to download.
+    # Stage 2, `download_workers` threads: export docs as markdown into memory.
+    # Stage 3, one thread: convert the downloaded docs in small batches.
+    # Stage 4, `upload_workers` threads: create the pages.
+    download_queue = queue.Queue(maxsize=queue_size)
+    convert_queue = queue.Queue(maxsize=queue_size)
+    upload_slots = threading.BoundedSemaphore(queue_size)
+    converter = BatchConverter(workers=convert_workers, batch_size=batch_size)
+
+    def download():
+        for entry in iter_queue(download_queue):
+            path = entry.path_display[len(folder_path) + 1:]
+            content: Union[str, Exception]
+            try:
+                _, response = backoff.call(dbx.files_export, entry.path_display, export_format="markdown")
+                content = response.content.decode('utf-8')
+            except Exception as e:
+                print(f"{entry.path_display}: failed to download; {e!r}")
+                content = e
+            convert_queue.put((path, content))
+
+    def release(_):
+        upload_slots.release()
+
+    def convert(executor: ThreadPoolExecutor):
+        try:
+            for path, body in converter.convert_contents(iter_queue(convert_queue)):
+                if isinstance(body, Exception):
+                    print(f"Skipping {path} because it cannot be converted: {body!r}")
+                    skip_file(path, body)
+                    continue
+                upload_slots.acquire()
+                executor.submit(upload, path, body).add_done_callback(release)
+        except BaseException:
+            # keep draining, so that the downloaders don't block on a full queue forever.
+            for _ in iter_queue(convert_queue):
+                pass
+            raise
+
+    with ThreadPoolExecutor(max_workers=upload_workers) as upload_executor:
+        downloaders = [threading.Thread(target=download) for _ in range(download_workers)]
+        converter_thread = threading.Thread(target=convert, args=(upload_executor,))
+        for thread in downloaders + [converter_thread]:
+            thread.start()
+
+        try:
+            result = backoff.call(dbx.files_list_folder, folder_path, recursive=True)
+            while True:
+                for entry in result.entries:
+                    if isinstance(entry, FileMetadata) and entry.name.endswith(".paper"):
+                        download_queue.put(entry)
+                if not result.has_more:
+                    break
+                result = backoff.call(dbx.files_list_folder_continue, result.cursor)
+        finally:
+            for _ in downloaders:
+                download_queue.put(DONE)
+            for thread in downloaders:
+                thread.join()
+            convert_queue.put(DONE)
+            converter_thread.join()
+
+    print("".join(["-"]*20))
+    print(f"Summary:")
+    first_page = status['first_page_seconds']
+    print(f"Uploaded {status['uploaded']} pages in {time.monotonic() - start:.1f}s"
+          + (f", the first one after {first_page:.1f}s" if first_page is not None else ""))
+    print(converter.stats.summary())
+    print(f"Skipped Dirs:")
+    for path_name in status['skipped_dir']:
+        print(f"{path_name}")
+    print(f"Skipped Files:")
+    for path_name in status['skipped_file']:
+        if path_name in errors:
+            print(f"{path_name}: {errors[path_name]!r}")
+        else:
+            print(f"{path_name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Migrate the Paper docs in a Dropbox folder straight to a confluence space.')
+    parser.add_argument('--path', required=True, help='relative path from Dropbox root.')
+    parser.add_argument('--dbx_token', required=True, help='Dropbox Access Token. You can get it from https://dropbox.github.io/dropbox-api-v2-explorer/#files_list_folder.')
+    parser.add_argument('--conf_api_token', required=True, help='Confluence API token. Get it from https://id.atlassian.com/manage-profile/security/api-tokens.')
+    parser.add_argument('--conf_email', required=True, help='Your email address in Confluence.')
+    parser.add_argument('--conf_space_key', required=True, help='Confluence space key.')
+    parser.add_argument('--conf_url', help='Confluence URL', default="https://dropbox-kms.atlassian.net")
+    parser.add_argument('--new_on_duplicate', help='Whether to create a new page on duplicates', action='store_true')
+    parser.add_argument('--download_workers', type=int, default=8, help='Number of docs downloaded concurrently.')
+    parser.add_argument('--convert_workers', type=int, default=2, help='Number of pandoc batches converted concurrently.')
+    parser.add_argument('--upload_workers', type=int, default=8, help='Number of pages created concurrently.')
+    parser.add_argument('--queue_size', type=int, default=32, help='Number of docs each stage may hold for the next one.')
+    parser.add_argument('--dbx_url', help='URL of a local_services.py Dropbox stand-in to download from instead of Dropbox.')
+    args = parser.parse_args()
+
+    precondition_result = precondition_check()
+    if precondition_result:
+        print(precondition_result)
+    else:
+        migrate(args.path, args.dbx_token, args.conf_api_token, args.conf_email, args.conf_url, args.conf_space_key,
+                args.new_on_duplicate, args.download_workers, args.convert_workers, args.upload_workers,
+                queue_size=args.queue_size, dbx_url=args.dbx_url)
@@ -1,20 +1,91 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, List
+
 from atlassian import confluence
+from atlassian.errors import ApiError
+import argparse
 
-import env
+from async_confluence import AsyncConfluence
 
-if __name__ == "__main__":
-    client = confluence.Confluence(url=env.CONF_URL,
-                                   username=env.CONF_ACCOUNT_EMAIL,
-                                   password=env.CONF_API_TOKEN,
-                                   cloud=True)
-    client.create_page()
+PAGE_SIZE = 200
+MAX_ROUNDS = 3
+
+
+async def list_pages(client: AsyncConfluence, space: str, page_size: int = PAGE_SIZE) -> List[dict]:
+    """Lists every current page in `space`, with its ancestors."""
+    pages = []
+    start = 0
     while True:
-        pages = client.get_all_pages_from_space(space=env.CONF_SPACE_KEY)
+        results = await client.get_all_pages_from_space(space, start=start, limit=page_size, status='current',
+                                                        expand='ancestors')
+        if not results:
+            return pages
+        pages.extend(results)
+        start += len(results)
+
+
+def by_depth(pages: List[dict]) -> Dict[int, List[dict]]:
+    levels = defaultdict(list)
+    for page in pages:
+        levels[len(page.get('ancestors') or [])].append(page)
+    return levels
+
+
+async def remove_page(client: AsyncConfluence, page: dict):
+    try:
+        await client.remove_page(page['id'])
+    except (confluence.HTTPError, ApiError) as e:
+        # the client raises a 404 as an ApiError, with the HTTPError as its reason.
+        response = getattr(e.reason if isinstance(e, ApiError) else e, 'response', None)
+        if response is not None and response.status_code == 404:
+            # deleted by someone else meanwhile.
+            return
+        # left for the next round.
+        print(f"Failed to delete {page['title']}: {e}")
+        return
+    print(f"deleted {page['title']}")
+
+
+async def purge(client: AsyncConfluence, space: str) -> int:
+    """
+    Deletes every page in `space` and returns how many are left.
+
+    The space is listed once, and pages are deleted level by level from the deepest, all
+    pages of a level at once. Deleting leaves first means Confluence never has to move a
+    deleted page's children up the tree. A final listing checks that nothing is left, and
+    pages that are get another round.
+    """
+    pages = await list_pages(client, space)
+    for attempt in range(1, MAX_ROUNDS + 1):
         if not pages:
-            break
+            return 0
+        print(f"Round {attempt}: deleting {len(pages)} pages from {space}")
+        levels = by_depth(pages)
+        for depth in sorted(levels, reverse=True):
+            await asyncio.gather(*(remove_page(client, page) for page in levels[depth]))
+        pages = await list_pages(client, space)
+    for page in pages:
+        print(f"Left over: {page['title']}")
+    return len(pages)
+
 
-        for page in pages:
-            title = page['title']
-            id = page['id']
-            print(f"deleting {title}")
-            client.remove_page(id)
+async def main(conf_url: str, conf_email: str, conf_api_token: str, conf_space_key: str, jobs: int):
+    async with AsyncConfluence(conf_url, conf_email, conf_api_token, max_in_flight=jobs) as client:
+        left = await purge(client, conf_space_key)
+    print("".join(["-"]*20))
+    if left:
+        print(f"{left} pages are left in {conf_space_key}")
+    else:
+        print(f"{conf_space_key} is empty")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Delete all pages in a confluence space.')
+    parser.add_argument('--conf_api_token', required=True, help='Confluence API token. Get it from https://id.atlassian.com/manage-profile/security/api-tokens.')
+    parser.add_argument('--conf_email', required=True, help='Your email address in Confluence.')
+    parser.add_argument('--conf_space_key', required=True, help='Confluence space key.')
+    parser.add_argument('--conf_url', help='Confluence URL', default="https://dropbox-kms.atlassian.net")
+    parser.add_argument('--jobs', type=int, default=32, help='Number of pages deleted concurrently.')
+    args = parser.parse_args()
+    asyncio.run(main(args.conf_url, args.conf_email, args.conf_api_token, args.conf_space_key, args.jobs))
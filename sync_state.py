@@ -0,0 +1,57 @@
+import json
+import os
+from typing import Dict, Optional
+
+from dropbox.files import FileMetadata
+
+
+class SyncState:
+    """
+    What a previous sync of a Dropbox folder saw: the cursor to continue listing from,
+    and the rev and content hash of every doc it downloaded, keyed by lower-cased path.
+    """
+
+    def __init__(self, path: str, folder: str, cursor: Optional[str] = None, entries: Optional[Dict[str, dict]] = None):
+        self.path = path
+        self.folder = folder
+        self.cursor = cursor
+        self.entries = entries if entries is not None else {}
+
+    @classmethod
+    def load(cls, path: str, folder: str) -> "SyncState":
+        """
+        Loads the state saved at `path`. A missing file, or one saved for another folder,
+        gives an empty state, so the next sync lists the whole folder.
+        """
+        if not os.path.exists(path):
+            return cls(path, folder)
+        with open(path) as f:
+            data = json.load(f)
+        if data['folder'] != folder:
+            print(f"{path} was saved for {data['folder']}, listing {folder} from scratch")
+            return cls(path, folder)
+        return cls(path, folder, data['cursor'], data['entries'])
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'folder': self.folder, 'cursor': self.cursor, 'entries': self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+    def is_unchanged(self, entry: FileMetadata) -> bool:
+        seen = self.entries.get(entry.path_lower)
+        if seen is None:
+            return False
+        if entry.content_hash and seen['content_hash']:
+            return entry.content_hash == seen['content_hash']
+        return entry.rev == seen['rev']
+
+    def record(self, entry: FileMetadata):
+        self.entries[entry.path_lower] = {
+            'path_display': entry.path_display,
+            'rev': entry.rev,
+            'content_hash': entry.content_hash,
+        }
+
+    def forget(self, path_lower: str) -> Optional[dict]:
+        return self.entries.pop(path_lower, None)
@@ -0,0 +1,29 @@
+import asyncio
+import threading
+import time
+
+from async_confluence import AsyncConfluence
+
+
+def test_limits_requests_in_flight():
+    client = AsyncConfluence("https://example.atlassian.net", "user", "token", max_in_flight=4)
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def remove_page(page_id, status=None, recursive=False):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return page_id
+
+    client.client.remove_page = remove_page
+
+    async def main():
+        async with client:
+            return await asyncio.gather(*(client.remove_page(str(i)) for i in range(20)))
+
+    assert asyncio.run(main()) == [str(i) for i in range(20)]
+    assert in_flight[1] == 4
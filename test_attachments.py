@@ -0,0 +1,166 @@
+import contextlib
+import functools
+import io
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from async_confluence import pooled_client
+from attachments import ImageStore, attach_images, attachment_names, image_urls
+from local_services import LocalConfluence
+from manifest import BODY_HASH_PROPERTY
+from run_export_to_conf import run
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+
+
+class FailingUploads(LocalConfluence):
+    """Rejects the first `failures` attachment uploads."""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def add_attachments(self, request, page_id):
+        if self.failures:
+            self.failures -= 1
+            self.error(request, 413, "Request entity too large")
+            return
+        super().add_attachments(request, page_id)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve(directory):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(directory)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_attaches_each_image_once(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    (images / "a.png").write_bytes(PNG)
+    (images / "copy.png").write_bytes(PNG)
+    root = tmp_path / "Root"
+    root.mkdir()
+    attachments_path = str(tmp_path / "images.db")
+
+    with serve(images) as url, LocalConfluence() as confluence:
+        (root / "One.paper").write_text(f"# One\n\n![]({url}/a.png)\n\n![]({url}/copy.png)\n\n![]({url}/missing.png)\n")
+        (root / "Two.paper").write_text(f"# Two\n\n![]({url}/a.png)\n")
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(str(root), "token", "email", confluence.url, "SPACE", False, attachments_path=attachments_path)
+
+        store = ImageStore(attachments_path)
+        image = store.get(f"{url}/a.png")
+        assert store.get(f"{url}/copy.png") == image and store.get(f"{url}/missing.png") is None
+        store.close()
+
+        pages = {page.title: page for page in confluence.current_pages("SPACE")}
+        for title in ("One", "Two"):
+            assert pages[title].attachments == {image.file_name: PNG}
+            assert f'<ri:attachment ri:filename="{image.file_name}"/>' in pages[title].body
+        # an image that cannot be fetched keeps linking to its url.
+        assert f'<ri:url ri:value="{url}/missing.png"/>' in pages["One"].body
+
+        # a rerun only fetches the images it couldn't fetch before.
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            run(str(root), "token", "email", confluence.url, "SPACE2", False, attachments_path=attachments_path)
+        assert "Images: 3 urls, 0 fetched (0 duplicates), 2 fetched before, 1 failed." in out.getvalue()
+        assert all(page.attachments for page in confluence.current_pages("SPACE2"))
+
+
+def test_unescapes_urls(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    (images / "a.png").write_bytes(PNG)
+    body = '<p><ac:image><ri:url ri:value="{url}/a.png?w=1&amp;h=2"/></ac:image></p>'
+
+    with serve(images) as url:
+        body = body.format(url=url)
+        assert image_urls(body) == [f"{url}/a.png?w=1&h=2"]
+        store = ImageStore(str(tmp_path / "images.db"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            store.fetch(image_urls(body))
+        image = store.get(f"{url}/a.png?w=1&h=2")
+        assert store.stats.fetched == 1 and image is not None
+        assert attach_images(body, store) == (
+            f'<p><ac:image><ri:attachment ri:filename="{image.file_name}"/></ac:image></p>', {image.file_name: image})
+        store.close()
+
+
+def test_retries_failed_uploads(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    (images / "a.png").write_bytes(PNG)
+    root = tmp_path / "Root"
+    root.mkdir()
+
+    def export(confluence):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            run(str(root), "token", "email", confluence.url, "SPACE", False, manifest_path=str(tmp_path / "manifest.db"),
+                attachments_path=str(tmp_path / "images.db"))
+        return out.getvalue()
+
+    with serve(images) as url, FailingUploads(failures=1) as confluence:
+        (root / "One.paper").write_text(f"# One\n\n![]({url}/a.png)\n")
+        assert "Pages missing images:" in export(confluence)
+        # the failed upload is retried by the next run, which then has nothing left to do.
+        out = export(confluence)
+        assert "updated One" in out and "Pages missing images:" not in out
+        assert "Skipping One since it is unchanged" in export(confluence)
+        [page] = [page for page in confluence.current_pages("SPACE") if page.title == "One"]
+        assert list(page.attachments.values()) == [PNG]
+
+
+def test_retries_failed_uploads_without_a_manifest(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    (images / "a.png").write_bytes(PNG)
+    root = tmp_path / "Root"
+    root.mkdir()
+
+    def export(confluence):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            run(str(root), "token", "email", confluence.url, "SPACE", False, update_existing=True,
+                attachments_path=str(tmp_path / "images.db"))
+        return out.getvalue()
+
+    with serve(images) as url, FailingUploads(failures=1) as confluence:
+        (root / "One.paper").write_text(f"# One\n\n![]({url}/a.png)\n")
+        (root / "Two.paper").write_text("# Two\n")
+        assert "Pages missing images:" in export(confluence)
+        pages = {page.title: page for page in confluence.current_pages("SPACE")}
+        # stored once the images are attached, so it's left off a page missing them.
+        assert BODY_HASH_PROPERTY not in pages["One"].properties
+        assert BODY_HASH_PROPERTY in pages["Two"].properties
+
+        out = export(confluence)
+        assert "updated One" in out and "Pages missing images:" not in out
+        assert list(pages["One"].attachments.values()) == [PNG]
+        assert BODY_HASH_PROPERTY in pages["One"].properties
+        assert "Skipping One since it is unchanged" in export(confluence)
+
+
+class CappedListings(LocalConfluence):
+    """Lists at most 2 attachments at a time, whatever the limit asked for."""
+
+    def list_attachments(self, request, page_id, params):
+        super().list_attachments(request, page_id, {**params, 'limit': min(int(params.get('limit', 25)), 2)})
+
+
+def test_lists_every_attachment_when_listings_are_capped():
+    with CappedListings() as confluence:
+        page = confluence.add_page("SPACE", "Page")
+        page.attachments.update({f"{i}.png": PNG for i in range(5)})
+        client = pooled_client(confluence.url, "user", "token", max_connections=1)
+        assert attachment_names(client, page.id) == [f"{i}.png" for i in range(5)]
@@ -0,0 +1,30 @@
+from conversion_cache import ConversionCache
+from convert_stage import convert_pages
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache.sqlite"), max_bytes=10, version="v1")
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    assert cache.get("a") == "aaaa"
+    cache.put("c", "cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.evictions) == (3, 1, 1)
+    assert ConversionCache(str(tmp_path / "other.sqlite"), version="v2").key(b"x") != cache.key(b"x")
+
+
+def test_warm_run_is_served_from_cache(tmp_path):
+    doc = tmp_path / "a.md"
+    doc.write_text("# Title\n\nSome text")
+    path = str(tmp_path / "cache.sqlite")
+
+    cold = ConversionCache(path)
+    expected = list(convert_pages([str(doc)], cache=cold))
+    cold.close()
+
+    warm = ConversionCache(path)
+    assert list(convert_pages([str(doc)], cache=warm)) == expected
+    assert (warm.stats.hits, warm.stats.misses) == (1, 0)
@@ -0,0 +1,22 @@
+from convert_stage import convert_pages
+
+
+def results(paths, jobs):
+    return [(path, repr(result) if isinstance(result, Exception) else result)
+            for path, result in convert_pages(paths, jobs=jobs)]
+
+
+def test_process_pool_converts_like_one_process(tmp_path):
+    paths = []
+    for i in range(12):
+        # docs for the fast parser, docs for pandoc, and docs that cannot be converted.
+        content = [f"# Doc {i}\n\n- item\n", f'# Doc {i}\n\nsay "hi"\n', f'# Doc {i}\n\n[a](http://x "title")\n'][i % 3]
+        (tmp_path / f"{i}.paper").write_text(content)
+        paths.append(str(tmp_path / f"{i}.paper"))
+    # unreadable.
+    paths.insert(5, str(tmp_path / "missing.paper"))
+
+    expected = results(paths, jobs=1)
+    assert [path for path, _ in expected] == paths
+    assert sum(result.startswith(("AssertionError", "FileNotFoundError")) for _, result in expected) == 5
+    assert results(paths, jobs=2) == expected
@@ -0,0 +1,22 @@
+import os
+from dataclasses import replace
+
+from corpus import PROFILES, generate_corpus
+from writer import convert_page
+
+
+def test_generates_same_corpus_for_seed(tmp_path):
+    profile = replace(PROFILES['small'], docs=5)
+    first = generate_corpus(str(tmp_path / "a"), profile, seed=1)
+    second = generate_corpus(str(tmp_path / "b"), profile, seed=1)
+    for a, b in zip(first, second):
+        assert os.path.relpath(a, tmp_path / "a") == os.path.relpath(b, tmp_path / "b")
+        assert open(a).read() == open(b).read()
+
+
+def test_generated_docs_convert(tmp_path):
+    paths = generate_corpus(str(tmp_path), replace(PROFILES['small'], docs=12))
+    # folders carry a doc of their own name.
+    assert os.path.join(str(tmp_path), "Folder 1.1", "Folder 1.1.paper") in paths
+    for path in paths:
+        assert convert_page(path)
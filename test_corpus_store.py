@@ -0,0 +1,46 @@
+import os
+
+from conversion_cache import ConversionCache
+from convert_stage import convert_pages
+from corpus_store import CorpusStore
+from page_tree import scan
+
+DOCS = ["Root/A.paper", "Root/Root.paper", "Root/Team/Team.paper", "Root/Team/B.paper", "Root/Team/Sub/C.paper",
+        "Other/D.paper"]
+
+
+def shape(node, root):
+    return (node.title, os.path.relpath(node.path, root), node.index_path and os.path.relpath(node.index_path, root),
+            sorted(shape(child, root) for child in node.children),
+            sorted(os.path.relpath(path, root) for path in node.ignored))
+
+
+def test_tree_matches_a_downloaded_folder(tmp_path):
+    with CorpusStore(str(tmp_path / "corpus.db")) as store:
+        for path in DOCS:
+            full_path = tmp_path / "out" / path
+            full_path.parent.mkdir(parents=True, exist_ok=True)
+            full_path.write_text(f"# {path}\n")
+            store.put(f"/{path}", "rev1", None, f"# {path}\n".encode('utf-8'))
+
+        tree = store.tree("/root/")
+        assert shape(tree.root, "/Root") == shape(scan(str(tmp_path / "out" / "Root")).root, str(tmp_path / "out" / "Root"))
+        assert tree.doc_paths()[0] == "/Root/Team/Team.paper"
+        assert len(store.tree("/").doc_paths()) == 6
+
+
+def test_converts_docs_from_the_store(tmp_path):
+    with CorpusStore(str(tmp_path / "corpus.db")) as store:
+        store.put("/Root/A.paper", "rev1", "hash1", b"# Title\n\nSome text")
+        store.put("/root/a.paper", "rev2", "hash2", b"# Title\n\nOther text")
+        assert len(store) == 1
+        assert store.get("/ROOT/A.PAPER").rev == "rev2"
+
+    store_path = str(tmp_path / "corpus.db")
+    cache = ConversionCache(str(tmp_path / "cache.db"))
+    for _ in range(2):
+        (path, body), (missing_path, error) = convert_pages(["/Root/A.paper", "/Root/B.paper"], cache=cache,
+                                                            store_path=store_path)
+        assert "Other text" in body
+        assert isinstance(error, FileNotFoundError)
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
@@ -0,0 +1,31 @@
+from doc_links import LinkIndex, link_target
+
+
+def test_reads_the_doc_from_paper_and_dropbox_urls():
+    assert link_target("https://paper.dropbox.com/doc/Q3-Plan--AbCdEfGhIjKlMnOpQrStU-abcdefghijklmnopqrstu") == \
+        ('slug', "q3-plan")
+    assert link_target("https://paper.dropbox.com/doc/Q3-Plan-abcdefghijklmnopqrstu") == ('slug', "q3-plan")
+    assert link_target("https://www.dropbox.com/home/Team/Q3%20Plan.paper") == ('title', "Q3 Plan")
+    assert link_target("https://www.dropbox.com/home/Team/report.pdf") is None
+    assert link_target("https://example.com/doc/Q3-Plan") is None
+
+
+def test_rewrites_only_links_to_known_docs():
+    index = LinkIndex()
+    index.add("Q3 Plan", "Q3 Plan (Conflicted Copy)")
+    # both make the slug "a-b", so links by slug can't tell them apart.
+    index.add("A & B", "A & B")
+    index.add("A B", "A B")
+
+    body = ('<p><a href="https://paper.dropbox.com/doc/Q3-Plan-abcdefghijklmnopqrstu"><strong>plan</strong></a> '
+            '<a href="https://paper.dropbox.com/doc/A-B-abcdefghijklmnopqrstu">ab</a> '
+            '<a href="https://www.dropbox.com/home/A%20&amp;%20B.paper">ab</a> '
+            '<a href="https://example.com">site</a></p>')
+    rewritten, count = index.rewrite(body)
+    assert count == 2
+    assert ('<ac:link><ri:page ri:content-title="Q3 Plan (Conflicted Copy)"/>'
+            '<ac:link-body><strong>plan</strong></ac:link-body></ac:link>') in rewritten
+    assert '<a href="https://paper.dropbox.com/doc/A-B-abcdefghijklmnopqrstu">ab</a>' in rewritten
+    assert '<ri:page ri:content-title="A &amp; B"/>' in rewritten
+    assert '<a href="https://example.com">site</a>' in rewritten
+    assert index.rewrite("<p>no links</p>") == ("<p>no links</p>", 0)
@@ -0,0 +1,58 @@
+import subprocess
+
+import pandoc
+import pytest
+
+import writer
+from fast_parser import ABBREVIATIONS, parse_paper
+
+SUPPORTED = [
+    "# Title\nSome text, with (parens) and a/b.\n\n## Sub heading\n\n**Bold heading**\n\ndon't break snake_case",
+    "- item one\n- item two\n    - nested `code` item\n        - deeper\n- item three\n\n1. first\n2. second\n    1. nested",
+    "[ ] task item 1\n    [ ] nested task item\n[x] task item 2\n",
+    "| Column 1 | Column 2 |\n| -------- | :------: |\n| Row 1    | **x** y  |\n| a<br>- x<br> - y | |\n",
+    "| " + "a" * 70 + " | b |\n|-----|--:|\n| 1 | 2 |\n",
+    "```python\ncode & <stuff>\n\n  indented\n```\n\n----------\n\nafter",
+    "# Dup\n\n# Dup\n\n# 1 Émoji.x_y",
+]
+
+UNSUPPORTED = [
+    "Mr. Smith",
+    'He said "hi"',
+    "a -- b",
+    "*emph*",
+    "see [link](https://www.dropbox.com)",
+    "<b>html</b>",
+    "Setext\n===",
+    "- a\n\n- b",
+    "a. lower alpha list",
+    "text\n\n    indented code",
+    "# x\n\n[x] a task that pandoc reads as a link to the heading",
+]
+
+
+@pytest.mark.parametrize("content", SUPPORTED)
+def test_same_ast_as_pandoc(content):
+    content = writer.preprocess_page(content)
+    assert parse_paper(content) == pandoc.read(source=content, format=writer.PANDOC_FORMAT)
+
+
+@pytest.mark.parametrize("content", UNSUPPORTED)
+def test_falls_back_to_pandoc(content):
+    assert parse_paper(writer.preprocess_page(content)) is None
+
+
+PANDOC_ABBREVIATIONS = subprocess.run(["pandoc", "--print-default-data-file", "abbreviations"],
+                                      capture_output=True, text=True, check=True).stdout.split()
+
+
+def test_knows_every_pandoc_abbreviation():
+    assert set(PANDOC_ABBREVIATIONS) == ABBREVIATIONS
+
+
+@pytest.mark.parametrize("abbreviation", PANDOC_ABBREVIATIONS)
+def test_abbreviations_fall_back_to_pandoc(abbreviation):
+    for content in (f"see {abbreviation} 3", f"see ({abbreviation} 3)", f"{abbreviation} 3"):
+        content = writer.preprocess_page(content)
+        ast = parse_paper(content)
+        assert ast is None or ast == pandoc.read(source=content, format=writer.PANDOC_FORMAT)
@@ -0,0 +1,36 @@
+import os
+import threading
+import time
+
+from folder_watch import FolderWatcher
+
+
+def edit(path, content):
+    path.write_text(content)
+    # a new time, whatever the precision of file times.
+    later = time.time() + 2
+    os.utime(path, (later, later))
+
+
+def test_reports_changes_until_committed(tmp_path):
+    (tmp_path / "A.paper").write_text("# A\n")
+    (tmp_path / "B.paper").write_text("# B\n")
+    watcher = FolderWatcher(str(tmp_path), poll_seconds=0.01, debounce_seconds=0.05)
+    # a change that is never reported stops the watcher instead of hanging the test.
+    timeout = threading.Timer(30, watcher.stop)
+    timeout.start()
+
+    edit(tmp_path / "A.paper", "# A\n\nEdited.\n")
+    assert watcher.wait() == {str(tmp_path / "A.paper")}
+    # not committed, as if exporting it failed.
+    assert watcher.wait() == {str(tmp_path / "A.paper")}
+    edit(tmp_path / "B.paper", "# B\n\nEdited.\n")
+    assert watcher.wait() == {str(tmp_path / "A.paper"), str(tmp_path / "B.paper")}
+    watcher.commit()
+
+    os.remove(tmp_path / "A.paper")
+    assert watcher.wait() == {str(tmp_path / "A.paper")}
+    watcher.commit()
+    timeout.cancel()
+    watcher.stop()
+    assert watcher.wait() is None
@@ -0,0 +1,28 @@
+import pandoc
+import pytest
+
+import writer
+from json_writer import read_json, render_json
+
+CONTENTS = [
+    "# Title\n\nSome *text* with a [link](https://www.dropbox.com) and `code`.\n\n**Bold heading**",
+    "[ ] task item 1\n    [x] nested task item\n- plain item\n\n1. first\n2. second",
+    "| Column 1 | Column 2 |\n| -------- | :------: |\n| a<br>- x<br> - y | \"quoted\" |\n",
+    "> quote\n\n```\ncode & <stuff>\n```\n\n----------\n\nx^2^ H~2~O ~~gone~~ ![img](a.png)",
+]
+
+
+def render_types(content):
+    return writer.render_doc(pandoc.read(source=content, format=writer.PANDOC_FORMAT))
+
+
+@pytest.mark.parametrize("content", CONTENTS)
+def test_same_output_as_parser(content):
+    content = writer.preprocess_page(content)
+    assert render_json(read_json(content)) == render_types(content)
+
+
+def test_doc():
+    with open("Doc.md") as f:
+        content = writer.preprocess_page(f.read())
+    assert render_json(read_json(content)) == render_types(content)
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+import requests
+from atlassian import confluence
+from dropbox.exceptions import ApiError
+from dropbox.files import FileMetadata, FolderMetadata
+
+from async_confluence import AsyncConfluence, pooled_client
+from local_services import DUPLICATE_TITLE_MESSAGE, Faults, LocalConfluence, LocalDropbox
+from manifest import ManifestEntry
+from run_cloud_doc_download_folder import dropbox_client, get_namespace_id
+from run_export_to_conf import update_page
+from run_purge_space import remove_page
+
+
+@pytest.fixture
+def local_confluence():
+    with LocalConfluence() as service:
+        yield service
+
+
+def test_confluence_titles_are_unique_in_a_space(local_confluence):
+    client = pooled_client(local_confluence.url, "user", "token", max_connections=4)
+    parent_id = client.create_page("SPACE", "Parent", "<p>parent</p>")['id']
+    client.create_page("SPACE", "Child", "<p>child</p>", parent_id=parent_id)
+    client.create_page("OTHER", "Child", "<p>another space</p>")
+
+    with pytest.raises(confluence.HTTPError) as e:
+        client.create_page("SPACE", "Child", "<p>again</p>")
+    assert DUPLICATE_TITLE_MESSAGE in e.value.response.content.decode('utf-8')
+
+    page = client.get_page_by_title("SPACE", "Child")
+    pages = client.get_all_pages_from_space("SPACE", status='current', expand='ancestors')
+    assert [ancestor['id'] for ancestor in pages[1]['ancestors']] == [parent_id]
+    assert client.get_page_by_id(page['id'], expand='body.storage')['body']['storage']['value'] == "<p>child</p>"
+
+
+def test_confluence_updates_bump_the_version(local_confluence):
+    client = pooled_client(local_confluence.url, "user", "token", max_connections=4)
+    page_id = client.create_page("SPACE", "Page", "<p>1</p>")['id']
+    assert update_page(client, ManifestEntry(page_id, "Page", "", 1), "<p>2</p>", None) == 2
+    # a stale version conflicts, and update_page() falls back to the current one.
+    assert update_page(client, ManifestEntry(page_id, "Page", "", 1), "<p>3</p>", None) == 3
+    assert local_confluence.pages[page_id].body == "<p>3</p>"
+
+
+def test_deleting_a_page_moves_its_children_up(local_confluence):
+    parent = local_confluence.add_page("SPACE", "Parent")
+    child = local_confluence.add_page("SPACE", "Child", parent_id=parent.id)
+
+    async def main():
+        async with AsyncConfluence(local_confluence.url, "user", "token") as client:
+            await remove_page(client, {'id': parent.id, 'title': "Parent"})
+            # already deleted, which is fine.
+            await remove_page(client, {'id': parent.id, 'title': "Parent"})
+
+    asyncio.run(main())
+    assert [page.title for page in local_confluence.current_pages("SPACE")] == ["Child"]
+    assert child.parent_id is None
+
+
+def test_throttles_over_max_rate():
+    with LocalConfluence(Faults(max_rate=2, retry_after=3)) as service:
+        responses = [requests.get(f"{service.url}/rest/api/content", params={'spaceKey': "SPACE"}) for _ in range(3)]
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert responses[2].headers["Retry-After"] == "3"
+    assert service.faults.stats['throttled'] == 1
+
+
+def test_dropbox_serves_a_folder(tmp_path):
+    (tmp_path / "Root" / "Folder").mkdir(parents=True)
+    (tmp_path / "Root" / "A.paper").write_text("# A\n")
+    (tmp_path / "Root" / "Folder" / "B.paper").write_text("# B\n")
+
+    with LocalDropbox(str(tmp_path), page_size=2) as service:
+        assert get_namespace_id("token", service.url) == "1"
+        client = dropbox_client("token", service.url)
+        result = client.files_list_folder("/Root", recursive=True)
+        entries = list(result.entries)
+        while result.has_more:
+            result = client.files_list_folder_continue(result.cursor)
+            entries.extend(result.entries)
+
+        assert [type(entry) for entry in entries] == [FolderMetadata, FileMetadata, FolderMetadata, FileMetadata]
+        assert [entry.path_display for entry in entries] == ["/Root", "/Root/A.paper", "/Root/Folder",
+                                                              "/Root/Folder/B.paper"]
+        # nothing changed since.
+        assert client.files_list_folder_continue(result.cursor).entries == []
+
+        _, response = client.files_export("/Root/Folder/B.paper", export_format="markdown")
+        assert response.content == b"# B\n"
+        with pytest.raises(ApiError):
+            client.files_export("/Root/C.paper")
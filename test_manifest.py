@@ -0,0 +1,15 @@
+from manifest import Manifest, ManifestEntry, hash_body
+
+
+def test_manifest_survives_reopen(tmp_path):
+    path = str(tmp_path / "manifest.sqlite")
+    manifest = Manifest(path, "SPACE")
+    manifest.record("out/a.paper", "1", "a", hash_body("<p>a</p>"), 1)
+    manifest.record("out/b.paper", "2", "b", hash_body("<p>b</p>"), 1)
+    manifest.forget("out/b.paper")
+    manifest.close()
+
+    manifest = Manifest(path, "SPACE")
+    assert manifest.get("out/a.paper") == ManifestEntry("1", "a", hash_body("<p>a</p>"), 1)
+    assert manifest.get("out/b.paper") is None
+    assert Manifest(path, "OTHER").get("out/a.paper") is None
@@ -0,0 +1,28 @@
+from metrics import NULL_TIMER, Metrics
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    assert metrics.phase("render", "a.paper") is NULL_TIMER
+    metrics.count("confluence.calls")
+    assert metrics.snapshot() == {'phases': {}, 'counters': {}, 'docs': {}}
+
+
+def test_merges_worker_snapshots():
+    metrics = Metrics()
+    metrics.enable()
+    with metrics.phase("render", "a.paper"):
+        pass
+    metrics.count("confluence.calls", 2)
+
+    worker = Metrics()
+    worker.enable()
+    with worker.phase("render", "b.paper"):
+        pass
+    metrics.merge(worker.snapshot())
+
+    report = metrics.report(doc_count=2)
+    assert report['phases']['render']['count'] == 2
+    assert report['counters'] == {'confluence.calls': 2}
+    assert set(report['docs']) == {"a.paper", "b.paper"}
+    assert report['doc_count'] == 2
@@ -0,0 +1,80 @@
+import contextlib
+import io
+import os
+
+from local_services import LocalConfluence
+from manifest import Manifest, hash_body
+from migration_plan import CREATE, SKIP, UPDATE, MigrationPlan, PlannedPage
+from run_export_to_conf import plan, run
+from writer import convert_page
+
+
+def test_estimates_upload_with_parents_first():
+    migration_plan = MigrationPlan(root_key="root")
+    for folder in ("A", "B"):
+        migration_plan.pages.append(PlannedPage(folder, "root", folder, CREATE, 10))
+        for i in range(3):
+            migration_plan.pages.append(PlannedPage(f"{folder}/{i}", folder, f"{folder}{i}", CREATE, 10))
+
+    assert migration_plan.api_calls() == {'list_pages': 2, 'create_page': 8}
+    # 2 listings, then both folders at once, then their 6 docs 2 at a time.
+    assert migration_plan.estimate_upload_seconds(workers=2, call_seconds=1, max_rate=100) == 6
+    # more workers don't help beyond the depth of the tree.
+    assert migration_plan.estimate_upload_seconds(workers=10, call_seconds=1, max_rate=100) == 4
+    assert migration_plan.estimate_upload_seconds(workers=10, call_seconds=1, max_rate=1) == 10
+
+
+def test_plans_updates_from_the_manifest(tmp_path):
+    root = tmp_path / "Root"
+    root.mkdir()
+    for name in ("Same", "Changed", "New"):
+        (root / f"{name}.paper").write_text(f"# {name}\n")
+    with contextlib.redirect_stdout(io.StringIO()):
+        pages = plan(str(root)).pages
+    assert [page.action for page in pages] == [CREATE] * 3
+
+    manifest_path = str(tmp_path / "manifest.db")
+    manifest = Manifest(manifest_path, "SPACE")
+    same = os.path.join(str(root), "Same.paper")
+    changed = os.path.join(str(root), "Changed.paper")
+    with contextlib.redirect_stdout(io.StringIO()):
+        manifest.record(same, "1", "Same", hash_body(convert_page(same)), 1)
+    manifest.record(changed, "2", "Changed", hash_body("<p>old</p>"), 1)
+    manifest.close()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        migration_plan = plan(str(root), manifest_path=manifest_path, conf_space_key="SPACE")
+    actions = {page.title: page.action for page in migration_plan.pages}
+    assert actions == {"Same": SKIP, "Changed": UPDATE, "New": CREATE}
+    assert migration_plan.api_calls() == {'list_pages': 2, 'create_page': 1, 'update_page': 1, 'get_body_hash': 1,
+                                          'store_body_hash': 1}
+
+
+def test_counts_the_calls_of_an_update(tmp_path):
+    root = tmp_path / "Root"
+    root.mkdir()
+    (root / "Notes.paper").write_text("# Notes\n")
+    manifest_path = str(tmp_path / "manifest.db")
+
+    with LocalConfluence() as confluence:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(str(root), "token", "email", confluence.url, "SPACE", False, manifest_path=manifest_path)
+            (root / "Notes.paper").write_text("# Notes\n\nMore.\n")
+            migration_plan = plan(str(root), manifest_path=manifest_path, conf_space_key="SPACE")
+            requests = sum(confluence.requests.values())
+            run(str(root), "token", "email", confluence.url, "SPACE", False, manifest_path=manifest_path)
+        assert sum(migration_plan.api_calls().values()) == sum(confluence.requests.values()) - requests == 3
+    # the page, then its body hash, one call after the other.
+    assert migration_plan.estimate_upload_seconds(workers=2, call_seconds=1, max_rate=100) == 3
+
+
+def test_plans_a_second_pass_for_linked_pages(tmp_path):
+    root = tmp_path / "Root"
+    root.mkdir()
+    (root / "Plan.paper").write_text("# Plan\n\nSee [notes](https://paper.dropbox.com/doc/Notes-abcdefghijklmnopqrstu).\n")
+    (root / "Notes.paper").write_text("# Notes\n")
+    with contextlib.redirect_stdout(io.StringIO()):
+        migration_plan = plan(str(root))
+    assert {page.title: page.links for page in migration_plan.pages} == {"Plan": 1, "Notes": 0}
+    assert migration_plan.api_calls() == {'list_pages': 2, 'create_page': 2, 'link_page': 1}
+    assert migration_plan.estimate_upload_seconds(workers=2, call_seconds=1, max_rate=100) == 4
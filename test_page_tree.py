@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from page_tree import scan
+
+
+def make_tree(root, files):
+    for path in files:
+        full_path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write("# doc\n")
+
+
+def test_scans_folders_docs_and_index_docs(tmp_path):
+    root = str(tmp_path / "Root")
+    make_tree(root, ["A.paper", "notes.txt", "Root.paper", "Team/Team.paper", "Team/B.md", "Team/Team.md",
+                     "Team/Sub/C.paper"])
+
+    tree = scan(root)
+    assert tree.check_titles() == 5
+    team = next(node for node in tree.root.children if node.title == "Team")
+    assert team.is_dir and team.index_path == os.path.join(root, "Team", "Team.paper")
+    assert sorted(os.path.basename(path) for path in team.ignored) == ["Team.md", "Team.paper"]
+    assert sorted(os.path.basename(path) for path in tree.root.ignored) == ["Root.paper", "notes.txt"]
+    # folders before the folders under them, index docs before the docs of their folder.
+    assert [folder.title for folder in tree.folders()] == ["Root", "Team", "Sub"]
+    assert tree.doc_paths()[0] == os.path.join(root, "Team", "Team.paper")
+    assert sorted(tree.doc_paths()) == sorted([os.path.join(root, "A.paper"), os.path.join(root, "Team", "Team.paper"),
+                                               os.path.join(root, "Team", "B.md"),
+                                               os.path.join(root, "Team", "Sub", "C.paper")])
+
+
+def test_rejects_duplicate_titles(tmp_path):
+    root = str(tmp_path / "Root")
+    make_tree(root, ["Plan.paper", "Team/Plan.md"])
+
+    with pytest.raises(AssertionError, match="Plan duplicates"):
+        scan(root).check_titles()
+
+
+def test_does_not_follow_links_to_folders(tmp_path):
+    root = str(tmp_path / "Root")
+    make_tree(root, ["Team/A.paper"])
+    os.symlink(os.path.join(root, "Team"), os.path.join(root, "Link"))
+
+    tree = scan(root)
+    link = next(node for node in tree.root.children if node.title == "Link")
+    assert link.is_dir and link.children == []
+    assert tree.check_titles() == 3
@@ -0,0 +1,74 @@
+import writer
+from corpus import PROFILES, generate_corpus
+from pandoc_batch import BatchConverter
+
+
+def test_batch_matches_convert_page(tmp_path):
+    contents = [
+        "# Heading\n\n**bold heading**\n\n[ ] task\n    [x] nested task\n",
+        "```\nunterminated code block\n",
+        "| a | b |\n| - | - |\n| 1<br>2 | 3 |\n",
+        "see [link][ref]\n\n[ref]: https://www.dropbox.com\n",
+        "- item\n    - nested item\n",
+    ]
+    paths = []
+    for i, content in enumerate(contents):
+        path = tmp_path / f"{i}.md"
+        path.write_text(content)
+        paths.append(str(path))
+
+    converter = BatchConverter(workers=2, batch_size=2)
+    results = list(converter.convert_paths(paths))
+
+    assert [path for path, _ in results] == paths
+    for path, body in results:
+        assert body == writer.convert_page(path)
+    assert converter.stats.docs == len(contents)
+
+
+def test_batch_reports_errors_per_doc(tmp_path):
+    good = tmp_path / "good.md"
+    good.write_text("text")
+    bad = tmp_path / "bad.md"
+    bad.write_text("<span>text</span>")
+
+    results = dict(BatchConverter().convert_paths([str(good), str(bad), str(tmp_path / "missing.md")]))
+
+    assert results[str(good)] == "<p>text</p>"
+    assert isinstance(results[str(bad)], AssertionError)
+    assert isinstance(results[str(tmp_path / "missing.md")], FileNotFoundError)
+
+
+def test_headings_do_not_leak_into_other_docs(tmp_path):
+    # the quotes keep the docs off the fast parser, so they all go through pandoc.
+    contents = [
+        '# Foo\n\nsay "hi"\n',
+        'see [Foo] here "q"\n',
+        '# x\n\nsay "z"\n',
+        '[x] done "w"\n[ ] todo\n',
+        'Bar\n===\n\nsee [Bar] "own heading"\n',
+        '# Baz {#qux}\n\nsay "hi"\n',
+        'see [qux] "id"\n',
+        # link texts are not references, so this one is batched.
+        'see [Foo](https://www.dropbox.com) "link"\n',
+    ]
+    paths = []
+    for i, content in enumerate(contents):
+        path = tmp_path / f"{i}.md"
+        path.write_text(content)
+        paths.append(str(path))
+
+    converter = BatchConverter(workers=1, batch_size=len(paths))
+    for path, body in converter.convert_paths(paths):
+        assert body == writer.convert_page(path)
+    assert converter.stats.fallback_docs == 3
+
+
+def test_batches_a_generated_corpus(tmp_path):
+    paths = generate_corpus(str(tmp_path), PROFILES['small'])
+    converter = BatchConverter(workers=2, batch_size=50)
+    for path, body in converter.convert_paths(paths):
+        assert body == writer.convert_page(path)
+    # every doc the fast parser leaves to pandoc shares a pandoc call with the others of its batch.
+    assert converter.stats.fallback_docs == 0
+    assert converter.stats.pandoc_calls == len(paths) // 50
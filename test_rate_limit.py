@@ -0,0 +1,37 @@
+import pytest
+from dropbox.exceptions import RateLimitError
+
+from rate_limit import RateLimiter, classify_dropbox_error, parse_retry_after
+
+
+def test_retries_throttled_calls_and_slows_down():
+    limiter = RateLimiter("test", max_rate=100, base_delay=0.01, classify=classify_dropbox_error)
+    calls = []
+
+    def export():
+        calls.append(limiter.rate)
+        if len(calls) < 3:
+            raise RateLimitError("request-id", backoff=0)
+        return "ok"
+
+    assert limiter.call(export) == "ok"
+    assert len(calls) == 3
+    assert calls[1] == 50
+    assert 50 < limiter.rate <= 100
+
+
+def test_gives_up_on_other_errors():
+    limiter = RateLimiter("test", max_rate=100, base_delay=0.01, classify=classify_dropbox_error)
+
+    def fail():
+        raise ValueError("not retried")
+
+    with pytest.raises(ValueError):
+        limiter.call(fail)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
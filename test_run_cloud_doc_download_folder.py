@@ -0,0 +1,110 @@
+import contextlib
+import io
+import os
+import time
+
+from corpus_store import CorpusStore
+from local_services import LocalDropbox
+from run_cloud_doc_download_folder import walk
+from sync_state import SyncState
+
+
+class FailingExports(LocalDropbox):
+    """Answers exports of the paths in `failing` as if the doc was gone."""
+
+    def __init__(self, root):
+        super().__init__(root, page_size=2)
+        self.failing = set()
+
+    def export(self, request, arg):
+        if arg['path'] in self.failing:
+            self.not_found(request, arg['path'])
+            return
+        super().export(request, arg)
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    # past the last listing, whatever the precision of file times.
+    later = time.time() + 2
+    os.utime(path, (later, later))
+
+
+def test_downloads_what_changed(tmp_path):
+    root = tmp_path / "dropbox" / "Root"
+    out_dir = str(tmp_path / "out")
+    state_path = str(tmp_path / "state.json")
+    for name in ("A", "D", "Folder/B", "Folder/C"):
+        write(root / f"{name}.paper", f"# {name}\n")
+
+    with FailingExports(str(tmp_path / "dropbox")) as service:
+        def sync():
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                walk("/Root", out_dir, "token", dry_run=False, jobs=2, sync_state_path=state_path, dbx_url=service.url)
+            return out.getvalue()
+
+        assert "Summary: downloaded 4, skipped 0, failed 0" in sync()
+        cursor = SyncState.load(state_path, "/Root").cursor
+        assert cursor
+
+        write(root / "A.paper", "# A\n\nEdited.\n")
+        write(root / "E.paper", "# E\n")
+        service.delete("/Root/D.paper")
+        service.delete("/Root/Folder")
+        service.failing.add("/Root/E.paper")
+        out = sync()
+        assert "Summary: downloaded 1, skipped 0, failed 1" in out
+        assert "Deleted in Dropbox: 3" in out
+        assert open(os.path.join(out_dir, "Root", "A.paper")).read() == "# A\n\nEdited.\n"
+        state = SyncState.load(state_path, "/Root")
+        assert set(state.entries) == {"/root/a.paper"}
+        # kept, so that the next run lists the failed doc again.
+        assert state.cursor == cursor
+
+        service.failing.clear()
+        out = sync()
+        assert "/Root/E.paper: downloaded" in out and "/Root/A.paper: skipped; unchanged" in out
+        state = SyncState.load(state_path, "/Root")
+        assert set(state.entries) == {"/root/a.paper", "/root/e.paper"}
+        assert state.cursor != cursor
+
+        # a reset cursor lists the folder from scratch, which leaves out deleted docs.
+        service.reset_cursors()
+        os.remove(root / "E.paper")
+        out = sync()
+        assert "Dropbox reset the saved cursor" in out
+        assert "Summary: downloaded 0, skipped 1, failed 0" in out
+        assert "/Root/E.paper: deleted in Dropbox" in out
+        state = SyncState.load(state_path, "/Root")
+        assert set(state.entries) == {"/root/a.paper"}
+        assert "Dropbox reset the saved cursor" not in sync()
+
+
+def test_keeps_the_store_in_sync(tmp_path):
+    root = tmp_path / "dropbox" / "Root"
+    store_path = str(tmp_path / "corpus.db")
+    for name in ("A", "B"):
+        write(root / f"{name}.paper", f"# {name}\n")
+
+    with LocalDropbox(str(tmp_path / "dropbox")) as service:
+        def sync(dry_run=False):
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                walk("/Root", None, "token", dry_run=dry_run, sync_state_path=str(tmp_path / "state.json"),
+                     dbx_url=service.url, store_path=store_path)
+            return out.getvalue()
+
+        assert "/Root/A.paper: will download" in sync(dry_run=True)
+        assert not os.path.exists(store_path)
+        sync()
+        with CorpusStore(store_path) as store:
+            assert store.paths() == ["/Root/A.paper", "/Root/B.paper"]
+
+        service.delete("/Root/B.paper")
+        assert "/Root/B.paper: deleted in Dropbox" in sync(dry_run=True)
+        with CorpusStore(store_path) as store:
+            assert len(store) == 2
+        sync()
+        with CorpusStore(store_path) as store:
+            assert store.paths() == ["/Root/A.paper"]
+            assert store.read("/Root/A.paper") == b"# A\n"
@@ -0,0 +1,133 @@
+import contextlib
+import io
+import os
+import threading
+import time
+
+from local_services import LocalConfluence
+from manifest import BODY_HASH_PROPERTY
+from run_export_to_conf import run, watch
+
+
+def export(root, confluence, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        run(str(root), "token", "email", confluence.url, "SPACE", False, **kwargs)
+
+
+def test_updates_only_changed_pages(tmp_path):
+    root = tmp_path / "Root"
+    (root / "Team").mkdir(parents=True)
+    (root / "Team" / "Team.paper").write_text("# Team\n")
+    (root / "Team" / "Plan.paper").write_text("# Plan\n")
+    (root / "Notes.paper").write_text("# Notes\n")
+
+    with LocalConfluence() as confluence:
+        export(root, confluence)
+        pages = {page.title: page for page in confluence.current_pages("SPACE")}
+        assert set(pages) == {"Team", "Plan", "Notes"}
+        assert all(BODY_HASH_PROPERTY in page.properties for page in pages.values())
+
+        (root / "Team" / "Plan.paper").write_text("# Plan\n\nMore.\n")
+        export(root, confluence, update_existing=True)
+        assert {title: page.version for title, page in pages.items()} == {"Team": 1, "Plan": 2, "Notes": 1}
+        assert "More." in pages["Plan"].body
+
+        requests = sum(confluence.requests.values())
+        export(root, confluence, update_existing=True)
+        assert confluence.requests["PUT"] == 2
+        assert confluence.requests["POST"] == 3
+        # only the title listing.
+        assert sum(confluence.requests.values()) - requests == 3
+
+
+def test_links_docs_to_their_pages(tmp_path):
+    root = tmp_path / "Root"
+    root.mkdir()
+    (root / "Plan.paper").write_text("# Plan\n\nSee [notes](https://paper.dropbox.com/doc/Notes-abcdefghijklmnopqrstu).\n")
+    (root / "Notes.paper").write_text("# Notes\n")
+
+    with LocalConfluence() as confluence:
+        export(root, confluence, manifest_path=str(tmp_path / "manifest.db"))
+        pages = {page.title: page for page in confluence.current_pages("SPACE")}
+        assert '<ri:page ri:content-title="Notes"/>' in pages["Plan"].body
+        assert (pages["Plan"].version, pages["Notes"].version) == (2, 1)
+
+        # the linked page isn't updated again, as the doc didn't change.
+        export(root, confluence, manifest_path=str(tmp_path / "manifest.db"))
+        assert confluence.requests["PUT"] == 1
+
+
+def wait_until(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_watch_exports_edited_docs(tmp_path):
+    root = tmp_path / "Root"
+    (root / "Team").mkdir(parents=True)
+    (root / "Team" / "Team.paper").write_text("# Team\n")
+    (root / "Team" / "Plan.paper").write_text("# Plan\n")
+    (root / "Notes.paper").write_text("# Notes\n")
+
+    with LocalConfluence() as confluence:
+        stop = threading.Event()
+        watcher = threading.Thread(target=watch, args=(str(root), "token", "email", confluence.url, "SPACE", False,
+                                                       str(tmp_path / "manifest.db")),
+                                   kwargs={'poll_seconds': 0.05, 'debounce_seconds': 0.2, 'stop': stop})
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            watcher.start()
+            try:
+                wait_until(lambda: "Watching" in out.getvalue())
+                pages = {page.title: page for page in confluence.current_pages("SPACE")}
+                assert set(pages) == {"Team", "Plan", "Notes"}
+
+                (root / "Team" / "Plan.paper").write_text("# Plan\n\nMore.\n")
+                (root / "Team" / "Goals.paper").write_text("# Goals\n")
+                wait_until(lambda: "Exported 2 changed docs" in out.getvalue())
+            finally:
+                stop.set()
+                watcher.join()
+
+        pages = {page.title: page for page in confluence.current_pages("SPACE")}
+        assert {title: page.version for title, page in pages.items()} == {"Team": 1, "Plan": 2, "Notes": 1, "Goals": 1}
+        assert pages["Goals"].parent_id == pages["Team"].id
+        # Notes wasn't looked at, and the Team page was left alone as its doc didn't change.
+        assert "Skipping Notes" not in out.getvalue()
+        # the Plan page and its body hash.
+        assert confluence.requests["PUT"] == 2
+
+
+class RejectingConfluence(LocalConfluence):
+    """Rejects creating a page titled `rejected`."""
+
+    def __init__(self, rejected):
+        super().__init__()
+        self.rejected = rejected
+
+    def create_page(self, request):
+        if request.json_body()['title'] == self.rejected:
+            self.error(request, 400, "Rejected")
+            return
+        super().create_page(request)
+
+
+def test_reports_the_docs_under_a_failed_folder(tmp_path):
+    root = tmp_path / "Root"
+    (root / "Team" / "Sub").mkdir(parents=True)
+    (root / "Team" / "Team.paper").write_text("# Team\n")
+    (root / "Team" / "Plan.paper").write_text("# Plan\n")
+    (root / "Team" / "Sub" / "Deep.paper").write_text("# Deep\n")
+    (root / "Notes.paper").write_text("# Notes\n")
+
+    with RejectingConfluence("Team") as confluence:
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            run(str(root), "token", "email", confluence.url, "SPACE", False)
+        assert [page.title for page in confluence.current_pages("SPACE")] == ["Notes"]
+
+    summary = out.getvalue().split("Skipped Dirs:\n")[1]
+    dirs, files = summary.split("Skipped Files:\n")
+    assert dirs.splitlines() == ["Team", "Sub"]
+    assert sorted(os.path.relpath(path, root) for path in files.splitlines()) == [
+        "Team/Plan.paper", "Team/Sub/Deep.paper", "Team/Team.paper"]
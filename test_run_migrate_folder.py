@@ -0,0 +1,80 @@
+import contextlib
+import io
+
+from local_services import LocalConfluence, LocalDropbox
+from run_migrate_folder import migrate
+from test_run_cloud_doc_download_folder import FailingExports, write
+
+
+def test_migrates_parents_before_children(tmp_path):
+    root = tmp_path / "dropbox" / "Root"
+    write(root / "A.paper", "# A\n")
+    write(root / "Team" / "Team.paper", "# Team\n\nAbout the team.\n")
+    write(root / "Team" / "Sub" / "Deep.paper", "# Deep\n")
+    write(root / "Team" / "Sub" / "Deeper.paper", "# Deeper\n")
+    # cannot be converted.
+    write(root / "Bad.paper", '# Bad\n\n[a](http://x "title")\n')
+    # cannot be downloaded.
+    write(root / "Team" / "Gone.paper", "# Gone\n")
+
+    with FailingExports(str(tmp_path / "dropbox")) as dropbox, LocalConfluence() as confluence:
+        dropbox.failing.add("/Root/Team/Gone.paper")
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            migrate("/Root", "token", "token", "email", confluence.url, "SPACE", False, download_workers=3,
+                    upload_workers=3, batch_size=2, queue_size=2, dbx_url=dropbox.url)
+        pages = {page.title: page for page in confluence.current_pages("SPACE")}
+
+    assert set(pages) == {"A", "Team", "Sub", "Deep", "Deeper"}
+    parents = {title: page.parent_id and confluence.pages[page.parent_id].title for title, page in pages.items()}
+    assert parents == {"A": None, "Team": None, "Sub": "Team", "Deep": "Sub", "Deeper": "Sub"}
+    # every parent page was created before its children.
+    assert all(int(page.parent_id) < int(page.id) for page in pages.values() if page.parent_id)
+    assert "About the team." in pages["Team"].body
+
+    summary = out.getvalue().split("Skipped Files:\n")[1]
+    assert sorted(line.split(":")[0] for line in summary.splitlines()) == ["Bad.paper", "Team/Gone.paper"]
+
+
+class DroppingConfluence(LocalConfluence):
+    """Closes the connection without answering when asked to create a page titled `dropped`."""
+
+    def __init__(self, dropped):
+        super().__init__()
+        self.dropped = dropped
+
+    def create_page(self, request):
+        if request.json_body()['title'] == self.dropped:
+            request.close_connection = True
+            return
+        super().create_page(request)
+
+
+def test_reports_docs_failing_with_any_error(tmp_path):
+    root = tmp_path / "dropbox" / "Root"
+    write(root / "A.paper", "# A\n")
+    write(root / "B.paper", "# B\n")
+
+    with LocalDropbox(str(tmp_path / "dropbox")) as dropbox, DroppingConfluence("B") as confluence:
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            migrate("/Root", "token", "token", "email", confluence.url, "SPACE", False, dbx_url=dropbox.url)
+        assert [page.title for page in confluence.current_pages("SPACE")] == ["A"]
+
+    summary = out.getvalue().split("Skipped Files:\n")[1]
+    assert [line.split(":")[0] for line in summary.splitlines()] == ["B.paper"]
+    assert "ConnectionError" in summary
+
+
+def test_leaves_existing_folder_pages_alone(tmp_path):
+    root = tmp_path / "dropbox" / "Root"
+    write(root / "Team" / "Team.paper", "# Team\n\nOur team.\n")
+    write(root / "Team" / "Plan.paper", "# Plan\n")
+
+    with LocalDropbox(str(tmp_path / "dropbox")) as dropbox, LocalConfluence() as confluence:
+        team = confluence.add_page("SPACE", "Team", "<p>someone else's page</p>")
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            migrate("/Root", "token", "token", "email", confluence.url, "SPACE", False, dbx_url=dropbox.url)
+        pages = {page.title: page for page in confluence.current_pages("SPACE")}
+
+    assert (team.body, team.version) == ("<p>someone else's page</p>", 1)
+    assert pages["Plan"].parent_id == team.id
+    assert out.getvalue().split("Skipped Files:\n")[1].splitlines() == ["Team/Team.paper"]
@@ -0,0 +1,43 @@
+import asyncio
+import contextlib
+import io
+
+import requests
+from atlassian.errors import ApiError
+
+from run_purge_space import purge
+
+
+class FakeConfluence:
+    """Pages in a space, whose first delete of `gone` answers 404 without deleting it."""
+
+    def __init__(self, pages, gone):
+        self.pages = {page['id']: page for page in pages}
+        self.gone = set(gone)
+        self.deletes = []
+
+    async def get_all_pages_from_space(self, space, start=0, limit=50, status=None, expand=None):
+        return list(self.pages.values())[start:start + limit]
+
+    async def remove_page(self, page_id, status=None, recursive=False):
+        self.deletes.append(page_id)
+        if page_id in self.gone:
+            self.gone.remove(page_id)
+            response = requests.Response()
+            response.status_code = 404
+            # like the atlassian client, which raises a 404 on delete as an ApiError.
+            raise ApiError("There is no content with the given id", reason=requests.HTTPError(response=response))
+        del self.pages[page_id]
+
+
+def test_purge_treats_404_as_deleted():
+    client = FakeConfluence([
+        {'id': "1", 'title': "Parent", 'ancestors': []},
+        {'id': "2", 'title': "Child", 'ancestors': [{'id': "1"}]},
+    ], gone={"2"})
+
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        assert asyncio.run(purge(client, "SPACE")) == 0
+    assert "Failed to delete" not in out.getvalue()
+    # the child is deleted first, then again by the next round, as it was still listed.
+    assert client.deletes == ["2", "1", "2"]
@@ -0,0 +1,44 @@
+import contextlib
+import io
+
+from dropbox.files import FileMetadata
+
+from sync_state import SyncState
+
+
+def doc(path, rev, content_hash=None):
+    return FileMetadata(name=path.rsplit("/", 1)[-1], path_lower=path.lower(), path_display=path, rev=rev,
+                        content_hash=content_hash)
+
+
+def test_saves_and_loads(tmp_path):
+    path = str(tmp_path / "state.json")
+    state = SyncState.load(path, "/Root")
+    assert state.cursor is None and state.entries == {}
+
+    state.record(doc("/Root/A.paper", "a00000000"))
+    state.record(doc("/Root/B.paper", "b00000000"))
+    state.cursor = "cursor"
+    state.save()
+
+    state = SyncState.load(path, "/Root")
+    assert state.cursor == "cursor"
+    assert state.is_unchanged(doc("/root/a.paper", "a00000000"))
+    assert not state.is_unchanged(doc("/Root/A.paper", "a00000001"))
+    assert not state.is_unchanged(doc("/Root/C.paper", "c00000000"))
+    assert state.forget("/root/b.paper")['path_display'] == "/Root/B.paper"
+    assert state.forget("/root/b.paper") is None
+
+    # a state saved for another folder is not used.
+    with contextlib.redirect_stdout(io.StringIO()):
+        state = SyncState.load(path, "/Other")
+    assert state.cursor is None and state.entries == {}
+
+
+def test_compares_content_hashes_first(tmp_path):
+    state = SyncState(str(tmp_path / "state.json"), "/Root")
+    state.record(doc("/Root/A.paper", "a00000000", content_hash="1" * 64))
+    # moved back and forth, which gives a new rev to the same content.
+    assert state.is_unchanged(doc("/Root/A.paper", "a00000001", content_hash="1" * 64))
+    assert not state.is_unchanged(doc("/Root/A.paper", "a00000000", content_hash="2" * 64))
+    assert state.is_unchanged(doc("/Root/A.paper", "a00000000"))
@@ -0,0 +1,54 @@
+from manifest import BODY_HASH_PROPERTY
+from title_index import TitleIndex
+
+
+class FakeClient:
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = 0
+
+    def get_all_pages_from_space(self, space, start=0, limit=50, status=None, expand=None):
+        self.calls += 1
+        pages = [page for page in self.pages if page['status'] == status]
+        return pages[start:start + limit]
+
+
+def test_fetch_pages_through_all_pages():
+    pages = [{'id': str(i), 'title': f"page {i}", 'status': 'current'} for i in range(5)]
+    pages.append({'id': '5', 'title': "old", 'status': 'archived'})
+    client = FakeClient(pages)
+
+    index = TitleIndex.fetch(client, "SPACE", page_size=2)
+
+    assert len(index) == 6
+    assert index.get("page 3")['id'] == '3'
+    assert index.is_taken("page 3")
+    assert not index.is_taken("old")
+    assert not index.is_taken("new")
+
+
+def test_reserve_unique_title():
+    index = TitleIndex([
+        {'id': '1', 'title': "doc", 'status': 'current'},
+        {'id': '2', 'title': "doc (Conflicted Copy 0)", 'status': 'current'},
+        {'id': '3', 'title': "old", 'status': 'archived'},
+    ])
+
+    assert index.reserve_unique_title("doc") == "doc (Conflicted Copy 1)"
+    assert index.reserve_unique_title("doc") == "doc (Conflicted Copy 2)"
+    assert index.reserve_unique_title("old") == "old"
+    assert index.reserve_unique_title("new") == "new"
+    assert index.is_taken("new")
+
+
+def test_keeps_versions_and_body_hashes():
+    pages = [{'id': '1', 'title': "page", 'status': 'current', 'version': {'number': 3},
+              'metadata': {'properties': {BODY_HASH_PROPERTY: {'value': "abc", 'version': {'number': 2}}}}},
+             {'id': '2', 'title': "other", 'status': 'current', 'version': {'number': 1}}]
+
+    index = TitleIndex.fetch(FakeClient(pages), "SPACE")
+
+    assert index.get("page") == {'id': '1', 'status': 'current', 'version': 3, 'body_hash': "abc",
+                                 'body_hash_version': 2}
+    assert index.get("other") == {'id': '2', 'status': 'current', 'version': 1}
@@ -0,0 +1,32 @@
+import threading
+
+from uploader import PageTask, create_pages
+
+
+def test_create_pages_after_parents():
+    created = {}
+    lock = threading.Lock()
+
+    def create(key):
+        def fn(parent_page_id):
+            with lock:
+                created[key] = parent_page_id
+            if key == "bad":
+                raise Exception("conflict")
+            return f"id-{key}"
+        return fn
+
+    tasks = [
+        PageTask("a/b", "a", create("a/b")),
+        PageTask("a", "root", create("a")),
+        PageTask("c", "root", create("c")),
+        PageTask("bad", "root", create("bad")),
+        PageTask("bad/child", "bad", create("bad/child")),
+        PageTask("bad/child/grandchild", "bad/child", create("bad/child/grandchild")),
+    ]
+    page_ids, skipped = create_pages(tasks, root_key="root", workers=4)
+
+    assert created == {"a": None, "c": None, "bad": None, "a/b": "id-a"}
+    assert page_ids == {"root": None, "a": "id-a", "c": "id-c", "a/b": "id-a/b"}
+    assert list(skipped) == ["bad", "bad/child", "bad/child/grandchild"]
+    assert str(skipped["bad"]) == "conflict" and skipped["bad/child"] is None
@@ -27,3 +27,19 @@ def test_fail():
     doc = pandoc.read(source=content, format="markdown")
 
     assert not writer.is_task_list(doc[1][0])
+
+
+def test_render_nested_lists():
+    content = """
+- [ ] a & b
+    - [x] nested
+- [ ] c
+    - plain
+"""
+    doc = pandoc.read(source=content, format="markdown")
+
+    assert writer.render_doc(doc) == (
+        '<ul>\n<li>☐ a &amp; b<ac:task-list><ac:task>\n<ac:task-status>complete</ac:task-status>\n'
+        '<ac:task-body>nested</ac:task-body>\n</ac:task>\n</ac:task-list>\n</li>\n'
+        '<li>☐ c<ul>\n<li>plain</li>\n</ul>\n</li>\n</ul>\n'
+    )
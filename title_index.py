@@ -0,0 +1,88 @@
+import threading
+from typing import Dict, Iterable, Optional
+
+from atlassian import confluence
+
+from manifest import BODY_HASH_PROPERTY
+
+PAGE_SIZE = 200
+# Page versions and body hashes come with the listing, so updates need no other lookups.
+EXPAND = f"version,metadata.properties.{BODY_HASH_PROPERTY}"
+
+
+class TitleIndex:
+    """
+    An in-memory index of the page titles in a Confluence space.
+
+    It's fetched once with paged bulk listing and kept up to date as pages are created,
+    so uniqueness checks and lookups of existing pages don't need a request per page.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, pages: Iterable[dict] = ()):
+        self._lock = threading.Lock()
+        # title -> {'id': ..., 'status': ...}, and the 'version', 'body_hash' and
+        # 'body_hash_version' of fetched pages that have them.
+        self._pages: Dict[str, dict] = {}
+        for page in pages:
+            self._add(page)
+
+    def _add(self, page: dict):
+        # A title is taken by a current page even if an archived page shares it.
+        existing = self._pages.get(page['title'])
+        if existing is None or existing['status'] == 'archived':
+            entry = {'id': page['id'], 'status': page['status']}
+            if page.get('version'):
+                entry['version'] = page['version']['number']
+            body_hash = ((page.get('metadata') or {}).get('properties') or {}).get(BODY_HASH_PROPERTY)
+            if body_hash:
+                entry['body_hash'] = body_hash['value']
+                entry['body_hash_version'] = body_hash['version']['number']
+            self._pages[page['title']] = entry
+
+    @classmethod
+    def fetch(cls, client: confluence.Confluence, space: str, page_size: int = PAGE_SIZE) -> "TitleIndex":
+        pages = []
+        for status in ('current', 'archived'):
+            start = 0
+            while True:
+                results = client.get_all_pages_from_space(space, start=start, limit=page_size, status=status,
+                                                          expand=EXPAND)
+                if not results:
+                    break
+                pages.extend(results)
+                start += len(results)
+        return cls(pages)
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def get(self, title: str) -> Optional[dict]:
+        with self._lock:
+            return self._pages.get(title)
+
+    def is_taken(self, title: str) -> bool:
+        page = self.get(title)
+        return page is not None and page['status'] != 'archived'
+
+    def add(self, title: str, page_id: Optional[str], status: str = 'current'):
+        with self._lock:
+            self._pages[title] = {'id': page_id, 'status': status}
+
+    def reserve_unique_title(self, title: str) -> str:
+        """
+        Returns `title`, or the first free "Conflicted Copy" of it, and reserves it so
+        that concurrent callers never get the same title.
+        """
+        with self._lock:
+            candidate = title
+            count = 0
+            while count < 100:
+                page = self._pages.get(candidate)
+                if page is None or page['status'] == 'archived':
+                    self._pages[candidate] = {'id': None, 'status': 'current'}
+                    return candidate
+                candidate = f"{title} (Conflicted Copy {count})"
+                count += 1
+
+        raise Exception("Exhausted search")
@@ -0,0 +1,56 @@
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+@dataclass
+class PageTask:
+    key: Hashable
+    parent_key: Hashable
+    # Creates the page under the given parent page id, and returns the new page id.
+    create: Callable[[Optional[str]], Optional[str]]
+
+
+def create_pages(tasks: Iterable[PageTask], root_key: Hashable, root_page_id: Optional[str] = None,
+                 workers: int = 8) -> Tuple[Dict[Hashable, Optional[str]], Dict[Hashable, Optional[BaseException]]]:
+    """
+    Creates the pages of a tree on a pool of `workers` threads.
+
+    A page is only created once its parent page exists, and all the children of a page
+    are created concurrently. Returns a map from task key to the created page id, and
+    the tasks left out: those whose create() raised, with the exception, and all of
+    their descendants, with None.
+    """
+    children: Dict[Hashable, List[PageTask]] = defaultdict(list)
+    for task in tasks:
+        children[task.parent_key].append(task)
+
+    # Only this thread writes page_ids. Workers get the parent page id as an argument.
+    page_ids = {root_key: root_page_id}
+    skipped = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+
+        def submit_children(key: Hashable):
+            for child in children.pop(key, []):
+                future = executor.submit(child.create, page_ids[key])
+                pending[future] = child
+
+        submit_children(root_key)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = pending.pop(future)
+                if future.exception() is not None:
+                    print(f"Failed to create {task.key}: {future.exception()!r}")
+                    skipped[task.key] = future.exception()
+                    continue
+                page_ids[task.key] = future.result()
+                submit_children(task.key)
+
+    # the tasks never submitted are under a page that failed.
+    for child_tasks in children.values():
+        for task in child_tasks:
+            skipped[task.key] = None
+    return page_ids, skipped
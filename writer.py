@@ -3,9 +3,13 @@ import io
 import re
 from typing import List, Text
 
+import pandoc
 from more_itertools import peekable
 from pandoc.types import *
 
+from fast_parser import parse_paper
+from metrics import METRICS
+
 COMPLETE_TOKEN = '\u2612'
 INCOMPLETE_TOKEN = '\u2610'
 
@@ -56,6 +60,53 @@ class Parser:
 
     def __init__(self):
         self._buffer = io.StringIO()
+        self._write = self._buffer.write
+        # id(BulletList) -> (BulletList, is task list). The list is kept so that its id
+        # can't be reused by a list built later, like the ones converted from table cells.
+        self._task_lists = {}
+        # node type -> (open tag, close tag) for inlines that only wrap other inlines.
+        self._wrappers = {
+            Emph: ("<em>", "</em>"),
+            Underline: ("<u>", "</u>"),
+            Strong: ("<strong>", "</strong>"),
+            Strikeout: ('<span style="text-decoration: line-through;">', "</span>"),
+            Superscript: ("<sup>", "</sup>"),
+            Subscript: ("<sub>", "</sub>"),
+        }
+        self._inline_handlers = {
+            Str: self.do_str,
+            Space: self.do_space,
+            SoftBreak: self.do_space,
+            LineBreak: self.do_line_break,
+            SmallCaps: self.do_small_caps,
+            Quoted: self.do_quoted,
+            Cite: self.do_cite,
+            Code: self.do_code,
+            Math: self.do_math,
+            RawInline: self.do_raw_inline,
+            Link: self.do_link,
+            Image: self.do_image,
+            Note: self.do_note,
+            Span: self.do_span,
+        }
+        for node_type in self._wrappers:
+            self._inline_handlers[node_type] = self.do_wrapper
+        self._block_handlers = {
+            Plain: self.do_plain,
+            Para: self.do_para,
+            LineBlock: self.do_line_block,
+            CodeBlock: self.do_code_block,
+            RawBlock: self.do_raw_block,
+            BlockQuote: self.do_block_quote,
+            OrderedList: self.do_ordered_list,
+            BulletList: self.do_bullet_list,
+            DefinitionList: self.do_unsupported_block,
+            Header: self.do_header,
+            HorizontalRule: self.do_horizontal_rule,
+            Table: self.do_table,
+            Div: self.do_unsupported_block,
+            Null: self.do_unsupported_block,
+        }
 
     def do_pandoc(self, doc):
         match doc:
@@ -67,170 +118,187 @@ class Parser:
                 raise AssertionError(f"Not Pandoc: {doc}")
 
     def do_inlines(self, inlines: List[Inline]):
-        for inline in inlines:
-            self.do_inline(inline)
+        # Runs of Str and Space are escaped and written at once; escaping is per character,
+        # so this gives the same text as escaping each Str.
+        run = []
+        for el in inlines:
+            node_type = type(el)
+            if node_type is Str:
+                run.append(el[0])
+            elif node_type is Space or node_type is SoftBreak:
+                run.append(" ")
+            else:
+                if run:
+                    self._write(escape_text("".join(run)))
+                    run = []
+                self.do_inline(el)
+        if run:
+            self._write(escape_text("".join(run)))
 
     def do_inline(self, el: Inline):
-
-        match el:
-            case Str(text):
-                self._buffer.write(escape_text(text))
-            case Emph(inlines):
-                self._buffer.write("<em>")
-                self.do_inlines(inlines)
-                self._buffer.write("</em>")
-            case Underline(inlines):
-                self._buffer.write("<u>")
-                self.do_inlines(inlines)
-                self._buffer.write("</u>")
-            case Strong(inlines):
-                self._buffer.write("<strong>")
+        handler = self._inline_handlers.get(type(el))
+        if handler is None:
+            raise AssertionError(f"Not Inline: {el}")
+        handler(el)
+
+    def do_str(self, el: Str):
+        self._write(escape_text(el[0]))
+
+    def do_space(self, el: Inline):
+        self._write(" ")
+
+    def do_line_break(self, el: LineBreak):
+        self._write("<br />")
+
+    def do_wrapper(self, el: Inline):
+        open_tag, close_tag = self._wrappers[type(el)]
+        self._write(open_tag)
+        self.do_inlines(el[0])
+        self._write(close_tag)
+
+    def do_small_caps(self, el: SmallCaps):
+        raise AssertionError(f"SmallCaps: {el}")
+
+    def do_quoted(self, el: Quoted):
+        quote_type, inlines = el
+        match quote_type:
+            case DoubleQuote():
+                self._write("&ldquo;")
                 self.do_inlines(inlines)
-                self._buffer.write("</strong>")
-            case Strikeout(inlines):
-                self._buffer.write('<span style="text-decoration: line-through;">')
+                self._write("&rdquo;")
+            case SingleQuote():
+                self._write("&lsquo;")
                 self.do_inlines(inlines)
-                self._buffer.write("</span>")
-            case Superscript(inlines):
-                self._buffer.write("<sup>")
-                self.do_inlines(inlines)
-                self._buffer.write("</sup>")
-            case Subscript(inlines):
-                self._buffer.write("<sub>")
-                self.do_inlines(inlines)
-                self._buffer.write("</sub>")
-            case SmallCaps(inlines):
-                raise AssertionError(f"SmallCaps: {el}")
-            case Quoted(quote_type, inlines):
-                match quote_type:
-                    case DoubleQuote():
-                        self._buffer.write("&ldquo;")
-                        self.do_inlines(inlines)
-                        self._buffer.write("&rdquo;")
-                    case SingleQuote():
-                        self._buffer.write("&lsquo;")
-                        self.do_inlines(inlines)
-                        self._buffer.write("&rsquo;")
-                    case _:
-                        raise Exception(f"Quoted: {el}")
-            case Cite(citations, inlines):
-                self.do_inlines(inlines)
-            case Code(attr, text):
-                self._buffer.write("<code>")
-                self._buffer.write(escape_text(text))
-                self._buffer.write("</code>")
-            case Space():
-                self._buffer.write(" ")
-            case SoftBreak():
-                self._buffer.write(" ")
-            case LineBreak():
-                self._buffer.write("<br />")
-            case Math(math_type, text):
-                raise Exception(f"Math: {el}")
-            case RawInline(format, text):
-                if format != Format("html"):
-                    raise AssertionError(f"RawInline {el}")
-                self._buffer.write(escape_text(text))
-            case Link(attr, inlines, target):
-                # TODO: alt-text
-                url, title = unpack_target(target)
-                if title != "":
-                    raise AssertionError(el)
-                self._buffer.write(f'<a href="{url}">')
-                self.do_inlines(inlines)
-                self._buffer.write("</a>")
-            case Image(attr, inlines, target):
-                # TODO: alt-text
-                self._buffer.write("<ac:image>")
-                url, _ = unpack_target(target)
-                self._buffer.write(f'<ri:url ri:value="{url}"/>')
-                self._buffer.write("</ac:image>")
-            case Note(blocks):
-                raise AssertionError(f"Note: {el}. This suggests the text {el} cannot be recognized by the tool. Please put it in a codeblock in the original Paper doc.")
-            case Span(attr, inlines):
-                raise AssertionError(f"Span: {el}. This suggests the text {el} cannot be recognized by the tool. Please put it in a codeblock in the original Paper doc.")
+                self._write("&rsquo;")
             case _:
-                raise AssertionError(f"Not Inline: {el}")
-
-    def do_para(self, el):
-        match el:
-            # Paper use **text** for level 3 header.
-            case Para([Strong(inlines)]):
-                self._buffer.write("<h3>")
-                self.do_inlines(inlines)
-                self._buffer.write("</h3>\n")
-            case Para(inlines):
-                self._buffer.write("<p>")
-                self.do_inlines(inlines)
-                self._buffer.write("</p>")
-            case _:
-                raise AssertionError(f"unexpected Para: {el}")
+                raise Exception(f"Quoted: {el}")
+
+    def do_cite(self, el: Cite):
+        self.do_inlines(el[1])
+
+    def do_code(self, el: Code):
+        self._write("<code>")
+        self._write(escape_text(el[1]))
+        self._write("</code>")
+
+    def do_math(self, el: Math):
+        raise Exception(f"Math: {el}")
+
+    def do_raw_inline(self, el: RawInline):
+        format, text = el
+        if format != Format("html"):
+            raise AssertionError(f"RawInline {el}")
+        self._write(escape_text(text))
+
+    def do_link(self, el: Link):
+        # TODO: alt-text
+        attr, inlines, target = el
+        url, title = unpack_target(target)
+        if title != "":
+            raise AssertionError(el)
+        self._write(f'<a href="{url}">')
+        self.do_inlines(inlines)
+        self._write("</a>")
+
+    def do_image(self, el: Image):
+        # TODO: alt-text
+        self._write("<ac:image>")
+        url, _ = unpack_target(el[2])
+        self._write(f'<ri:url ri:value="{url}"/>')
+        self._write("</ac:image>")
+
+    def do_note(self, el: Note):
+        raise AssertionError(f"Note: {el}. This suggests the text {el} cannot be recognized by the tool. Please put it in a codeblock in the original Paper doc.")
+
+    def do_span(self, el: Span):
+        raise AssertionError(f"Span: {el}. This suggests the text {el} cannot be recognized by the tool. Please put it in a codeblock in the original Paper doc.")
 
     def do_block(self, el: Block):
-        match el:
-            case Plain(inlines):
-                self.do_inlines(inlines)
-            case Para(_):
-                self.do_para(el)
-            case LineBlock(inlines_list):
-                self._buffer.write("<p>")
-                for inlines in inlines_list:
-                    self.do_inlines(inlines)
-                self._buffer.write("</p>\n")
-            case CodeBlock(attr, text):
-                self._buffer.write(code_block_template.format(text=text))
-            case RawBlock(format, text):
-                print(f"RawBlock found: {el}")
-                if format == Format("html"):
-                    self._buffer.write("<code>")
-                    self._buffer.write(escape_text(text))
-                    self._buffer.write("</code>")
-                else:
-                    raise AssertionError(f"RawBlock found: {el}")
-            case BlockQuote(blocks):
-                self._buffer.write("<blockquote>\n")
-                for block in blocks:
-                    self.do_block(block)
-                self._buffer.write("</blockquote>\n")
-            case OrderedList(_, blocks_list):
-                self._buffer.write("<ol>\n")
-                for blocks in blocks_list:
-                    self._buffer.write("<li>")
-                    for block in blocks:
-                        self.do_block(block)
-                    self._buffer.write("</li>\n")
-                self._buffer.write("</ol>\n")
-            case BulletList(list_blocks):
-                if is_task_list(el):
-                    self.do_task_list(el)
-                else:
-                    self._buffer.write("<ul>\n")
-                    for blocks in list_blocks:
-                        self._buffer.write("<li>")
-                        for block in blocks:
-                            self.do_block(block)
-                        self._buffer.write("</li>\n")
-                    self._buffer.write("</ul>\n")
-            case DefinitionList(_):
-                raise AssertionError(f"DefinitionList: {el}")
-            case Header(level, attr, inlines):
-                self._buffer.write(f"<h{level}>")
-                self.do_inlines(inlines)
-                self._buffer.write(f"</h{level}>\n")
-            case HorizontalRule():
-                self._buffer.write("<hr />\n")
-            case Table(attr, caption, col_specs, table_head, table_bodies, table_foot):
-                self._buffer.write("<table>\n")
-                self.do_table_head(table_head)
-                for table_body in table_bodies:
-                    self.do_table_body(table_body)
-                self._buffer.write("</table>\n")
-            case Div(attr, blocks):
-                raise AssertionError(f"Div: {el}")
-            case Null():
-                raise AssertionError(f"Null: {el}")
-            case _:
-                raise AssertionError(f"unexpected element {el}")
+        handler = self._block_handlers.get(type(el))
+        if handler is None:
+            raise AssertionError(f"unexpected element {el}")
+        handler(el)
+
+    def do_plain(self, el: Plain):
+        self.do_inlines(el[0])
+
+    def do_para(self, el: Para):
+        inlines = el[0]
+        # Paper use **text** for level 3 header.
+        if len(inlines) == 1 and type(inlines[0]) is Strong:
+            self._write("<h3>")
+            self.do_inlines(inlines[0][0])
+            self._write("</h3>\n")
+        else:
+            self._write("<p>")
+            self.do_inlines(inlines)
+            self._write("</p>")
+
+    def do_line_block(self, el: LineBlock):
+        self._write("<p>")
+        for inlines in el[0]:
+            self.do_inlines(inlines)
+        self._write("</p>\n")
+
+    def do_code_block(self, el: CodeBlock):
+        self._write(code_block_template.format(text=el[1]))
+
+    def do_raw_block(self, el: RawBlock):
+        print(f"RawBlock found: {el}")
+        format, text = el
+        if format == Format("html"):
+            self._write("<code>")
+            self._write(escape_text(text))
+            self._write("</code>")
+        else:
+            raise AssertionError(f"RawBlock found: {el}")
+
+    def do_block_quote(self, el: BlockQuote):
+        self._write("<blockquote>\n")
+        for block in el[0]:
+            self.do_block(block)
+        self._write("</blockquote>\n")
+
+    def do_ordered_list(self, el: OrderedList):
+        self._write("<ol>\n")
+        for blocks in el[1]:
+            self._write("<li>")
+            for block in blocks:
+                self.do_block(block)
+            self._write("</li>\n")
+        self._write("</ol>\n")
+
+    def do_bullet_list(self, el: BulletList):
+        if self.is_task_list(el):
+            self.do_task_list(el)
+            return
+        self._write("<ul>\n")
+        for blocks in el[0]:
+            self._write("<li>")
+            for block in blocks:
+                self.do_block(block)
+            self._write("</li>\n")
+        self._write("</ul>\n")
+
+    def do_header(self, el: Header):
+        level, attr, inlines = el
+        self._write(f"<h{level}>")
+        self.do_inlines(inlines)
+        self._write(f"</h{level}>\n")
+
+    def do_horizontal_rule(self, el: HorizontalRule):
+        self._write("<hr />\n")
+
+    def do_table(self, el: Table):
+        attr, caption, col_specs, table_head, table_bodies, table_foot = el
+        self._write("<table>\n")
+        self.do_table_head(table_head)
+        for table_body in table_bodies:
+            self.do_table_body(table_body)
+        self._write("</table>\n")
+
+    def do_unsupported_block(self, el: Block):
+        raise AssertionError(f"{type(el).__name__}: {el}")
 
     """
     task_list = [task_item]
@@ -238,6 +306,26 @@ class Parser:
     task_action = "- [ ] ..." | "- [x] ..."
     """
 
+    def is_task_list(self, block) -> bool:
+        """
+        Same as the module level is_task_list, but every list is classified once. Nested
+        lists are classified before the list holding them, and their results are reused
+        when they are rendered.
+        """
+        if type(block) is not BulletList:
+            return False
+        cached = self._task_lists.get(id(block))
+        if cached is not None:
+            return cached[1]
+        is_task = True
+        for blocks in block[0]:
+            for child in blocks:
+                # no short-circuit, so that every nested list is classified in this pass.
+                if not (is_task_action(child) | self.is_task_list(child)):
+                    is_task = False
+        self._task_lists[id(block)] = (block, is_task)
+        return is_task
+
     def do_task_action(self, block):
 
         """
@@ -247,27 +335,23 @@ class Parser:
 
         match block:
             case Plain([Str('\u2610'), Space(), *rest]):
-                self._buffer.write("<ac:task>\n")
-                self._buffer.write("<ac:task-status>incomplete</ac:task-status>\n")
-                self._buffer.write("<ac:task-body>")
-                self.do_inlines(rest)
-                self._buffer.write("</ac:task-body>\n")
-                self._buffer.write("</ac:task>\n")
+                status = "incomplete"
             case Plain([Str('\u2612'), Space(), *rest]):
-                self._buffer.write("<ac:task>\n")
-                self._buffer.write("<ac:task-status>complete</ac:task-status>\n")
-                self._buffer.write("<ac:task-body>")
-                self.do_inlines(rest)
-                self._buffer.write("</ac:task-body>\n")
-                self._buffer.write("</ac:task>\n")
+                status = "complete"
             case _:
                 raise AssertionError(f"{block} is not a task item")
+        self._write("<ac:task>\n")
+        self._write(f"<ac:task-status>{status}</ac:task-status>\n")
+        self._write("<ac:task-body>")
+        self.do_inlines(rest)
+        self._write("</ac:task-body>\n")
+        self._write("</ac:task>\n")
 
     def do_task_item(self, blocks):
         for block in blocks:
             if is_task_action(block):
                 self.do_task_action(block)
-            elif is_task_list(block):
+            elif self.is_task_list(block):
                 self.do_task_list(block)
             else:
                 raise AssertionError("Not task item: {blocks}")
@@ -276,10 +360,10 @@ class Parser:
 
         match block:
             case BulletList(blocks_list):
-                self._buffer.write("<ac:task-list>")
+                self._write("<ac:task-list>")
                 for blocks in blocks_list:
                     self.do_task_item(blocks)
-                self._buffer.write("</ac:task-list>\n")
+                self._write("</ac:task-list>\n")
             case _:
                 raise AssertionError(f"{block} is not a task list")
 
@@ -306,12 +390,13 @@ class Parser:
     def do_row(self, row: Row, is_header: bool):
         match row:
             case Row(attr, cells):
-                self._buffer.write("<tr>")
+                open_tag, close_tag = ("<th>", "</th>") if is_header else ("<td>", "</td>")
+                self._write("<tr>")
                 for cell in cells:
-                    self._buffer.write("<th>" if is_header else "<td>")
+                    self._write(open_tag)
                     self.do_cell(cell)
-                    self._buffer.write("</th>" if is_header else "</td>")
-                self._buffer.write("</tr>")
+                    self._write(close_tag)
+                self._write("</tr>")
             case _:
                 return AssertionError(f"not a Row: {row}")
 
@@ -332,7 +417,7 @@ class Parser:
                     self.do_block(bullet_list)
                 else:
                     for group in groups:
-                        self.do_block(Para(group))
+                        self.do_para(Para(group))
             case _:
                 self.do_block(el)
 
@@ -397,26 +482,47 @@ def convert_bullet_list(groups, level):
     return BulletList(list_blocks)
 
 
-def convert_page(path: str) -> str:
-    with open(path) as f:
-        content = f.read()
+PANDOC_FORMAT = "markdown-raw_tex-tex_math_dollars"
+
+# replace [ ] with - [ ]
+INCOMPLETE_TASK_REGEX = re.compile(r"^(\s*)\[ \]( .+)$", flags=re.MULTILINE)
+# replace [x] with - [x]
+COMPLETE_TASK_REGEX = re.compile(r"^(\s*)\[x\]( .+)$", flags=re.MULTILINE)
+# append new line after ^----------$
+RULE_REGEX = re.compile(r"^----------$", flags=re.MULTILINE)
+
+
+def preprocess_page(content: str) -> str:
+    """Rewrites Paper specific markdown into something pandoc understands."""
+    content = INCOMPLETE_TASK_REGEX.sub(r"\1- [ ]\2", content)
+    content = COMPLETE_TASK_REGEX.sub(r"\1- [x]\2", content)
+    content = RULE_REGEX.sub("----------\n", content)
+    return content
+
 
-    # replace [ ] with - [ ]
-    regex1 = re.compile(r"^(\s*)\[ \]( .+)$", flags=re.MULTILINE)
-    content = regex1.sub(r"\1- [ ]\2", content)
-    # replace [x] with - [x]
-    regex2 = re.compile(r"^(\s*)\[x\]( .+)$", flags=re.MULTILINE)
-    content = regex2.sub(r"\1- [x]\2", content)
-    # append new line after ^----------$
-    regex3 = re.compile(r"^----------$", flags=re.MULTILINE)
-    content = regex3.sub("----------\n", content)
-
-    doc = pandoc.read(source=content, format="markdown-raw_tex-tex_math_dollars")
+def render_doc(doc) -> str:
     parser = Parser()
     parser.do_pandoc(doc)
     return parser._buffer.getvalue()
 
 
+def convert_page(path: str) -> str:
+    with METRICS.phase("read_file", path), open(path) as f:
+        content = f.read()
+
+    with METRICS.phase("preprocess", path):
+        content = preprocess_page(content)
+    # Most Paper docs only use the subset of markdown that fast_parser knows. The rest
+    # go through pandoc.
+    with METRICS.phase("fast_parse", path):
+        doc = parse_paper(content)
+    if doc is None:
+        with METRICS.phase("pandoc.read", path):
+            doc = pandoc.read(source=content, format=PANDOC_FORMAT)
+    with METRICS.phase("render", path):
+        return render_doc(doc)
+
+
 if __name__ == "__main__":
     print(convert_page(
         "/Users/zhangfan/src/python/paper2conf/out/Infrastructure/Persistent " "Systems/Teams/Metadata Services/Edgestore/Onboarding/Diffing In The " "Edgestore Clients.paper"))